@@ -40,9 +40,11 @@ if __name__ == '__main__':
 
     LOG.info("Starting XRF-Explorer")
     # import app dependencies only after showing initial log message
+    from threading import Thread
     from waitress import serve
     from xrf_explorer import app
     from xrf_explorer.server.file_system.helper import get_config, set_config
+    from xrf_explorer.server.spectra import prewarm_element_line_tables
 
     LOG.info("Finished loading XRF-Explorer")
 
@@ -52,6 +54,9 @@ if __name__ == '__main__':
             "Could not find config specified at %s, exiting", args.config)
         exit(-1)
 
+    # load the emission lines of the elements in the background, such that startup is not blocked
+    Thread(target=prewarm_element_line_tables, name="prewarm-element-lines", daemon=True).start()
+
     # serve XRF-Explorer
     config: dict = get_config()
     serve(app, host=config["bind-address"], port=config["port"], max_request_body_size=1073741824000000,
@@ -0,0 +1,78 @@
+# Benchmark comparing the mipmap generation of spectral cubes with the original per-pixel loop.
+# Run from the root directory with: python -m tests.benchmarks.benchmark_mipmap
+import argparse
+
+from math import ceil
+from os.path import join
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import numpy as np
+
+from xrf_explorer.server.file_system.cubes.spectral import write_mipmaps
+
+
+def mipmap_per_pixel(data: np.ndarray, path: str) -> np.memmap:
+    """Generates a single mipmap level with the original per-pixel loop.
+
+    :param data: The cube to mipmap in format {y, x, channel}
+    :param path: The path to write the mipmap to
+    :return: The mipmapped cube
+    """
+
+    mipmapped: np.memmap = np.memmap(
+        path,
+        shape=(ceil(data.shape[0] / 2.0), ceil(data.shape[1] / 2.0), data.shape[2]),
+        dtype=data.dtype,
+        mode="w+"
+    )
+
+    for y in range(mipmapped.shape[0]):
+        for x in range(mipmapped.shape[1]):
+            mipmapped[y, x, :] = np.mean(data[2 * y:2 * y + 2, 2 * x:2 * x + 2, :], axis=(0, 1))
+
+    mipmapped.flush()
+    return mipmapped
+
+
+if __name__ == '__main__':
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description="Benchmark spectral cube mipmapping")
+    parser.add_argument("--height", type=int, default=151)
+    parser.add_argument("--width", type=int, default=201)
+    parser.add_argument("--channels", type=int, default=512)
+    parser.add_argument("--levels", type=int, default=3)
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as folder:
+        # write a random cube to disk, such that both methods read from a memory map
+        cube: np.memmap = np.memmap(join(folder, "cube.raw"), shape=(args.height, args.width, args.channels),
+                                    dtype=np.uint16, mode="w+")
+        cube[:] = np.random.default_rng(0).integers(0, 2 ** 12, size=cube.shape, dtype=np.uint16)
+        cube.flush()
+
+        # original method, every level is computed from the previous level
+        start: float = perf_counter()
+        previous: np.ndarray = cube
+        per_pixel: list[np.memmap] = []
+        for level in range(1, args.levels + 1):
+            previous = mipmap_per_pixel(previous, join(folder, f"pixels_{level}.raw"))
+            per_pixel.append(previous)
+        time_per_pixel: float = perf_counter() - start
+
+        # row band method, all levels at once
+        paths: list[str] = [join(folder, f"bands_{level}.raw") for level in range(1, args.levels + 1)]
+        start = perf_counter()
+        write_mipmaps(cube, paths)
+        time_bands: float = perf_counter() - start
+
+        # compare the results
+        equal: bool = True
+        for mipmap, path in zip(per_pixel, paths):
+            equal = equal and np.array_equal(mipmap, np.fromfile(path, dtype=np.uint16).reshape(mipmap.shape))
+
+        print(f"Cube {cube.shape}, {args.levels} levels")
+        print(f"Per-pixel loop: {time_per_pixel:.3f} s")
+        print(f"Row bands:      {time_bands:.3f} s ({time_per_pixel / time_bands:.1f}x faster)")
+        print(f"Results equal:  {equal}")
+
+        del cube, previous, per_pixel
@@ -1,19 +1,24 @@
 import logging
 
-from os.path import join, normpath
+from os import remove
+from os.path import isfile, join, normpath
+from shutil import rmtree
 
 import numpy as np
 import cv2
+import pytest
 
 from xrf_explorer.server.file_system import set_config
+from xrf_explorer.server.file_system.cubes.elemental import ELEMENTAL_STATISTICS_FILE_NAME
 from xrf_explorer.server.color_segmentation.color_seg import (
-    get_clusters_using_k_means, merge_similar_colors,
+    get_clusters_using_k_means, get_lab_image_registered_to_data_cube, merge_similar_colors,
     get_elemental_clusters_using_k_means, combine_bitmasks,
     image_to_lab, image_to_rgb, lab_to_rgb, rgb_to_lab,
     convert_to_hex, save_bitmask_as_png
 )
 
 from xrf_explorer.server.color_segmentation.helper import get_path_to_cs_folder
+from xrf_explorer.server.image_register import get_image_registered_to_data_cube
 
 RESOURCES_PATH: str = join('tests', 'resources')
 
@@ -41,10 +46,23 @@ class TestColorSegmentation:
     DATA_CUBE_PATH: str = join(PATH_DATA_SOURCE, 'test_cube.dms')
     REG_TEST_IMAGE_PATH: str = join(PATH_DATA_SOURCE, 'registered_test_image.png')
 
+    PATH_GENERATED: str = join(PATH_DATA_SOURCE, 'generated')
+
     elem_threshold: float = 0.1
     num_attempts: int = 10
     k: int = 2
 
+    @pytest.fixture(autouse=True)
+    def setup_environment(self):
+        yield
+        # remove the files written by the tests
+        rmtree(join(self.PATH_GENERATED, 'registered_images'), ignore_errors=True)
+        rmtree(join(self.PATH_GENERATED, 'color_segmentation'), ignore_errors=True)
+        if isfile(join(self.PATH_GENERATED, ELEMENTAL_STATISTICS_FILE_NAME)):
+            remove(join(self.PATH_GENERATED, ELEMENTAL_STATISTICS_FILE_NAME))
+        if isfile(self.BITMASK_PATH):
+            remove(self.BITMASK_PATH)
+
     def test_get_clusters_using_k_means_colors(self, caplog):
         caplog.set_level(logging.INFO)
         set_config(self.CUSTOM_CONFIG_PATH)
@@ -80,6 +98,28 @@ class TestColorSegmentation:
         # Verify log message
         assert "Image could not be registered to data cube" in caplog.text
 
+    def test_get_lab_image_registered_to_data_cube(self):
+        set_config(self.CUSTOM_CONFIG_PATH)
+        path_to_generated: str = join(self.PATH_DATA_SOURCE, 'generated')
+        rmtree(path_to_generated, ignore_errors=True)
+
+        # Set-up
+        registered_image: np.ndarray = get_image_registered_to_data_cube(self.DATA_SOURCE, self.IMAGE_NAME)
+        expected: np.ndarray = image_to_lab(cv2.cvtColor(registered_image, cv2.COLOR_BGR2RGB))
+
+        # Execute
+        result: np.ndarray = get_lab_image_registered_to_data_cube(self.DATA_SOURCE, self.IMAGE_NAME)
+        result_stored: np.ndarray = get_lab_image_registered_to_data_cube(self.DATA_SOURCE, self.IMAGE_NAME)
+
+        # Verify
+        assert result.dtype == np.float32
+        assert np.allclose(result, expected, atol=1e-4)
+        assert isinstance(result_stored, np.memmap)
+        assert np.array_equal(result_stored, result)
+        assert isfile(result_stored.filename)
+
+        rmtree(path_to_generated, ignore_errors=True)
+
     def test_merge_similar_colors(self, caplog):
         caplog.set_level(logging.INFO)
 
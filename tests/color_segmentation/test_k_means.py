@@ -0,0 +1,109 @@
+import logging
+
+from os.path import join
+from shutil import rmtree
+
+import numpy as np
+import pytest
+
+from xrf_explorer.server.file_system import set_config
+from xrf_explorer.server.color_segmentation.color_seg import get_clusters_using_k_means
+from xrf_explorer.server.color_segmentation.k_means import (
+    KMeansResult,
+    assign_to_centroids,
+    fit_mini_batch_k_means,
+    get_k_means_engine,
+    stratified_sample
+)
+
+RESOURCES_PATH: str = join('tests', 'resources')
+
+
+class TestKMeans:
+    CUSTOM_CONFIG_PATH: str = join(RESOURCES_PATH, 'configs', 'color-segmentation.yml')
+    MINI_BATCH_CONFIG_PATH: str = join(RESOURCES_PATH, 'configs', 'color-segmentation-mini-batch.yml')
+
+    DATA_SOURCE = "data_source"
+    IMAGE_NAME = "RGB"
+
+    PATH_GENERATED: str = join(RESOURCES_PATH, 'color_segmentation', DATA_SOURCE, 'generated')
+
+    @pytest.fixture(autouse=True)
+    def setup_environment(self):
+        yield
+        # remove the files written by the tests
+        rmtree(join(self.PATH_GENERATED, 'registered_images'), ignore_errors=True)
+        rmtree(join(self.PATH_GENERATED, 'color_segmentation'), ignore_errors=True)
+
+    def test_get_k_means_engine(self):
+        # Execute
+        set_config(self.CUSTOM_CONFIG_PATH)
+        default_engine: str = get_k_means_engine()
+        set_config(self.MINI_BATCH_CONFIG_PATH)
+        engine: str = get_k_means_engine()
+
+        # Verify
+        assert default_engine == "opencv"
+        assert engine == "mini-batch"
+
+    def test_stratified_sample(self):
+        # Set-up
+        pixels: np.ndarray = np.arange(1000, dtype=np.float32).reshape(-1, 1)
+
+        # Execute
+        sample: np.ndarray = stratified_sample(pixels, 10)
+
+        # Verify
+        # every stratum of 100 pixels contributes a single pixel
+        assert sample.shape == (10, 1)
+        assert np.array_equal(sample[:, 0] // 100, np.arange(10))
+        assert stratified_sample(pixels, 2000) is pixels
+
+    def test_assign_to_centroids(self):
+        # Set-up
+        rng: np.random.Generator = np.random.default_rng(0)
+        pixels: np.ndarray = rng.random((1000, 3), dtype=np.float32) * 100
+        centroids: np.ndarray = rng.random((7, 3)) * 100
+        distances: np.ndarray = np.sum((pixels[:, None, :] - centroids[None, :, :]) ** 2, axis=2)
+
+        # Execute
+        labels, inertia = assign_to_centroids(pixels, centroids, chunk_size=64)
+
+        # Verify
+        assert np.array_equal(labels, np.argmin(distances, axis=1))
+        assert np.isclose(inertia, np.sum(np.min(distances, axis=1)))
+
+    def test_fit_mini_batch_k_means(self):
+        # Set-up
+        set_config(self.MINI_BATCH_CONFIG_PATH)
+        rng: np.random.Generator = np.random.default_rng(0)
+        centers: np.ndarray = np.array([[20, 0, 0], [50, 40, -40], [80, -30, 30]], dtype=np.float32)
+        pixels: np.ndarray = np.repeat(centers, 400, axis=0) + rng.normal(0, 1, (1200, 3)).astype(np.float32)
+
+        # Execute
+        result: KMeansResult = fit_mini_batch_k_means(pixels, 3)
+
+        # Verify
+        assert result.centroids.shape == (3, 3)
+        assert result.labels.shape == (1200,)
+        for center in centers:
+            assert np.min(np.linalg.norm(result.centroids - center, axis=1)) < 1
+        # every group of pixels ends up in a single cluster
+        assert all(np.unique(result.labels[i * 400:(i + 1) * 400]).size == 1 for i in range(3))
+        assert result.inertia > 0
+        assert result.fit_time >= 0
+
+    def test_get_clusters_using_k_means_mini_batch(self, caplog):
+        caplog.set_level(logging.INFO)
+        set_config(self.MINI_BATCH_CONFIG_PATH)
+
+        # Execute
+        result, bitmasks = get_clusters_using_k_means(self.DATA_SOURCE, self.IMAGE_NAME, 2)
+
+        # Verify
+        # The image has 2 colors
+        assert len(result) == 2
+        assert len(bitmasks) == 2
+        assert np.sum(np.all(result == [0, 0, 0], axis=1)) == 1
+        assert np.sum(np.all(result == [189, 189, 189], axis=1)) == 1
+        assert "with the mini-batch engine" in caplog.text
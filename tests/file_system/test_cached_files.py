@@ -0,0 +1,84 @@
+from os.path import isfile
+from pathlib import Path
+
+import numpy as np
+
+from xrf_explorer.server.file_system import (
+    load_cached_array,
+    store_cached_array,
+    load_cached_json,
+    store_cached_json
+)
+
+
+class TestCachedFiles:
+    KEY: dict = {"mtime": 1, "size": 2}
+    OTHER_KEY: dict = {"mtime": 3, "size": 2}
+
+    def test_store_cached_array(self, tmp_path: Path):
+        # setup
+        path: str = str(tmp_path / "array.npy")
+        data: np.ndarray = np.arange(12, dtype=np.float32).reshape(3, 4)
+
+        # execute
+        stored: bool = store_cached_array(path, self.KEY, data)
+        result: np.ndarray | None = load_cached_array(path, self.KEY, mmap_mode='r')
+
+        # verify
+        assert stored
+        assert isfile(str(tmp_path / "array.json"))
+        assert result is not None
+        assert np.array_equal(result, data)
+        assert load_cached_array(path, self.OTHER_KEY) is None
+        assert not list(tmp_path.glob("*.tmp"))
+
+    def test_store_cached_array_writer(self, tmp_path: Path):
+        # setup
+        path: str = str(tmp_path / "array.npy")
+        data: np.ndarray = np.ones((2, 2), dtype=np.uint16)
+
+        def write_array(path_to_array: str):
+            array: np.memmap = np.lib.format.open_memmap(path_to_array, mode="w+", dtype=data.dtype, shape=data.shape)
+            array[:] = data
+            array.flush()
+
+        # execute
+        stored: bool = store_cached_array(path, self.KEY, write_array)
+        result: np.ndarray | None = load_cached_array(path, self.KEY)
+
+        # verify
+        assert stored
+        assert np.array_equal(result, data)
+
+    def test_load_cached_array_missing(self, tmp_path: Path):
+        # execute
+        result: np.ndarray | None = load_cached_array(str(tmp_path / "array.npy"), self.KEY)
+
+        # verify
+        assert result is None
+
+    def test_store_cached_json(self, tmp_path: Path):
+        # setup
+        path: str = str(tmp_path / "statistics.json")
+        data: dict = {"mean": [1.0, 2.0]}
+
+        # execute
+        stored: bool = store_cached_json(path, self.KEY, data)
+        result: dict | None = load_cached_json(path, self.KEY)
+
+        # verify
+        assert stored
+        assert result == {"mean": [1.0, 2.0], "key": self.KEY}
+        assert load_cached_json(path, self.OTHER_KEY) is None
+
+    def test_load_cached_json_invalid(self, tmp_path: Path, caplog):
+        # setup
+        path: Path = tmp_path / "statistics.json"
+        path.write_text("{")
+
+        # execute
+        result: dict | None = load_cached_json(str(path), self.KEY)
+
+        # verify
+        assert result is None
+        assert "Could not read stored file" in caplog.text
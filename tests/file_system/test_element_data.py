@@ -6,12 +6,17 @@ from os.path import join, isfile
 
 import pytest
 
-from numpy import ndarray, array_equal, array, float32, full
+from numpy import ndarray, array_equal, array, float32, full, memmap
 
-from xrf_explorer.server.file_system.cubes.convert_dms import to_dms
+from xrf_explorer.server.file_system.cubes.convert_dms import to_dms, get_dms_header, DmsHeader
 from xrf_explorer.server.file_system.cubes.elemental import (
     get_elemental_data_cube, get_elemental_map, get_element_names, get_short_element_names,
-    get_element_averages, convert_elemental_cube_to_dms, get_element_averages_selection
+    get_element_averages, convert_elemental_cube_to_dms, get_element_averages_selection,
+    get_elemental_cache_statistics, clear_elemental_cache, get_elemental_statistics, normalize_ndarray_to_grayscale,
+    cache_elemental_data_cube, ELEMENTAL_STATISTICS_FILE_NAME
+)
+from xrf_explorer.server.file_system.cubes.elemental_maps import (
+    prerender_elemental_maps, get_rendered_elemental_map, ELEMENTAL_MAPS_FOLDER_NAME
 )
 from xrf_explorer.server.file_system.helper import set_config, get_config
 
@@ -39,7 +44,11 @@ class TestElementalData:
     @pytest.fixture(autouse=True)
     def setup_environment(self):
         set_config(self.CUSTOM_CONFIG_PATH)
+        clear_elemental_cache()
         yield
+        # remove the statistics and maps generated by the tests
+        for source in [self.SOURCE_FOLDER_CSV, self.SOURCE_FOLDER_DMS]:
+            rmtree(join(self.PATH_TO_TEST_FOLDER, source, "generated"), ignore_errors=True)
 
     def do_test_get_element_names(self, source, caplog):
         caplog.set_level(INFO)
@@ -120,6 +129,50 @@ class TestElementalData:
         # execute & verify
         self.do_test_get_elemental_cube(source_folder, caplog)
 
+    def test_get_elemental_cube_cached(self):
+        # execute
+        first: ndarray = get_elemental_data_cube(self.SOURCE_FOLDER_DMS)
+        second: ndarray = get_elemental_data_cube(self.SOURCE_FOLDER_DMS)
+        statistics: dict[str, int] = get_elemental_cache_statistics()
+
+        # verify
+        assert second is first
+        assert not first.flags.writeable
+        assert array_equal(first, self.RAW_ELEMENTAL_CUBE)
+        assert statistics["hits"] == 1
+        assert statistics["misses"] == 1
+        assert statistics["entries"] == 1
+        assert statistics["bytes"] == 0
+
+    def test_get_elemental_cube_cache_size(self):
+        # setup, only one of the cubes fits in the cache
+        get_config()["elemental-cache-size"] = self.RAW_ELEMENTAL_CUBE.nbytes
+
+        # execute
+        cache_elemental_data_cube(("first", 0, 0), self.RAW_ELEMENTAL_CUBE.copy())
+        cache_elemental_data_cube(("second", 0, 0), self.RAW_ELEMENTAL_CUBE.copy())
+        statistics: dict[str, int] = get_elemental_cache_statistics()
+
+        # verify
+        assert statistics["entries"] == 1
+        assert statistics["bytes"] == self.RAW_ELEMENTAL_CUBE.nbytes
+
+    def test_get_elemental_cube_cache_size_memory_mapped(self):
+        # setup, the memory mapped cube does not take up any of the cache
+        get_config()["elemental-cache-size"] = self.RAW_ELEMENTAL_CUBE.nbytes
+
+        # execute
+        get_elemental_data_cube(self.SOURCE_FOLDER_DMS)
+        get_elemental_data_cube(self.SOURCE_FOLDER_CSV)
+        get_elemental_data_cube(self.SOURCE_FOLDER_DMS)
+        statistics: dict[str, int] = get_elemental_cache_statistics()
+
+        # verify
+        assert statistics["hits"] == 1
+        assert statistics["misses"] == 2
+        assert statistics["entries"] == 2
+        assert statistics["bytes"] == self.RAW_ELEMENTAL_CUBE.nbytes
+
     def test_get_elemental_map(self, caplog):
         # setup
         dms_path: str = join(self.SOURCE_FOLDER_DMS, self.DATA_CUBE_DMS)
@@ -129,6 +182,23 @@ class TestElementalData:
         self.do_test_get_elemental_map(dms_path, caplog)
         self.do_test_get_elemental_map(csv_path, caplog)
     
+    def test_get_elemental_map_dms_memory_mapped(self, caplog):
+        # setup
+        path: str = str(join(get_config()["uploads-folder"], self.SOURCE_FOLDER_DMS, self.DATA_CUBE_DMS))
+
+        # execute
+        cube: ndarray = get_elemental_data_cube(self.SOURCE_FOLDER_DMS)
+        result: ndarray = get_elemental_map(1, path)
+        invalid_result: ndarray = get_elemental_map(2, path)
+
+        # verify
+        assert isinstance(cube, memmap)
+        assert isinstance(result, memmap)
+        assert not result.flags.writeable
+        assert array_equal(result, self.RAW_ELEMENTAL_CUBE[1])
+        assert len(invalid_result) == 0
+        assert "Element 2 is not in the elemental data cube with 2 elements" in caplog.text
+
     def test_get_elemental_map_invalid_type(self, caplog):
         caplog.set_level(INFO)
 
@@ -224,6 +294,35 @@ class TestElementalData:
         # cleanup
         rmtree(folder_path)
     
+    def test_get_dms_header(self):
+        # setup
+        path: str = str(join(get_config()["uploads-folder"], self.SOURCE_FOLDER_DMS, self.DATA_CUBE_DMS))
+
+        # execute
+        header: DmsHeader = get_dms_header(path)
+        cached_header: DmsHeader = get_dms_header(path)
+
+        # verify
+        assert cached_header is header
+        assert (header.width, header.height, header.channels) == (3, 3, 2)
+        assert header.dtype == float32
+        assert header.elements == tuple(self.ELEMENTS)
+
+    def test_get_dms_header_rewritten(self, tmp_path):
+        # setup
+        to_dms(str(tmp_path), "cube", self.RAW_ELEMENTAL_CUBE, self.ELEMENTS)
+        path: str = join(str(tmp_path), "cube.dms")
+
+        # execute
+        header: DmsHeader = get_dms_header(path)
+        to_dms(str(tmp_path), "cube", self.RAW_ELEMENTAL_CUBE[:1], self.ELEMENTS[:1])
+        new_header: DmsHeader = get_dms_header(path)
+
+        # verify
+        assert header.channels == 2
+        assert new_header.channels == 1
+        assert new_header.elements == (self.ELEMENTS[0],)
+
     def test_to_dms_invalid_folder_path(self, caplog):
         # setup
         folder_path: str = "this is not a valid folder path"
@@ -261,3 +360,85 @@ class TestElementalData:
             assert result[i]['name'] == self.ELEMENTS[i]
             assert result[i]['average'] >= 0
         assert 'Calculated the average composition of the elements within selection.' in caplog.text
+
+    def test_get_element_averages_selection_partial(self):
+        # setup
+        set_config(self.CUSTOM_CONFIG_PATH)
+        mask: ndarray = full((3, 3), False)
+        mask[0, 0] = True
+        mask[2, 2] = True
+
+        # the cube is normalized over its minimum -9 and maximum 9 to [0, 100]
+        expected: list[float] = [(-5 + 9) / 18 * 100, (5 + 9) / 18 * 100]
+
+        # execute
+        result: list[dict[str, str | float]] = get_element_averages_selection(self.SOURCE_FOLDER_DMS, mask)
+
+        # verify
+        assert [composition['average'] for composition in result] == pytest.approx(expected)
+
+    def test_get_element_averages_selection_empty(self):
+        # setup
+        set_config(self.CUSTOM_CONFIG_PATH)
+
+        # execute
+        result: list[dict[str, str | float]] = get_element_averages_selection(
+            self.SOURCE_FOLDER_DMS, full((3, 3), False)
+        )
+
+        # verify
+        assert [composition['average'] for composition in result] == [0, 0]
+
+    def test_get_elemental_statistics(self):
+        # execute
+        result: dict | None = get_elemental_statistics(self.SOURCE_FOLDER_DMS)
+
+        # verify
+        assert result is not None
+        assert result["min"] == [-9, 1]
+        assert result["max"] == [-1, 9]
+        assert result["mean"] == pytest.approx([-5, 5])
+        assert result["nonzero"] == [9, 9]
+        assert [sum(histogram) for histogram in result["histogram"]] == [9, 9]
+        assert isfile(join(self.PATH_TO_TEST_FOLDER, self.SOURCE_FOLDER_DMS, "generated",
+                           ELEMENTAL_STATISTICS_FILE_NAME))
+        assert get_elemental_statistics(self.SOURCE_FOLDER_DMS) is result
+
+    def test_get_elemental_statistics_invalid_data_source(self, caplog):
+        # execute
+        result: dict | None = get_elemental_statistics("this is not a data source")
+
+        # verify
+        assert result is None
+        assert "Could not find elemental data cube of data source this is not a data source" in caplog.text
+
+    def test_normalize_ndarray_to_grayscale_bounds(self):
+        # setup
+        data: ndarray = array([[0, 5], [10, 20]], dtype=float32)
+
+        # execute
+        result: ndarray = normalize_ndarray_to_grayscale(data, 100, bounds=(0, 10))
+
+        # verify
+        assert array_equal(result, array([[0, 50], [100, 200]]))
+
+    def test_prerender_elemental_maps(self):
+        # setup
+        path_to_maps: str = join(self.PATH_TO_TEST_FOLDER, self.SOURCE_FOLDER_DMS, "generated",
+                                 ELEMENTAL_MAPS_FOLDER_NAME)
+        makedirs(path_to_maps, exist_ok=True)
+        path_to_stale_map: str = join(path_to_maps, "stale.png")
+        with open(path_to_stale_map, 'wb') as file:
+            file.write(b"")
+
+        # execute
+        result: int = prerender_elemental_maps(self.SOURCE_FOLDER_DMS)
+
+        # verify
+        path_to_map: str | None = get_rendered_elemental_map(self.SOURCE_FOLDER_DMS, 1)
+        assert result == 4
+        assert path_to_map is not None and isfile(path_to_map)
+        assert not isfile(path_to_stale_map)
+
+        # cleanup
+        rmtree(path_to_maps)
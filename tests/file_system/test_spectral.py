@@ -1,4 +1,5 @@
 import json
+from os.path import isfile
 from pathlib import Path
 
 import numpy as np
@@ -6,13 +7,16 @@ import pytest
 
 from xrf_explorer.server.file_system.cubes.spectral import (
     parse_rpl, 
+    get_rpl_info,
+    RplInfo,
     get_raw_data, 
     get_spectra_params, 
     bin_data, 
+    bin_channels,
     update_bin_params
 )
 from xrf_explorer.server.file_system.helper import set_config
-from xrf_explorer.server.file_system.workspace.file_access import get_raw_rpl_paths, get_workspace_dict
+from xrf_explorer.server.file_system.workspace.file_access import get_raw_rpl_paths, get_workspace_dict, set_binned
 from xrf_explorer.server.file_system.workspace.workspace_handler import get_path_to_workspace
 
 
@@ -82,6 +86,59 @@ class TestSpectral:
         assert info == {}
         assert expected_output in caplog.text
         
+    def test_get_rpl_info(self):
+        # setup
+        _, path = get_raw_rpl_paths(self.DATA_SOURCE_FOLDER_NAME)
+
+        # execute
+        info: RplInfo | None = get_rpl_info(path)
+        cached_info: RplInfo | None = get_rpl_info(path)
+
+        # verify
+        assert cached_info is info
+        assert (info.width, info.height, info.depth, info.offset) == (3, 3, 6, 0)
+        assert info.record_by == "vector"
+        assert info.dtype == np.dtype("<u2")
+        assert info.depth_scale_origin == -0.956
+
+    def test_get_rpl_info_empty_file(self):
+        _, path = get_raw_rpl_paths(self.EMPTY_SOURCE_NAME)
+        assert get_rpl_info(path) is None
+
+    def test_bin_data_big_endian_with_header(self):
+        # setup
+        _, path_to_rpl = get_raw_rpl_paths(self.DATA_SOURCE_FOLDER_NAME)
+        with open(path_to_rpl, 'r') as f:
+            rpl: str = f.read()
+        with open(path_to_rpl, 'w') as f:
+            f.write(rpl.replace("offset     \t 0", "offset     \t 4").replace("little-endian", "big-endian"))
+
+        data: np.ndarray = np.array([[[3, 1, 3, 4, 0, 4], [1, 2, 4, 4, 2, 4], [1, 2, 4, 2, 0, 4]],
+                                     [[2, 2, 4, 4, 0, 4], [2, 1, 3, 3, 1, 4], [2, 1, 3, 4, 0, 4]],
+                                     [[2, 1, 3, 4, 2, 4], [2, 0, 2, 2, 0, 4], [2, 2, 4, 4, 2, 4]]], dtype=">u2")
+        with open(self.TEST_RAW_PATH, 'wb') as f:
+            f.write(b"head")
+            f.write(data.tobytes())
+
+        # execute
+        bin_data(self.DATA_SOURCE_FOLDER_NAME, 1, 5, 2)
+        binned_data = get_raw_data(self.DATA_SOURCE_FOLDER_NAME, 0)
+        expected_result: np.ndarray = np.array([[[2, 2], [3, 3], [3, 1]],
+                                                [[3, 2], [2, 2], [2, 2]],
+                                                [[2, 3], [1, 1], [3, 3]]])
+        with open(self.TEST_RAW_PATH, 'rb') as f:
+            header: bytes = f.read(4)
+
+        # verify
+        assert binned_data.dtype == np.dtype(">u2")
+        assert np.array_equal(binned_data, expected_result)
+        assert header == b"head"
+
+        # cleanup
+        del binned_data
+        with open(path_to_rpl, 'w') as f:
+            f.write(rpl)
+
     def test_get_spectra_params(self):
         params: dict = get_spectra_params(self.DATA_SOURCE_FOLDER_NAME)
         
@@ -181,6 +238,64 @@ class TestSpectral:
         # verify
         assert expected_result.all() == binned_data.all()
     
+    def test_bin_data_bands(self):
+        # setup
+        data: np.ndarray = np.array([[[3, 1, 3, 4, 0, 4], [1, 2, 4, 4, 2, 4], [1, 2, 4, 2, 0, 4]],
+                                     [[2, 2, 4, 4, 0, 4], [2, 1, 3, 3, 1, 4], [2, 1, 3, 4, 0, 4]],
+                                     [[2, 1, 3, 4, 2, 4], [2, 0, 2, 2, 0, 4], [2, 2, 4, 4, 2, 4]]], dtype=np.uint16)
+
+        self.numpy_to_raw(data, self.TEST_RAW_PATH)
+
+        # execute
+        bin_data(self.DATA_SOURCE_FOLDER_NAME, 1, 5, 2)
+        binned_data = get_raw_data(self.DATA_SOURCE_FOLDER_NAME, 0)
+        expected_result: np.ndarray = np.array([[[2, 2], [3, 3], [3, 1]],
+                                                [[3, 2], [2, 2], [2, 2]],
+                                                [[2, 3], [1, 1], [3, 3]]])
+
+        # verify
+        assert np.array_equal(binned_data, expected_result)
+        assert not isfile(f"{self.TEST_RAW_PATH}.tmp")
+
+    def test_bin_data_failed(self, monkeypatch, caplog):
+        # setup
+        data: np.ndarray = np.array([[[3, 1, 3, 4, 0, 4], [1, 2, 4, 4, 2, 4], [1, 2, 4, 2, 0, 4]],
+                                     [[2, 2, 4, 4, 0, 4], [2, 1, 3, 3, 1, 4], [2, 1, 3, 4, 0, 4]],
+                                     [[2, 1, 3, 4, 2, 4], [2, 0, 2, 2, 0, 4], [2, 2, 4, 4, 2, 4]]], dtype=np.uint16)
+        self.numpy_to_raw(data, self.TEST_RAW_PATH)
+
+        def fail_binning(*_):
+            raise ValueError("binning failed")
+
+        monkeypatch.setattr("xrf_explorer.server.file_system.cubes.spectral.bin_channels", fail_binning)
+        set_binned(self.DATA_SOURCE_FOLDER_NAME, False)
+
+        try:
+            # execute
+            bin_data(self.DATA_SOURCE_FOLDER_NAME, 1, 5, 2)
+            params: dict = get_spectra_params(self.DATA_SOURCE_FOLDER_NAME)
+
+            # verify
+            assert "Failed to write binned data" in caplog.text
+            assert not params["binned"]
+            assert np.array_equal(np.fromfile(self.TEST_RAW_PATH, dtype=np.uint16), data.flatten())
+            assert not isfile(f"{self.TEST_RAW_PATH}.tmp")
+        finally:
+            # cleanup
+            set_binned(self.DATA_SOURCE_FOLDER_NAME, True)
+
+    def test_bin_channels_partial_bin(self):
+        # setup
+        data: np.ndarray = np.array([[[3, 1, 3, 4, 0, 4], [1, 2, 4, 4, 2, 5]]], dtype=np.uint16)
+        expected_result: np.ndarray = np.array([[[2, 2, 4], [3, 3, 5]]], dtype=np.uint16)
+
+        # execute
+        result: np.ndarray = bin_channels(data, 1, 6, 2)
+
+        # verify
+        assert result.dtype == np.uint16
+        assert np.array_equal(result, expected_result)
+
     def test_bin_data_default_params(self):
         # setup
         data: np.ndarray = np.array([[[2, 2], [3, 3], [3, 1]],
@@ -1,4 +1,4 @@
-from json import load
+from json import dump, load
 from logging import INFO
 from os import remove
 from os.path import join, normpath
@@ -6,7 +6,7 @@ from os.path import join, normpath
 from xrf_explorer.server.file_system import set_config
 from xrf_explorer.server.file_system.workspace import (
     get_path_to_workspace, update_workspace, get_base_image_name, 
-    get_base_image_path, get_workspace_dict, get_elemental_cube_path_from_name
+    get_base_image_path, get_workspace_dict, get_elemental_cube_path_from_name, write_workspace
 )
 from xrf_explorer.server.file_system.workspace.file_access import get_spectral_cube_recipe_path
 
@@ -108,6 +108,33 @@ class TestWorkspaceHandler:
         # cleanup
         remove(path_to_workspace)
 
+    def test_get_workspace_dict_cached(self):
+        # setup
+        set_config(self.CUSTOM_CONFIG_PATH)
+        path_to_workspace: str = join(self.CUSTOM_DATA_FOLDER, self.DATASOURCE_NAME_NO_WORKSPACE, 'workspace.json')
+        workspace: dict = {"message": "Hi!"}
+
+        # execute
+        write_workspace(path_to_workspace, workspace)
+        workspace["message"] = "Changed after writing"
+        first: dict | None = get_workspace_dict(self.DATASOURCE_NAME_NO_WORKSPACE)
+        second: dict | None = get_workspace_dict(self.DATASOURCE_NAME_NO_WORKSPACE)
+
+        # modify the file without going through the cache
+        with open(path_to_workspace, 'w') as f:
+            dump({"message": "Hello there!"}, f)
+        modified: dict | None = get_workspace_dict(self.DATASOURCE_NAME_NO_WORKSPACE)
+
+        # remove the file
+        remove(path_to_workspace)
+        removed: dict | None = get_workspace_dict(self.DATASOURCE_NAME_NO_WORKSPACE)
+
+        # verify
+        assert first == {"message": "Hi!"}
+        assert second is first
+        assert modified == {"message": "Hello there!"}
+        assert removed is None
+
     def test_get_get_workspace_dict_no_config(self, caplog):
         # setup
         set_config("imaginary-config-file.yml")
@@ -12,7 +12,7 @@ from xrf_explorer.server.file_system.helper import set_config
 from xrf_explorer.server.file_system.workspace.contextual_images import (
     get_contextual_image_path, get_contextual_image_size,
     get_contextual_image, get_contextual_image_recipe_path,
-    get_path_to_base_image
+    get_path_to_base_image, read_contextual_image_size
 )
 
 
@@ -161,6 +161,18 @@ class TestContextualImages:
         # Verify
         assert result == (200, 150)
 
+    def test_get_contextual_image_size_cached(self):
+        # Setup
+        get_contextual_image_size(self.TEST_IMAGE_PATH)
+        hits: int = read_contextual_image_size.cache_info().hits
+
+        # Execute
+        result: tuple[int, int] | None = get_contextual_image_size(self.TEST_IMAGE_PATH)
+
+        # Verify
+        assert result == (200, 150)
+        assert read_contextual_image_size.cache_info().hits == hits + 1
+
     def test_get_contextual_image_invalid_size(self):
         # Execute
         result: tuple[int, int] | None = get_contextual_image_size(self.INVALID_IMAGE_PATH)
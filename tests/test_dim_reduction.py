@@ -5,8 +5,10 @@ from os.path import isfile, join, normpath, isdir
 from shutil import rmtree
 
 import numpy as np
+import pytest
 
 from xrf_explorer.server.file_system.helper import set_config
+from xrf_explorer.server.file_system.cubes.elemental import ELEMENTAL_STATISTICS_FILE_NAME
 from xrf_explorer.server.dim_reduction import (
     generate_embedding, create_embedding_image, get_image_of_indices_to_embedding
 )
@@ -27,6 +29,15 @@ class TestDimReduction:
         RESOURCES_PATH, 'dim_reduction', TEST_DATA_SOURCE, 'generated', 'from_dim_reduction'
     )
 
+    @pytest.fixture(autouse=True)
+    def setup_environment(self):
+        yield
+        # remove the files written by the tests, the other files in the generated folder are fixtures
+        path_to_generated: str = join(RESOURCES_PATH, 'dim_reduction', self.TEST_DATA_SOURCE, 'generated')
+        rmtree(join(path_to_generated, 'registered_images'), ignore_errors=True)
+        if isfile(join(path_to_generated, ELEMENTAL_STATISTICS_FILE_NAME)):
+            remove(join(path_to_generated, ELEMENTAL_STATISTICS_FILE_NAME))
+
     def test_config_not_found(self, caplog):
         # setup
         element: int = 9
@@ -1,14 +1,21 @@
 import logging
 
-from os import remove
+from os import remove, stat, utime
 from os.path import join, exists
+from shutil import rmtree
 
+import numpy as np
 import pytest
 
 from cv2.typing import MatLike
 
 from xrf_explorer.server.file_system.helper import set_config
 from xrf_explorer.server.image_register import register_image_to_image, get_image_registered_to_data_cube
+from xrf_explorer.server.image_register.register_image import (
+    inverse_register_image,
+    register_image,
+    register_image_to_cube
+)
 
 
 class TestImageRegistration:
@@ -20,6 +27,8 @@ class TestImageRegistration:
     PATH_CONTROL_POINTS: str = "tests/resources/image_registration/data_source/control_points.csv"
     PATH_RESULT: str = "tests/resources/image_registration/result.tif"
 
+    PATH_GENERATED: str = "tests/resources/image_registration/data_source/generated"
+
     DATA_SOURCE: str = "data_source"
     IMAGE_NAME: str = "RGB"
 
@@ -27,6 +36,8 @@ class TestImageRegistration:
     def setup_environment(self):
         if exists(self.PATH_RESULT):
             remove(self.PATH_RESULT)
+        if exists(self.PATH_GENERATED):
+            rmtree(self.PATH_GENERATED)
 
         yield
 
@@ -141,3 +152,63 @@ class TestImageRegistration:
         assert result.shape == (3, 3, 3)
         assert "Removing columns: 1" in caplog.text
         assert "Registering image to elemental cube" in caplog.text
+
+    def test_register_image_to_cube_cached(self, caplog):
+        # setup
+        set_config(self.CONFIG_PATH)
+        caplog.set_level(logging.INFO)
+        registered: MatLike | None = get_image_registered_to_data_cube(self.DATA_SOURCE, self.IMAGE_NAME)
+        caplog.clear()
+
+        # execute
+        result: MatLike | None = get_image_registered_to_data_cube(self.DATA_SOURCE, self.IMAGE_NAME)
+
+        # verify
+        assert np.array_equal(result, registered)
+        assert "Loaded image RGB registered to elemental cube" in caplog.text
+        assert "Registering image to elemental cube" not in caplog.text
+
+    def test_register_image_to_cube_recipe_changed(self, caplog):
+        # setup
+        set_config(self.CONFIG_PATH)
+        caplog.set_level(logging.INFO)
+        get_image_registered_to_data_cube(self.DATA_SOURCE, self.IMAGE_NAME)
+        original_times: tuple[int, int] = (
+            stat(self.PATH_CONTROL_POINTS).st_atime_ns, stat(self.PATH_CONTROL_POINTS).st_mtime_ns
+        )
+        utime(self.PATH_CONTROL_POINTS, ns=(original_times[0], original_times[1] + 1))
+        caplog.clear()
+
+        try:
+            # execute
+            result: MatLike | None = get_image_registered_to_data_cube(self.DATA_SOURCE, self.IMAGE_NAME)
+
+            # verify
+            assert result is not None
+            assert "Registering image to elemental cube" in caplog.text
+        finally:
+            # cleanup
+            utime(self.PATH_CONTROL_POINTS, ns=original_times)
+
+    def test_register_image_to_cube_composed(self):
+        # setup
+        grid_y, grid_x = np.mgrid[:600, :800]
+        image: np.ndarray = np.stack([
+            127 + 120 * np.sin(grid_x / 40) * np.cos(grid_y / 30), grid_x / 800 * 255, grid_y / 600 * 255
+        ], axis=-1).astype(np.uint8)
+        base_source: np.ndarray = np.float32([[50, 60], [450, 40], [470, 380], [40, 360]])
+        base_destination: np.ndarray = np.float32([[60, 50], [460, 70], [450, 390], [60, 370]])
+        cube_source: np.ndarray = np.float32([[20, 20], [480, 30], [460, 400], [30, 410]])
+        cube_destination: np.ndarray = np.float32([[2, 2], [98, 3], [96, 72], [3, 73]])
+
+        # execute
+        expected: MatLike = inverse_register_image(
+            register_image(image, 500, 425, base_source, base_destination), 100, 75, cube_source, cube_destination
+        )
+        result: MatLike = register_image_to_cube(
+            image, 500, 425, base_source, base_destination, 100, 75, cube_source, cube_destination
+        )
+
+        # verify
+        assert result.shape == expected.shape
+        assert np.mean(np.abs(result.astype(int) - expected.astype(int))) < 2
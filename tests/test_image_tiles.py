@@ -0,0 +1,108 @@
+from os.path import isfile, join
+from pathlib import Path
+from threading import Thread
+
+import numpy as np
+
+from PIL.Image import Image, fromarray, open as open_image
+
+from xrf_explorer.server.image_tiles import generate_pyramid, get_pyramid, get_tile
+from xrf_explorer.server.image_tiles.tiles import get_pyramid_lock
+
+
+class TestImageTiles:
+    IMAGE: np.ndarray = np.random.default_rng(0).integers(0, 256, size=(300, 520, 3), dtype=np.uint8)
+    KEY: dict = {"mtime": 1, "size": 2}
+
+    def test_generate_pyramid(self, tmp_path: Path):
+        # setup
+        path_to_pyramid: str = str(tmp_path / "pyramid")
+
+        # execute
+        info: dict = generate_pyramid(fromarray(self.IMAGE), path_to_pyramid, self.KEY)
+
+        # verify
+        assert info["width"] == 520
+        assert info["height"] == 300
+        assert info["channels"] == 3
+        assert info["maxLevel"] == 10
+        for level in range(info["maxLevel"] + 1):
+            assert isfile(join(path_to_pyramid, f"level_{level}.raw"))
+
+    def test_get_tile(self, tmp_path: Path):
+        # setup
+        path_to_pyramid: str = str(tmp_path / "pyramid")
+        info: dict = generate_pyramid(fromarray(self.IMAGE), path_to_pyramid, self.KEY)
+
+        # execute
+        path_to_full_tile: str | None = get_tile(path_to_pyramid, info, 10, 2, 1)
+        path_to_lowest_tile: str | None = get_tile(path_to_pyramid, info, 0, 0, 0)
+
+        # verify
+        with open_image(path_to_full_tile) as tile:
+            assert np.array_equal(np.asarray(tile), self.IMAGE[256:300, 512:520])
+        with open_image(path_to_lowest_tile) as tile:
+            assert tile.size == (1, 1)
+        assert get_tile(path_to_pyramid, info, 10, 3, 0) is None
+        assert get_tile(path_to_pyramid, info, 11, 0, 0) is None
+
+    def test_get_pyramid_reused(self, tmp_path: Path):
+        # setup
+        path_to_pyramid: str = str(tmp_path / "pyramid")
+        loaded: list[Image] = []
+
+        def load_image() -> Image:
+            loaded.append(fromarray(self.IMAGE))
+            return loaded[-1]
+
+        # execute
+        info: dict | None = get_pyramid(path_to_pyramid, self.KEY, load_image)
+        info_reused: dict | None = get_pyramid(path_to_pyramid, self.KEY, load_image)
+        info_changed: dict | None = get_pyramid(path_to_pyramid, {"mtime": 3, "size": 2}, load_image)
+
+        # verify
+        assert info == info_reused
+        assert info_changed["key"] == {"mtime": 3, "size": 2}
+        assert len(loaded) == 2
+
+    def test_get_pyramid_not_blocked(self, tmp_path: Path):
+        # setup
+        path_to_pyramid: str = str(tmp_path / "pyramid")
+        path_to_other_pyramid: str = str(tmp_path / "other_pyramid")
+        get_pyramid(path_to_pyramid, self.KEY, lambda: fromarray(self.IMAGE))
+        results: list[dict | None] = []
+
+        def request():
+            results.append(get_pyramid(path_to_pyramid, self.KEY, lambda: None))
+            results.append(get_pyramid(path_to_other_pyramid, self.KEY, lambda: fromarray(self.IMAGE)))
+
+        # execute, while the pyramid is being generated by another request
+        with get_pyramid_lock(path_to_pyramid):
+            thread: Thread = Thread(target=request)
+            thread.start()
+            thread.join(10)
+            finished: bool = not thread.is_alive()
+
+        # verify
+        assert finished
+        assert results[0]["key"] == self.KEY
+        assert results[1]["key"] == self.KEY
+
+    def test_generate_pyramid_array(self, tmp_path: Path):
+        # setup
+        path_to_pyramid: str = str(tmp_path / "pyramid")
+        data: np.ndarray = np.arange(12, dtype=np.float32).reshape(3, 4)
+
+        # execute
+        info: dict = generate_pyramid(data, path_to_pyramid, self.KEY)
+        path_to_tile: str | None = get_tile(path_to_pyramid, info, 1, 0, 0,
+                                            lambda tile: (tile * 10).astype(np.uint8), "scaled")
+
+        # verify
+        assert info["dtype"] == "<f4"
+        assert np.array_equal(
+            np.fromfile(join(path_to_pyramid, "level_1.raw"), dtype=np.float32).reshape(2, 2),
+            [[2.5, 4.5], [8.5, 10.5]]
+        )
+        with open_image(path_to_tile) as tile:
+            assert np.array_equal(np.asarray(tile), [[25, 45], [85, 105]])
@@ -3,16 +3,21 @@ from os.path import join
 import numpy as np
 import pytest
 
-from cv2 import imread
+from cv2 import fillPoly, getPerspectiveTransform, imread
 
 from xrf_explorer.server.image_to_cube_selection import (
     get_selection,
+    get_selection_box,
     get_scaled_cube_coordinates,
     deregister_coord,
+    deregister_coords,
+    perspective_transform_coord,
     SelectionType,
     CubeType
 )
 from xrf_explorer.server.file_system.helper import set_config
+from xrf_explorer.server.image_register import load_points, compute_fitting_dimensions_by_aspect
+from xrf_explorer.server.image_to_cube_selection.image_to_cube_selection import compute_selection
 from xrf_explorer.server.file_system.cubes.elemental import get_elemental_data_cube
 from xrf_explorer.server.file_system.workspace.file_access import get_base_image_path
 
@@ -145,6 +150,56 @@ class TestImageToCubeSelection:
         assert data_cube_output_1_actual == data_cube_point_1_expected
         assert data_cube_output_2_actual == data_cube_point_2_expected
 
+    def test_get_cube_coordinates_rounding(self):
+        # execute
+        result: list[tuple[int, int]] = get_scaled_cube_coordinates([(1, 3), (5, 7), (-3, 2)], 10, 10, 5, 5)
+
+        # verify
+        assert result == [(round(0.5), round(1.5)), (round(2.5), round(3.5)), (round(-1.5), 1)]
+        assert all(isinstance(value, int) for coord in result for value in coord)
+
+    def test_deregister_coords(self):
+        # setup
+        coords: list[tuple[int, int]] = [(2046, 2691), (2531, 1773), (1020, 1933), (0, 0), (-10, 4000)]
+        args = (self.SAMPLE_CUBE_RECIPE_PATH, 3000, 4000, 600, 800)
+
+        # the transformation of every coordinate on its own
+        cube_points, base_points = load_points(self.SAMPLE_CUBE_RECIPE_PATH)
+        transform: np.ndarray = getPerspectiveTransform(base_points, cube_points)
+        scaled_height, scaled_width = compute_fitting_dimensions_by_aspect(600, 800, 3000, 4000)
+        expected: list[tuple[int, int]] = []
+        for coord in coords:
+            x, y = perspective_transform_coord(coord, transform)
+            expected.append((round(x * 800 / scaled_width), round(y * 600 / scaled_height)))
+
+        # execute
+        result: list[tuple[int, int]] = deregister_coords(coords, *args)
+
+        # verify
+        assert result == expected
+        assert deregister_coord(coords[0], *args) == expected[0]
+        assert deregister_coords([], *args) == []
+
+    def test_compute_selection(self):
+        # setup
+        polygon: list[tuple[int, int]] = [(-20, 5), (30, -10), (45, 25), (12, 60), (18, 20)]
+        expected: np.ndarray = np.zeros((40, 50), dtype=np.uint8)
+        fillPoly(expected, [np.array(polygon, dtype=np.int32)], (1,))
+        rows: np.ndarray = np.flatnonzero(expected.any(axis=1))
+        columns: np.ndarray = np.flatnonzero(expected.any(axis=0))
+
+        # execute
+        result = compute_selection(SelectionType.Polygon, polygon, 50, 40)
+        result_outside = compute_selection(SelectionType.Rectangle, [(60, 50), (70, 55)], 50, 40)
+
+        # verify
+        assert np.array_equal(result.to_array(), expected.astype(bool))
+        assert result.box == (rows[0], rows[-1] + 1, columns[0], columns[-1] + 1)
+        assert result.count == np.count_nonzero(expected)
+        assert result_outside.box is None
+        assert result_outside.count == 0
+        assert not result_outside.to_array().any()
+
     def test_get_selected_data_cube_output_size(self):
         # setup
         rgb_points: list[tuple[int, int]] = [
@@ -228,6 +283,32 @@ class TestImageToCubeSelection:
         # verify
         assert selection_data_rect is not None
 
+    def test_selection_box(self):
+        # setup
+        coords_rect: list[tuple[int, int]] = [(345, 678), (12, 34)]
+        coords_polygon: list[tuple[int, int]] = [(0, 0), (345, 0), (345, 678)]
+
+        # execute
+        box: tuple[int, int, int, int] | None = get_selection_box(
+            self.DATA_SOURCE_FOLDER_NAME, coords_rect, SelectionType.Rectangle, CubeType.Elemental
+        )
+        mask: np.ndarray | None = get_selection(
+            self.DATA_SOURCE_FOLDER_NAME, coords_rect, SelectionType.Rectangle, CubeType.Elemental
+        )
+        polygon_box: tuple[int, int, int, int] | None = get_selection_box(
+            self.DATA_SOURCE_FOLDER_NAME, coords_polygon, SelectionType.Polygon, CubeType.Elemental
+        )
+
+        # verify
+        assert box is not None
+        assert mask is not None
+        assert polygon_box is None
+
+        top, bottom, left, right = box
+        expected_mask: np.ndarray = np.zeros_like(mask)
+        expected_mask[top:bottom, left:right] = True
+        assert np.array_equal(mask, expected_mask)
+
     def test_negative_coordinates(self):
         # setup
         img_h, img_w, _ = imread(self.SAMPLE_BASE_IMAGE_PATH).shape
@@ -1,6 +1,7 @@
 from os import rmdir, makedirs, remove
 from os.path import join, isdir, isfile
 from shutil import rmtree
+from threading import Thread
 
 import pytest
 import json
@@ -12,6 +13,10 @@ import numpy as np
 
 from xrf_explorer import app
 from xrf_explorer.server.file_system.helper import set_config
+from xrf_explorer.server.image_tiles.elemental import get_elemental_map_pyramid_path
+from xrf_explorer.server.image_tiles.tiles import get_pyramid_lock
+from xrf_explorer.server.spectra.integral_image import INTEGRAL_IMAGE_FILE_NAME
+from xrf_explorer.server.spectra.spectra import GLOBAL_SPECTRUM_FILE_NAME
 
 RESOURCES_PATH: str = join("tests", "resources")
 
@@ -56,6 +61,22 @@ class TestRoutes:
         set_config(self.CUSTOM_CONFIG_PATH)
         yield
 
+    @pytest.fixture()
+    def unbinned_data_source(self):
+        # binning the raw data updates the workspace and generates files, restore the data source afterwards
+        path_to_data_source: str = join(self.DATA_SOURCES_FOLDER, self.UNBINNED_DATA_SOURCE)
+        path_to_workspace: str = join(path_to_data_source, "workspace.json")
+        with open(path_to_workspace, "r") as file:
+            workspace: str = file.read()
+        yield
+        with open(path_to_workspace, "w") as file:
+            file.write(workspace)
+        path_to_generated: str = join(path_to_data_source, "generated")
+        for file_name in [GLOBAL_SPECTRUM_FILE_NAME, INTEGRAL_IMAGE_FILE_NAME,
+                          INTEGRAL_IMAGE_FILE_NAME.replace(".npy", ".json")]:
+            if isfile(join(path_to_generated, file_name)):
+                remove(join(path_to_generated, file_name))
+
     def test_api(self, client: FlaskClient):
         # execute
         apis: str = client.get("/api").json
@@ -243,7 +264,7 @@ class TestRoutes:
         # verify
         assert response.status_code == 500
     
-    def test_bin_raw_data(self, client: FlaskClient):
+    def test_bin_raw_data(self, client: FlaskClient, unbinned_data_source):
         # execute
         response: TestResponse = client.post(f"/api/{self.UNBINNED_DATA_SOURCE}/bin_raw/")
 
@@ -366,6 +387,24 @@ class TestRoutes:
         assert response.status_code == 404
         assert response.text == f"Image {name} not found in source {self.DATA_SOURCE}"
     
+    def test_contextual_image_tiles(self, client: FlaskClient):
+        # execute
+        response: TestResponse = client.get(f"/api/{self.DATA_SOURCE}/image/{self.BASE_IMAGE}/tiles")
+
+        # verify
+        assert response.status_code == 200
+        assert json.loads(response.text) == {"width": 3, "height": 3, "tileSize": 256, "maxLevel": 2}
+
+    def test_contextual_image_tile(self, client: FlaskClient):
+        # execute
+        response: TestResponse = client.get(f"/api/{self.DATA_SOURCE}/image/{self.BASE_IMAGE}/tiles/2/0/0")
+        response_outside: TestResponse = client.get(f"/api/{self.DATA_SOURCE}/image/{self.BASE_IMAGE}/tiles/2/1/0")
+
+        # verify
+        assert response.status_code == 200
+        assert response.mimetype == "image/png"
+        assert response_outside.status_code == 404
+
     def test_contextual_image_size(self, client: FlaskClient):
         # execute
         response: TestResponse = client.get(f"/api/{self.DATA_SOURCE}/image/{self.BASE_IMAGE}/size")
@@ -434,6 +473,78 @@ class TestRoutes:
         assert response.status_code == 200
         assert response.data
     
+    def test_elemental_map_not_modified(self, client: FlaskClient):
+        # setup
+        etag: str | None = client.get(f"/api/{self.DATA_SOURCE}/data/elements/map/0").get_etag()[0]
+
+        # execute
+        response: TestResponse = client.get(f"/api/{self.DATA_SOURCE}/data/elements/map/0",
+                                            headers={"If-None-Match": f'"{etag}"'})
+
+        # verify
+        assert etag
+        assert response.status_code == 304
+        assert not response.data
+
+    def test_elemental_map_normalization(self, client: FlaskClient):
+        # execute
+        response_channel: TestResponse = client.get(f"/api/{self.DATA_SOURCE}/data/elements/map/0")
+        response_cube: TestResponse = client.get(f"/api/{self.DATA_SOURCE}/data/elements/map/0?normalization=cube")
+        response_invalid: TestResponse = client.get(f"/api/{self.DATA_SOURCE}/data/elements/map/0?normalization=no")
+
+        # verify
+        assert response_cube.status_code == 200
+        assert response_cube.get_etag() != response_channel.get_etag()
+        assert response_invalid.status_code == 400
+
+    def test_elemental_map_invalid_channel(self, client: FlaskClient):
+        # execute
+        response: TestResponse = client.get(f"/api/{self.DATA_SOURCE}/data/elements/map/100")
+
+        # verify
+        assert response.status_code == 404
+
+    def test_elemental_map_tiles(self, client: FlaskClient):
+        # execute
+        response: TestResponse = client.get(f"/api/{self.DATA_SOURCE}/data/elements/map/1/tiles")
+
+        # verify
+        assert response.status_code == 200
+        assert json.loads(response.text) == {"width": 3, "height": 3, "tileSize": 256, "maxLevel": 2}
+
+    def test_elemental_map_tile(self, client: FlaskClient):
+        # execute
+        response: TestResponse = client.get(f"/api/{self.DATA_SOURCE}/data/elements/map/1/tiles/2/0/0")
+        response_cached: TestResponse = client.get(f"/api/{self.DATA_SOURCE}/data/elements/map/1/tiles/2/0/0",
+                                                   headers={"If-None-Match": f'"{response.get_etag()[0]}"'})
+        response_outside: TestResponse = client.get(f"/api/{self.DATA_SOURCE}/data/elements/map/1/tiles/3/0/0")
+
+        # verify
+        assert response.status_code == 200
+        assert response.mimetype == "image/png"
+        assert response_cached.status_code == 304
+        assert response_outside.status_code == 404
+
+    def test_elemental_map_tiles_not_blocked(self, client: FlaskClient):
+        # setup
+        client.get(f"/api/{self.DATA_SOURCE}/data/elements/map/1/tiles")
+        responses: list[TestResponse] = []
+
+        def request():
+            responses.append(client.get(f"/api/{self.DATA_SOURCE}/data/elements/map/1/tiles/2/0/0"))
+            responses.append(client.get(f"/api/{self.DATA_SOURCE}/data/elements/map/0/tiles"))
+
+        # execute, while the pyramid of the map is being generated by another request
+        with get_pyramid_lock(get_elemental_map_pyramid_path(self.DATA_SOURCE, 1)):
+            thread: Thread = Thread(target=request)
+            thread.start()
+            thread.join(10)
+            finished: bool = not thread.is_alive()
+
+        # verify
+        assert finished
+        assert [response.status_code for response in responses] == [200, 200]
+
     def test_elemental_map_invalid_data_source(self, client: FlaskClient):
         # setup
         data_source: str = "not a data source"
@@ -470,6 +581,26 @@ class TestRoutes:
         assert len(json.loads(response.text)[0]) == 16
         assert len(json.loads(response.text)[1]) == 4
     
+    def test_get_element_spectra_batch(self, client: FlaskClient):
+        # setup
+        body: dict = {"elements": ["Si K", "Fe K"], "excitation": 20}
+
+        # execute
+        response: TestResponse = client.post(f"/api/{self.DATA_SOURCE}/get_element_spectra", json=body)
+
+        # verify
+        assert response.status_code == 200
+        result: dict = json.loads(response.text)
+        assert set(result.keys()) == {"Si K", "Fe K"}
+        assert result["Si K"] == json.loads(client.get(f"/api/{self.DATA_SOURCE}/get_element_spectrum/Si K/20").text)
+
+    def test_get_element_spectra_batch_invalid_body(self, client: FlaskClient):
+        # execute
+        response: TestResponse = client.post(f"/api/{self.DATA_SOURCE}/get_element_spectra", json={"excitation": 20})
+
+        # verify
+        assert response.status_code == 400
+
     def test_get_element_spectra_invalid_data_source(self, client: FlaskClient):
         # execute
         response: TestResponse = client.get(f"/api/this is not a data source/get_element_spectrum/Si K/20")
@@ -0,0 +1,159 @@
+import json
+
+from os import stat, utime
+from os.path import join
+from pathlib import Path
+from shutil import copy, copytree
+from threading import Event, Thread
+
+import numpy as np
+import pytest
+
+from xrf_explorer.server.file_system.helper import set_config
+from xrf_explorer.server.image_to_cube_selection import (
+    get_cached_selection_mask,
+    get_cached_selection_result,
+    get_selection,
+    get_selection_cache_statistics,
+    get_selection_key,
+    clear_selection_cache,
+    SelectionMask,
+    SelectionType,
+    CubeType
+)
+
+RESOURCES_PATH: str = join("tests", "resources")
+
+
+class TestSelectionCache:
+    CUSTOM_CONFIG_PATH: str = join(RESOURCES_PATH, "configs", "image_to_cube_selection.yml")
+    DATA_SOURCE_FOLDER_NAME: str = "Data_source"
+    POLYGON: list[tuple[int, int]] = [(0, 0), (345, 0), (345, 678), (0, 678)]
+
+    @pytest.fixture(autouse=True)
+    def setup_environment(self):
+        set_config(self.CUSTOM_CONFIG_PATH)
+        clear_selection_cache()
+        yield
+        clear_selection_cache()
+
+    def test_get_cached_selection_mask(self):
+        # setup
+        expected: np.ndarray | None = get_selection(
+            self.DATA_SOURCE_FOLDER_NAME, self.POLYGON, SelectionType.Polygon, CubeType.Elemental
+        )
+
+        # execute
+        result: SelectionMask | None = get_cached_selection_mask(
+            self.DATA_SOURCE_FOLDER_NAME, self.POLYGON, SelectionType.Polygon, CubeType.Elemental
+        )
+        result_cached: SelectionMask | None = get_cached_selection_mask(
+            self.DATA_SOURCE_FOLDER_NAME, self.POLYGON, SelectionType.Polygon, CubeType.Elemental
+        )
+
+        # verify
+        assert result is not None
+        assert result_cached is result
+        assert np.array_equal(result.to_array(), expected)
+        assert not result.mask.flags.writeable
+        assert get_selection_cache_statistics() == {"hits": 1, "misses": 1, "entries": 1}
+
+    def test_get_selection_key(self):
+        # execute
+        key: tuple = get_selection_key(
+            self.DATA_SOURCE_FOLDER_NAME, self.POLYGON, SelectionType.Polygon, CubeType.Elemental
+        )
+        key_raw: tuple = get_selection_key(
+            self.DATA_SOURCE_FOLDER_NAME, self.POLYGON, SelectionType.Polygon, CubeType.Raw
+        )
+        key_moved: tuple = get_selection_key(
+            self.DATA_SOURCE_FOLDER_NAME, self.POLYGON[1:] + self.POLYGON[:1], SelectionType.Polygon,
+            CubeType.Elemental
+        )
+
+        # verify
+        assert key == get_selection_key(
+            self.DATA_SOURCE_FOLDER_NAME, list(self.POLYGON), SelectionType.Polygon, CubeType.Elemental
+        )
+        assert key != key_raw
+        assert key != key_moved
+
+    def test_get_cached_selection_mask_recipe_changed(self, tmp_path: Path):
+        # setup, a copy of the data source of which the elemental cube has a recipe
+        path_to_data_source: Path = tmp_path / self.DATA_SOURCE_FOLDER_NAME
+        copytree(join(RESOURCES_PATH, "image_to_cube_selection", "data", self.DATA_SOURCE_FOLDER_NAME),
+                 path_to_data_source)
+        copy(join(RESOURCES_PATH, "image_to_cube_selection", "recipe_cube.csv"), path_to_data_source / "recipe.csv")
+
+        workspace: dict = json.loads((path_to_data_source / "workspace.json").read_text())
+        workspace["elementalCubes"][0]["recipeLocation"] = "recipe.csv"
+        (path_to_data_source / "workspace.json").write_text(json.dumps(workspace))
+
+        config_path: Path = tmp_path / "config.yml"
+        config_path.write_text(f"uploads-folder: \"{tmp_path.as_posix()}\"\nmax-spectrum-points: 90000\n")
+        set_config(str(config_path))
+
+        key: tuple = get_selection_key(
+            self.DATA_SOURCE_FOLDER_NAME, self.POLYGON, SelectionType.Polygon, CubeType.Elemental
+        )
+        get_cached_selection_mask(self.DATA_SOURCE_FOLDER_NAME, self.POLYGON, SelectionType.Polygon, CubeType.Elemental)
+
+        # execute, after the control points of the recipe are edited in place
+        recipe_stat = stat(path_to_data_source / "recipe.csv")
+        utime(path_to_data_source / "recipe.csv", ns=(recipe_stat.st_atime_ns, recipe_stat.st_mtime_ns + 1))
+        key_changed: tuple = get_selection_key(
+            self.DATA_SOURCE_FOLDER_NAME, self.POLYGON, SelectionType.Polygon, CubeType.Elemental
+        )
+        get_cached_selection_mask(self.DATA_SOURCE_FOLDER_NAME, self.POLYGON, SelectionType.Polygon, CubeType.Elemental)
+
+        # verify
+        assert key != key_changed
+        assert get_selection_cache_statistics()["hits"] == 0
+        assert get_selection_cache_statistics()["misses"] == 2
+
+    def test_get_cached_selection_result_not_cached(self):
+        # setup
+        calls: list[int] = []
+
+        def compute() -> None:
+            calls.append(1)
+            return None
+
+        # execute
+        result_1 = get_cached_selection_result(("key",), "result", compute)
+        result_2 = get_cached_selection_result(("key",), "result", compute)
+
+        # verify
+        assert result_1 is None
+        assert result_2 is None
+        assert len(calls) == 2
+
+    def test_get_cached_selection_result_coalesced(self):
+        # setup
+        started: Event = Event()
+        release: Event = Event()
+        calls: list[int] = []
+        results: list[list[int]] = []
+
+        def compute() -> list[int]:
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return [1, 2, 3]
+
+        def request():
+            results.append(get_cached_selection_result(("key",), "result", compute))
+
+        # execute
+        threads: list[Thread] = [Thread(target=request) for _ in range(4)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        # verify
+        assert len(calls) == 1
+        assert results == [[1, 2, 3]] * 4
@@ -1,12 +1,47 @@
 import logging
+from math import ceil, floor
+from os import remove
+from os.path import join, isfile
 from pathlib import Path
+from shutil import rmtree
+from threading import Lock
 
 import numpy as np
 import pytest
 
 from xrf_explorer.server.file_system.helper import set_config
-from xrf_explorer.server.file_system.cubes.spectral import mipmap_exists, mipmap_raw_cube, get_raw_data
-from xrf_explorer.server.spectra import get_average_global, get_average_selection, get_theoretical_data
+from xrf_explorer.server.file_system.cubes.spectral import (
+    mipmap_exists,
+    mipmap_raw_cube,
+    get_raw_data,
+    downsample_cube,
+    write_mipmaps
+)
+from xrf_explorer.server.file_system.cubes import SelectionMask
+from xrf_explorer.server.spectra import (
+    get_average_global,
+    get_average_selection,
+    get_average_rectangle,
+    get_integral_image,
+    get_global_spectrum_statistics,
+    get_theoretical_data,
+    get_theoretical_data_batch,
+    get_element_lines,
+    get_element_line_table,
+    prewarm_element_line_tables
+)
+from xrf_explorer.server.spectra.spectra import (
+    ELEMENT_LINE_TABLES,
+    GLOBAL_SPECTRUM_FILE_NAME,
+    downscale_mask,
+    sum_selected_spectra,
+    get_element_spectrum,
+    gaussian_convolve,
+    ElementLines
+)
+from xrf_explorer.server.spectra.integral_image import (
+    compute_integral_image, get_integral_image_lock, INTEGRAL_IMAGE_FILE_NAME
+)
 
 
 class TestSpectra:
@@ -18,12 +53,18 @@ class TestSpectra:
     TEST_RAW_DATA: np.ndarray = np.array([[[3, 4], [1, 2], [1, 2]],
                                           [[2, 2], [2, 0], [2, 2]],
                                           [[2, 2], [2, 0], [2, 2]]], dtype=np.uint16)
+    PATH_GENERATED: str = str(Path(RESOURCES_PATH, "spectra", "data", DATA_SOURCE_FOLDER_NAME, "generated"))
     
     @pytest.fixture(autouse=True)
     def setup_environment(self):
         set_config(self.CUSTOM_CONFIG_PATH)
         self.TEST_RAW_DATA.flatten().tofile(self.TEST_RAW_PATH)
         yield
+        # remove the files generated by the tests, the mipmaps in the generated folder are fixtures
+        for file_name in [GLOBAL_SPECTRUM_FILE_NAME, INTEGRAL_IMAGE_FILE_NAME,
+                          INTEGRAL_IMAGE_FILE_NAME.replace(".npy", ".json")]:
+            if isfile(join(self.PATH_GENERATED, file_name)):
+                remove(join(self.PATH_GENERATED, file_name))
 
     def test_get_average_global(self):
         # setup
@@ -37,6 +78,37 @@ class TestSpectra:
         # verify
         assert result == expected_result
 
+    def test_get_global_spectrum_statistics(self):
+        # setup
+        path_to_statistics: str = join(self.PATH_GENERATED, GLOBAL_SPECTRUM_FILE_NAME)
+        new_data: np.ndarray = np.array([[[1, 1], [1, 1], [1, 1]],
+                                         [[1, 1], [1, 1], [1, 1]],
+                                         [[1, 1], [1, 1], [1, 10]]], dtype=np.uint16)
+
+        # execute
+        result: dict | None = get_global_spectrum_statistics(self.DATA_SOURCE_FOLDER_NAME)
+        stored: bool = isfile(path_to_statistics)
+        new_data.flatten().tofile(self.TEST_RAW_PATH)
+        new_result: dict | None = get_global_spectrum_statistics(self.DATA_SOURCE_FOLDER_NAME)
+
+        # verify
+        assert stored
+        assert result["count"] == 9
+        assert result["sum"] == [17.0, 16.0]
+        assert result["mean"] == [17 / 9, 16 / 9]
+        assert result["min"] == [1.0, 0.0]
+        assert result["max"] == [3.0, 4.0]
+        assert new_result["mean"] == [1.0, 2.0]
+        assert new_result["max"] == [1.0, 10.0]
+
+    def test_get_global_spectrum_statistics_no_raw(self, caplog):
+        # execute
+        result: dict | None = get_global_spectrum_statistics("inexistent")
+
+        # verify
+        assert result is None
+        assert "Could not find raw data of data source inexistent" in caplog.text
+
     def test_get_average_selection(self, caplog):
         caplog.set_level(logging.INFO)
         # setup
@@ -54,6 +126,145 @@ class TestSpectra:
         assert "Calculated the average spectrum for the selection." in caplog.text
         assert result == expected_result
     
+    def test_get_average_selection_mask(self):
+        # setup
+        mask: np.ndarray = np.array([[True, False, True],
+                                     [False, True, True],
+                                     [True, False, False]])
+        selection: SelectionMask = SelectionMask.from_array(mask)
+
+        # execute
+        result: list[float] = get_average_selection(self.DATA_SOURCE_FOLDER_NAME, selection)
+
+        # verify
+        assert selection.box == (0, 3, 0, 3)
+        assert np.array_equal(selection.to_array(), mask)
+        assert result == get_average_selection(self.DATA_SOURCE_FOLDER_NAME, mask)
+
+    def test_get_average_selection_empty(self):
+        # setup
+        mask: np.ndarray = np.zeros((3, 3), dtype=bool)
+
+        # execute
+        result: list[float] = get_average_selection(self.DATA_SOURCE_FOLDER_NAME, mask)
+
+        # verify
+        assert result == []
+
+    def test_get_average_selection_exact(self, caplog):
+        caplog.set_level(logging.INFO)
+        # setup
+        mask: np.ndarray = np.array([[True, True, False],
+                                     [True, True, False],
+                                     [False, False, False]])
+        expected_result: list[float] = [2.0, 2.0]
+
+        # execute
+        result: list[float] = get_average_selection(self.DATA_SOURCE_FOLDER_NAME, mask, exact=True)
+
+        # verify
+        assert "Getting selection at mip level 0" in caplog.text
+        assert result == expected_result
+
+    def test_compute_integral_image(self, tmp_path):
+        # setup
+        data: np.ndarray = np.random.default_rng(0).integers(0, 100, size=(7, 5, 3), dtype=np.uint16)
+
+        # execute, with bands of 2 rows
+        integral: np.ndarray = compute_integral_image(data, str(tmp_path / "integral.npy"), 2 * 5 * 3 * 8)
+
+        # verify
+        assert integral.shape == (8, 6, 3)
+        for y in range(8):
+            for x in range(6):
+                assert np.array_equal(integral[y, x], np.sum(data[:y, :x], axis=(0, 1)))
+
+    def test_get_average_rectangle(self, caplog):
+        caplog.set_level(logging.INFO)
+        # setup
+        path_to_index: str = join(self.PATH_GENERATED, INTEGRAL_IMAGE_FILE_NAME)
+        expected_result: list[float] = get_average_selection(
+            self.DATA_SOURCE_FOLDER_NAME, np.array([[False, True, True], [False, True, True], [False, False, False]])
+        )
+
+        # execute
+        result: list[float] = get_average_rectangle(self.DATA_SOURCE_FOLDER_NAME, (0, 2, 1, 3))
+        stored: bool = isfile(path_to_index)
+        whole_result: list[float] = get_average_rectangle(self.DATA_SOURCE_FOLDER_NAME, (0, 3, 0, 3))
+
+        # verify
+        assert "Getting rectangle from integral image at mip level 0" in caplog.text
+        assert stored
+        assert result == expected_result
+        assert whole_result == [17 / 9, 16 / 9]
+
+    def test_get_average_rectangle_index_building(self, caplog):
+        caplog.set_level(logging.INFO)
+        # setup
+        path_to_index: str = join(self.PATH_GENERATED, INTEGRAL_IMAGE_FILE_NAME)
+        expected_result: list[float] = get_average_selection(
+            self.DATA_SOURCE_FOLDER_NAME, np.array([[False, True, True], [False, True, True], [False, False, False]])
+        )
+        lock: Lock = get_integral_image_lock(self.DATA_SOURCE_FOLDER_NAME)
+
+        # execute, while another request builds the index
+        with lock:
+            result: list[float] = get_average_rectangle(self.DATA_SOURCE_FOLDER_NAME, (0, 2, 1, 3))
+
+        # verify
+        assert f"Integral image of data source {self.DATA_SOURCE_FOLDER_NAME} is being built" in caplog.text
+        assert "Getting rectangle from integral image" not in caplog.text
+        assert not isfile(path_to_index)
+        assert result == expected_result
+
+    def test_get_integral_image_outdated(self):
+        # setup
+        new_data: np.ndarray = np.ones((3, 3, 2), dtype=np.uint16)
+
+        # execute
+        integral: np.ndarray | None = get_integral_image(self.DATA_SOURCE_FOLDER_NAME)
+        total: np.ndarray = np.array(integral[-1, -1])
+        del integral
+        new_data.flatten().tofile(self.TEST_RAW_PATH)
+        new_integral: np.ndarray | None = get_integral_image(self.DATA_SOURCE_FOLDER_NAME)
+
+        # verify
+        assert total.tolist() == [17.0, 16.0]
+        assert new_integral[-1, -1].tolist() == [9.0, 9.0]
+
+    def test_get_average_rectangle_empty(self):
+        # execute
+        result: list[float] = get_average_rectangle(self.DATA_SOURCE_FOLDER_NAME, (2, 2, 0, 3))
+
+        # verify
+        assert result == []
+
+    def test_downscale_mask(self):
+        # setup
+        mask: np.ndarray = np.zeros((5, 7), dtype=bool)
+        mask[0, 0] = True
+        mask[4, 6] = True
+        expected_result: np.ndarray = np.array([[True, False],
+                                                [False, True]])
+
+        # execute
+        result: np.ndarray = downscale_mask(mask, 2)
+
+        # verify
+        assert np.array_equal(result, expected_result)
+
+    def test_sum_selected_spectra(self):
+        # setup
+        data: np.ndarray = np.random.default_rng(0).integers(0, 100, size=(9, 8, 4), dtype=np.uint16)
+        mask: np.ndarray = np.random.default_rng(1).random((5, 4)) > 0.5
+        expected_result: np.ndarray = data[2:7, 3:7][mask].sum(axis=0)
+
+        # execute
+        result: np.ndarray = sum_selected_spectra(data, mask, 2, 3, 4 * 4 * 2)
+
+        # verify
+        assert np.array_equal(result, expected_result)
+
     def test_get_average_selection_config_none(self, caplog):
         set_config("fake_path")
         result: list = get_average_selection(self.DATA_SOURCE_FOLDER_NAME, np.ndarray([]))
@@ -124,6 +335,77 @@ class TestSpectra:
         assert mipmapped_data.shape[1] * 2 - 1 == original_data.shape[1]
         assert mipmapped_data.shape[2] == original_data.shape[2]
     
+    def test_mipmap_multiple_levels(self):
+        # setup
+        expected_level_1: np.ndarray = np.array([[[2, 2], [1, 2]],
+                                                 [[2, 1], [2, 2]]], dtype=np.uint16)
+        expected_level_2: np.ndarray = np.array([[[1, 1]]], dtype=np.uint16)
+        level_2_folder: str = join(self.RESOURCES_PATH, "spectra", "data", self.DATA_SOURCE_FOLDER_NAME,
+                                   "generated", "mipmaps", "2")
+
+        # execute
+        mipmap_raw_cube(self.DATA_SOURCE_FOLDER_NAME, 2)
+        level_1: np.memmap | np.ndarray = get_raw_data(self.DATA_SOURCE_FOLDER_NAME, 1)
+        level_2: np.memmap | np.ndarray = get_raw_data(self.DATA_SOURCE_FOLDER_NAME, 2)
+
+        # verify
+        assert np.array_equal(level_1, expected_level_1)
+        assert np.array_equal(level_2, expected_level_2)
+
+        # cleanup
+        del level_2
+        rmtree(level_2_folder)
+
+    def test_downsample_cube(self):
+        # setup
+        data: np.ndarray = np.random.default_rng(0).integers(0, 1000, size=(7, 5, 3), dtype=np.uint16)
+        expected_result: np.ndarray = np.zeros((4, 3, 3), dtype=np.uint16)
+        for y in range(expected_result.shape[0]):
+            for x in range(expected_result.shape[1]):
+                expected_result[y, x, :] = np.mean(data[2 * y:2 * y + 2, 2 * x:2 * x + 2, :], axis=(0, 1))
+
+        # execute
+        result: np.ndarray = downsample_cube(data)
+
+        # verify
+        assert result.dtype == np.uint16
+        assert np.array_equal(result, expected_result)
+
+    def test_write_mipmaps_bounded(self, tmp_path: Path):
+        # setup
+        data: np.ndarray = np.random.default_rng(0).integers(0, 1000, size=(29, 11, 3), dtype=np.uint16)
+        paths: list[str] = [str(tmp_path / f"level_{level}.raw") for level in range(1, 5)]
+        expected_levels: list[np.ndarray] = []
+        level_data: np.ndarray = data
+        for _ in paths:
+            level_data = downsample_cube(level_data)
+            expected_levels.append(level_data)
+
+        # less than a row per level, such that bands split the blocks of every level
+        row_size: int = data.shape[1] * data.shape[2] * data.itemsize
+        chunk_size: int = 3 * row_size
+        reads: list[int] = []
+
+        class RecordingCube:
+            shape: tuple[int, int, int] = data.shape
+            dtype: np.dtype = data.dtype
+
+            def __getitem__(self, key) -> np.ndarray:
+                band: np.ndarray = data[key]
+                reads.append(band.nbytes)
+                return band
+
+        # execute
+        write_mipmaps(RecordingCube(), paths, chunk_size)
+
+        # verify
+        assert sum(reads) == data.nbytes
+        assert max(reads) <= chunk_size
+        for path, expected in zip(paths, expected_levels):
+            result: np.memmap = np.memmap(path, dtype=data.dtype, mode="r", shape=expected.shape)
+            assert np.array_equal(result, expected)
+            del result
+
     def test_get_theoretical_data(self):
         # execute
         result: list[float] = get_theoretical_data('yAlK', 16, 0, 10, 1)
@@ -131,6 +413,81 @@ class TestSpectra:
         # verify
         assert len(result) == 2
     
+    def test_get_theoretical_data_matches_loop(self):
+        # setup
+        low: int = 100
+        high: int = 4000
+        bin_size: int = 7
+        _, y_spectrum, x_peaks, _ = get_element_spectrum('Fe', 20.0)
+        y_spectrum = y_spectrum * 255
+        x_peaks = x_peaks * 4096 / 40
+
+        # the spectrum and peaks as computed per bin and per peak
+        expected_spectrum: list[float] = []
+        for i in range(ceil((high - low) / bin_size)):
+            start_index: int = floor((low + i * bin_size) * len(y_spectrum) / 4096)
+            new_bin_size: int = round(bin_size / (4096 / len(y_spectrum)))
+            expected_spectrum.append(np.mean(y_spectrum[start_index:start_index + new_bin_size]))
+        expected_peaks: list[float] = [(peak - low) / bin_size for peak in x_peaks if low <= peak < high]
+
+        # execute
+        result: list = get_theoretical_data('Fe K', 20.0, low, high, bin_size)
+
+        # verify
+        assert np.allclose(result[0], expected_spectrum)
+        assert np.allclose(result[1], expected_peaks)
+
+    def test_get_element_lines_cached(self):
+        # execute
+        lines: ElementLines = get_element_lines('Fe', 20.0)
+
+        # verify
+        assert get_element_lines('Fe', 20.0) is lines
+        assert not lines.peak_energies.flags.writeable
+        assert not lines.peak_intensities.flags.writeable
+
+    def test_gaussian_convolve(self):
+        # setup
+        peak_energies: np.ndarray = np.array([1.0, 6.4, 7.1])
+        peak_intensities: np.ndarray = np.array([0.2, 1.0, 0.5])
+        x_kevs: np.ndarray = np.linspace(0, 40, 1000)
+        expected: np.ndarray = np.zeros_like(x_kevs)
+        for energy, intensity in zip(peak_energies, peak_intensities):
+            expected += intensity * np.exp(-(1 / 0.01) * (x_kevs - energy) ** 2)
+
+        # execute
+        _, result = gaussian_convolve(peak_energies, peak_intensities, x_kevs=x_kevs)
+
+        # verify
+        assert np.allclose(result, expected)
+
+    def test_prewarm_element_line_tables(self):
+        # setup
+        set_config(str(Path(self.RESOURCES_PATH, "configs", "routes.yml")).replace("\\", "/"))
+
+        # execute
+        loaded: int = prewarm_element_line_tables()
+
+        # verify
+        assert loaded > 0
+        assert "Si" in ELEMENT_LINE_TABLES
+        assert get_element_line_table("Si") is ELEMENT_LINE_TABLES["Si"]
+
+    def test_prewarm_element_line_tables_disabled(self):
+        # execute
+        loaded: int = prewarm_element_line_tables()
+
+        # verify
+        assert loaded == 0
+
+    def test_get_theoretical_data_batch(self):
+        # execute
+        result: dict[str, list] = get_theoretical_data_batch(['Fe K', 'not an element'], 20.0, 0, 10, 1)
+
+        # verify
+        assert result['Fe K'] == get_theoretical_data('Fe K', 20.0, 0, 10, 1)
+        assert result['not an element'] == []
+
     def test_get_theoretical_data_invalid_element(self, caplog):
         caplog.set_level(logging.INFO)
 
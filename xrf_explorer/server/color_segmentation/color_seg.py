@@ -1,5 +1,6 @@
 import logging
 
+from hashlib import sha1
 from os import path, makedirs
 
 import cv2
@@ -8,12 +9,53 @@ import numpy as np
 from cv2.typing import MatLike
 from skimage import color
 
-from xrf_explorer.server.image_register import get_image_registered_to_data_cube
-from xrf_explorer.server.file_system.cubes import normalize_elemental_cube_per_layer, get_elemental_data_cube
+from xrf_explorer.server.color_segmentation.helper import get_path_to_cs_folder
+from xrf_explorer.server.color_segmentation.k_means import KMeansResult, fit_k_means
+from xrf_explorer.server.image_register import get_image_registered_to_data_cube, get_registered_image_key
+from xrf_explorer.server.file_system import load_cached_array, store_cached_array
+from xrf_explorer.server.file_system.cubes import (
+    normalize_elemental_cube_per_layer,
+    get_elemental_data_cube,
+    get_elemental_statistics
+)
 
 LOG: logging.Logger = logging.getLogger(__name__)
 
 
+def get_lab_image_registered_to_data_cube(data_source: str, image_name: str) -> np.ndarray | None:
+    """
+    Gets an image registered to the data cube in LAB format. The converted image is stored as a float32 .npy file in
+    the color segmentation folder of the data source and memory mapped, such that all color segmentation requests
+    share a single conversion. It is only recomputed if the registered image changed since.
+
+    :param data_source: the name of the data source
+    :param image_name: the name of the image to convert
+    :return: the read-only image in LAB format in format {y, x, channel}, or None if the image could not be registered
+    """
+
+    key: dict | None = get_registered_image_key(data_source, image_name)
+    path_to_cs_folder: str = get_path_to_cs_folder(data_source) if key is not None else ""
+
+    # the names of images are chosen by the user, so they are hashed to get a valid file name
+    path_to_image: str = path.join(path_to_cs_folder, f"lab_{sha1(image_name.encode()).hexdigest()}.npy")
+
+    # use the stored image if it is up-to-date
+    if path_to_cs_folder:
+        stored_image: np.ndarray | None = load_cached_array(path_to_image, key, mmap_mode='r')
+        if stored_image is not None:
+            return stored_image
+
+    registered_image: MatLike | None = get_image_registered_to_data_cube(data_source, image_name)
+    if registered_image is None:
+        return None
+
+    image: np.ndarray = image_to_lab(cv2.cvtColor(registered_image, cv2.COLOR_BGR2RGB)).astype(np.float32)
+    if not path_to_cs_folder or not store_cached_array(path_to_image, key, image):
+        return image
+
+    return np.load(path_to_image, mmap_mode='r')
+
+
 def merge_similar_colors(clusters: np.ndarray, bitmasks: np.ndarray,
                          threshold: int = 7) -> tuple[np.ndarray, np.ndarray]:
     """
@@ -74,7 +116,7 @@ def merge_similar_colors(clusters: np.ndarray, bitmasks: np.ndarray,
 def get_clusters_using_k_means(data_source: str, image_name: str,
                                k: int = 30, nr_of_attempts: int = 10) -> tuple[np.ndarray, list[np.ndarray]]:
     """
-    Extract the color clusters of the RGB image using the k-means clustering method in OpenCV
+    Extract the color clusters of the RGB image using the k-means engine configured under `cs-engine`
 
     :param data_source: the name of the data source
     :param image_name: the name of the image to apply k-means on
@@ -83,36 +125,24 @@ def get_clusters_using_k_means(data_source: str, image_name: str,
         Defaults to 10
     :return: an array of labels of the clusters, the array of colors of clusters, and the array of bitmasks
     """
-    # set seed so results are consistent
-    cv2.setRNGSeed(0)
     LOG.info(f'Computing image-wide color clusters with parameters: k={k}, data_source={data_source}')
 
-    # Get registered image
-    registered_image: MatLike | None = get_image_registered_to_data_cube(data_source, image_name)
-    if registered_image is None:
+    # Get registered image in LAB format
+    image: np.ndarray | None = get_lab_image_registered_to_data_cube(data_source, image_name)
+    if image is None:
         LOG.error("Image could not be registered to data cube")
         return np.empty(0), []
 
-    image: np.ndarray = cv2.cvtColor(registered_image, cv2.COLOR_BGR2RGB)
     reshaped_image: np.ndarray = reshape_image(image)
 
-    # Transform image to LAB format
-    reshaped_image = image_to_lab(reshaped_image)
-
-    # criteria for stopping (stop the algorithm iteration if specified accuracy, eps, is reached or after max_iter
-    # iterations.)
-    # At most 50 iterations and at least 1.0 accuracy
-    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 50, 1.0)
-
     # apply kmeans
-    colors: np.ndarray
-    labels: np.ndarray
-    _, labels, colors = cv2.kmeans(reshaped_image, k, np.empty(0), criteria, nr_of_attempts, cv2.KMEANS_PP_CENTERS)
-    labels = labels.reshape(image.shape[:2])
+    result: KMeansResult = fit_k_means(reshaped_image, k, nr_of_attempts)
+    colors: np.ndarray = result.centroids
+    labels: np.ndarray = result.labels.reshape(image.shape[:2])
 
     # Create bitmasks for each cluster
     bitmasks: list[np.ndarray] = []
-    for i in range(k):
+    for i in range(len(colors)):
         mask: np.ndarray = np.array(labels == i)
         bitmasks.append(mask)
 
@@ -127,7 +157,7 @@ def get_elemental_clusters_using_k_means(data_source: str, image_name: str, elem
                                          elem_threshold: float = 0.1, k: int = 30,
                                          nr_of_attempts: int = 10) -> tuple[np.ndarray, list[np.ndarray]]:
     """
-    Extract the color clusters of the RGB image per element using the k-means clustering method in OpenCV
+    Extract the color clusters of the RGB image per element using the k-means engine configured under `cs-engine`
 
     :param data_source: the name of the data source
     :param image_name: the name of the image to apply k-means on
@@ -151,27 +181,18 @@ def get_elemental_clusters_using_k_means(data_source: str, image_name: str, elem
         return np.empty(0), []
 
     # Normalize the elemental data cube
-    data_cube: np.ndarray = normalize_elemental_cube_per_layer(data_cube)
+    statistics: dict | None = get_elemental_statistics(data_source)
+    bounds: tuple[list[float], list[float]] | None = None if statistics is None else (
+        statistics["min"], statistics["max"]
+    )
+    data_cube: np.ndarray = normalize_elemental_cube_per_layer(data_cube, bounds)
 
-    # Get registered image
-    registered_image: MatLike | None = get_image_registered_to_data_cube(data_source, image_name)
-    if registered_image is None:
+    # Get registered image in LAB format
+    image: np.ndarray | None = get_lab_image_registered_to_data_cube(data_source, image_name)
+    if image is None:
         LOG.error("Image could not be registered to data cube")
         return np.empty(0), []
 
-    image: np.ndarray = cv2.cvtColor(registered_image, cv2.COLOR_BGR2RGB)
-
-    # Transform image to lab
-    image = image_to_lab(image)
-
-    # set seed so results are consistent
-    cv2.setRNGSeed(0)
-
-    # criteria for stopping (stop the algorithm iteration if specified accuracy, eps, is reached or after max_iter
-    # iterations.)
-    # At most 50 iterations and at least 1.0 accuracy
-    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 50, 1.0)
-
     # Get bitmask of pixels with high element concentration and get respective pixels in the image
     bitmask: np.ndarray = np.array(data_cube[elemental_channel] >= elem_threshold)
     masked_image: np.ndarray = image[bitmask]
@@ -183,16 +204,15 @@ def get_elemental_clusters_using_k_means(data_source: str, image_name: str, elem
 
     # k cannot be bigger than number of pixels w/element present
     k = min(k, masked_image.size)
-    labels: np.ndarray
-    center: np.ndarray
-    _, labels, center = cv2.kmeans(masked_image, k, np.empty(0), criteria, nr_of_attempts, cv2.KMEANS_PP_CENTERS)
+    result: KMeansResult = fit_k_means(masked_image, k, nr_of_attempts)
+    center: np.ndarray = result.centroids
+    labels: np.ndarray = result.labels
 
-    labels = labels.flatten()
     subset_indices: tuple[np.ndarray, ...] = np.nonzero(bitmask)
 
     bitmasks: list[np.ndarray] = []
     # Bitmasks for each cluster
-    for i in range(k):
+    for i in range(len(center)):
         # Indices for cluster "i"
         cluster_indices: np.ndarray = np.array(labels == i)
         # Initialize empty mask
@@ -0,0 +1,212 @@
+import logging
+
+from dataclasses import dataclass
+from time import perf_counter
+
+import cv2
+import numpy as np
+
+from sklearn.cluster import MiniBatchKMeans
+
+from xrf_explorer.server.file_system import get_config
+
+LOG: logging.Logger = logging.getLogger(__name__)
+
+# the engines that can be configured under `cs-engine` in the backend config
+K_MEANS_ENGINES: tuple[str, ...] = ("opencv", "mini-batch")
+DEFAULT_K_MEANS_ENGINE: str = "opencv"
+
+# the number of pixels the centroids of the mini-batch engine are trained on
+DEFAULT_K_MEANS_SAMPLE_SIZE: int = 20000
+K_MEANS_BATCH_SIZE: int = 2048
+
+# the number of pixels that is assigned to the nearest centroid at once
+K_MEANS_ASSIGN_CHUNK_SIZE: int = 65536
+
+
+@dataclass(frozen=True, slots=True)
+class KMeansResult:
+    """The result of clustering pixels with k-means."""
+    centroids: np.ndarray
+    labels: np.ndarray
+    inertia: float
+    fit_time: float
+
+
+def get_k_means_engine() -> str:
+    """
+    Gets the k-means engine used for color segmentation, as set under `cs-engine` in the backend config.
+
+    :return: The name of the engine, one of `K_MEANS_ENGINES`
+    """
+
+    config: dict | None = get_config()
+    engine: str = DEFAULT_K_MEANS_ENGINE if not config else str(config.get("cs-engine", DEFAULT_K_MEANS_ENGINE))
+    if engine not in K_MEANS_ENGINES:
+        LOG.warning(f"Unknown k-means engine {engine}, using {DEFAULT_K_MEANS_ENGINE}")
+        return DEFAULT_K_MEANS_ENGINE
+
+    return engine
+
+
+def get_k_means_sample_size() -> int:
+    """
+    Gets the number of pixels the centroids of the mini-batch engine are trained on, as set under
+    `cs-sample-size` in the backend config.
+
+    :return: The number of pixels in the sample
+    """
+
+    config: dict | None = get_config()
+    if not config:
+        return DEFAULT_K_MEANS_SAMPLE_SIZE
+
+    return max(1, int(config.get("cs-sample-size", DEFAULT_K_MEANS_SAMPLE_SIZE)))
+
+
+def stratified_sample(pixels: np.ndarray, sample_size: int, seed: int = 0) -> np.ndarray:
+    """
+    Takes a stratified sample of pixels. The pixels are divided into `sample_size` consecutive strata of about equal
+    size, and a random pixel is taken from each stratum, such that the sample covers the whole image.
+
+    :param pixels: The pixels in format {pixel, channel}
+    :param sample_size: The number of pixels in the sample
+    :param seed: The seed of the random generator
+    :return: The sampled pixels in format {pixel, channel}, all pixels if there are at most `sample_size`
+    """
+
+    if pixels.shape[0] <= sample_size:
+        return pixels
+
+    bounds: np.ndarray = np.linspace(0, pixels.shape[0], sample_size + 1).astype(np.int64)
+    offsets: np.ndarray = np.random.default_rng(seed).random(sample_size) * (bounds[1:] - bounds[:-1])
+
+    return pixels[bounds[:-1] + offsets.astype(np.int64)]
+
+
+def assign_to_centroids(
+        pixels: np.ndarray, centroids: np.ndarray, chunk_size: int = K_MEANS_ASSIGN_CHUNK_SIZE
+) -> tuple[np.ndarray, float]:
+    """
+    Assigns every pixel to its nearest centroid. The pixels are processed in chunks, such that the distances to all
+    centroids never have to be stored for all pixels at once.
+
+    :param pixels: The pixels in format {pixel, channel}
+    :param centroids: The centroids in format {centroid, channel}
+    :param chunk_size: The number of pixels that is assigned at once
+    :return: The index of the nearest centroid of every pixel, and the sum of the squared distances of the pixels to
+        their nearest centroid
+    """
+
+    centroids = centroids.astype(np.float64)
+    centroid_norms: np.ndarray = np.sum(centroids ** 2, axis=1)
+
+    labels: np.ndarray = np.empty(pixels.shape[0], dtype=np.int32)
+    inertia: float = 0
+    for start in range(0, pixels.shape[0], chunk_size):
+        chunk: np.ndarray = pixels[start:start + chunk_size].astype(np.float64)
+
+        # |x - c|^2 = |x|^2 - 2 x.c + |c|^2, where |x|^2 does not change the nearest centroid
+        distances: np.ndarray = centroid_norms - 2 * chunk @ centroids.T
+        chunk_labels: np.ndarray = np.argmin(distances, axis=1)
+
+        labels[start:start + chunk.shape[0]] = chunk_labels
+        nearest: np.ndarray = distances[np.arange(chunk.shape[0]), chunk_labels] + np.sum(chunk ** 2, axis=1)
+        inertia += float(np.sum(np.maximum(nearest, 0)))
+
+    return labels, inertia
+
+
+def fit_mini_batch_k_means(pixels: np.ndarray, k: int, nr_of_attempts: int = 3, seed: int = 0) -> KMeansResult:
+    """
+    Clusters pixels with mini-batch k-means. The centroids are trained on a stratified sample of the pixels, after
+    which all pixels are assigned to their nearest centroid. Finally, every centroid is moved to the mean of the pixels
+    assigned to it, as the centroids of mini-batch k-means only approximate the means of their clusters.
+
+    :param pixels: The pixels in format {pixel, channel}
+    :param k: The number of clusters
+    :param nr_of_attempts: The number of initializations of the centroids, the best one is kept
+    :param seed: The seed of the random generators
+    :return: The centroids, the label of every pixel, the inertia and the time it took to cluster the pixels
+    """
+
+    start: float = perf_counter()
+
+    sample: np.ndarray = stratified_sample(pixels, get_k_means_sample_size(), seed)
+    k = min(k, sample.shape[0])
+
+    k_means: MiniBatchKMeans = MiniBatchKMeans(
+        n_clusters=k, batch_size=K_MEANS_BATCH_SIZE, n_init=max(1, nr_of_attempts), random_state=seed
+    ).fit(sample)
+
+    labels, _ = assign_to_centroids(pixels, k_means.cluster_centers_)
+
+    # move the centroids to the means of their clusters, centroids without pixels are kept
+    counts: np.ndarray = np.bincount(labels, minlength=k)
+    sums: np.ndarray = np.stack(
+        [np.bincount(labels, weights=pixels[:, channel], minlength=k) for channel in range(pixels.shape[1])], axis=1
+    )
+    centroids: np.ndarray = k_means.cluster_centers_.astype(np.float64)
+    centroids[counts > 0] = sums[counts > 0] / counts[counts > 0, None]
+
+    # the sum of the squared distances to the means, computed without another pass over the pixels
+    squared_norms: float = float(np.sum(np.square(pixels, dtype=np.float64)))
+    inertia: float = max(0.0, squared_norms - float(np.sum(counts * np.sum(centroids ** 2, axis=1))))
+
+    return KMeansResult(centroids.astype(np.float32), labels, inertia, perf_counter() - start)
+
+
+def fit_opencv_k_means(pixels: np.ndarray, k: int, nr_of_attempts: int = 10) -> KMeansResult:
+    """
+    Clusters pixels with the k-means implementation of OpenCV, using all pixels.
+
+    :param pixels: The pixels in format {pixel, channel}
+    :param k: The number of clusters
+    :param nr_of_attempts: the number of times the algorithm is executed using different initial labellings
+    :return: The centroids, the label of every pixel, the inertia and the time it took to cluster the pixels
+    """
+
+    start: float = perf_counter()
+
+    # set seed so results are consistent
+    cv2.setRNGSeed(0)
+
+    # criteria for stopping (stop the algorithm iteration if specified accuracy, eps, is reached or after max_iter
+    # iterations.)
+    # At most 50 iterations and at least 1.0 accuracy
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 50, 1.0)
+
+    inertia: float
+    labels: np.ndarray
+    centroids: np.ndarray
+    inertia, labels, centroids = cv2.kmeans(
+        np.float32(pixels), k, np.empty(0), criteria, nr_of_attempts, cv2.KMEANS_PP_CENTERS
+    )
+
+    return KMeansResult(centroids, labels.flatten(), float(inertia), perf_counter() - start)
+
+
+def fit_k_means(pixels: np.ndarray, k: int, nr_of_attempts: int = 10) -> KMeansResult:
+    """
+    Clusters pixels with the k-means engine configured under `cs-engine` in the backend config.
+
+    :param pixels: The pixels in format {pixel, channel}
+    :param k: The number of clusters
+    :param nr_of_attempts: The number of initializations of the centroids, the best one is kept
+    :return: The centroids, the label of every pixel, the inertia and the time it took to cluster the pixels
+    """
+
+    engine: str = get_k_means_engine()
+
+    result: KMeansResult
+    if engine == "mini-batch":
+        result = fit_mini_batch_k_means(pixels, k, nr_of_attempts)
+    else:
+        result = fit_opencv_k_means(pixels, k, nr_of_attempts)
+
+    LOG.info(
+        f"Clustered {pixels.shape[0]} pixels into {result.centroids.shape[0]} clusters with the {engine} engine in "
+        f"{result.fit_time:.3f} s, inertia {result.inertia:.1f}"
+    )
+
+    return result
@@ -12,7 +12,11 @@ from xrf_explorer.server.dim_reduction.general import (
     create_image_of_indices_to_embedding
 )
 from xrf_explorer.server.file_system import get_config
-from xrf_explorer.server.file_system.cubes import normalize_ndarray_to_grayscale, get_elemental_data_cube
+from xrf_explorer.server.file_system.cubes import (
+    normalize_ndarray_to_grayscale,
+    get_elemental_data_cube,
+    get_elemental_statistics
+)
 
 LOG: logging.Logger = logging.getLogger(__name__)
 
@@ -46,8 +50,8 @@ def apply_umap(data: np.ndarray, n_neighbors: int, min_dist: float, n_components
         return None
 
 
-def filter_elemental_cube(elemental_cube: np.ndarray, element: int,
-                          threshold: int, max_indices: int) -> tuple[np.ndarray, np.ndarray]:
+def filter_elemental_cube(elemental_cube: np.ndarray, element: int, threshold: int, max_indices: int,
+                          bounds: tuple[float, float] | None = None) -> tuple[np.ndarray, np.ndarray]:
     """
     Get indices for which the value of the given element in the normalized elemental data cube is above the threshold.
 
@@ -55,13 +59,14 @@ def filter_elemental_cube(elemental_cube: np.ndarray, element: int,
     :param element: The element to filter on
     :param threshold: The threshold to filter by
     :param max_indices: The maximum number of indices to return
+    :param bounds: The minimum and maximum of the elemental map of the element, if already known
     :return: Indices for which the value of the given element in the normalized elemental data cube is above the
         threshold; the reduced list of indices
     """
 
     # normalize the elemental map to [0, 255]
     # this is done so the threshold can be applied
-    normalized_elemental_map: np.ndarray = normalize_ndarray_to_grayscale(elemental_cube[element])
+    normalized_elemental_map: np.ndarray = normalize_ndarray_to_grayscale(elemental_cube[element], bounds=bounds)
 
     # get all indices for which the intensity of the given element is above the threshold
     all_indices: np.ndarray = np.argwhere(normalized_elemental_map >= threshold)
@@ -116,7 +121,11 @@ def generate_embedding(data_source: str, element: int, threshold: int, new_umap_
 
     # filter data
     max_samples: int = int(backend_config['dim-reduction']['max-samples'])
-    all_indices, reduced_indices = filter_elemental_cube(data_cube, element, threshold, max_samples)
+    statistics: dict | None = get_elemental_statistics(data_source)
+    bounds: tuple[float, float] | None = None if statistics is None else (
+        statistics["min"][element], statistics["max"][element]
+    )
+    all_indices, reduced_indices = filter_elemental_cube(data_cube, element, threshold, max_samples, bounds)
     filtered_data: np.ndarray = data_cube[:, reduced_indices[:, 0], reduced_indices[:, 1]].transpose()
 
     # compute embedding
@@ -1,2 +1,12 @@
 """This module handles everything related to routing, storing, or extracting files in the backend of the application."""
-from .helper import set_config, get_config, get_path_to_generated_folder, data_source_name_from_cube_path
+from .helper import (
+    set_config,
+    get_config,
+    get_path_to_generated_folder,
+    data_source_name_from_cube_path,
+    get_file_signature,
+    load_cached_array,
+    store_cached_array,
+    load_cached_json,
+    store_cached_json
+)
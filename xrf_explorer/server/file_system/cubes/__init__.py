@@ -1,5 +1,6 @@
 """Module that handles everything related to the raw and elemental data cubes."""
 
+from .selection import SelectionMask
 from .elemental import (
     normalize_ndarray_to_grayscale,
     get_elemental_map,
@@ -9,7 +10,29 @@ from .elemental import (
     get_element_averages_selection,
     convert_elemental_cube_to_dms,
     get_elemental_data_cube,
+    get_elemental_cache_statistics,
+    clear_elemental_cache,
     normalize_elemental_cube_per_layer,
+    get_elemental_statistics,
+    get_elemental_bounds
 )
-from .spectral import parse_rpl, get_spectra_params, get_raw_data, bin_data, update_bin_params
-from .convert_dms import get_elemental_datacube_dimensions
+from .spectral import (
+    parse_rpl,
+    get_rpl_info,
+    RplInfo,
+    get_spectra_params,
+    get_raw_data,
+    get_chunk_size,
+    bin_data,
+    update_bin_params
+)
+from .elemental_maps import (
+    NORMALIZATION_MODES,
+    DEFAULT_NORMALIZATION_MODE,
+    get_elemental_map_etag,
+    get_elemental_map_bounds,
+    get_rendered_elemental_map,
+    prerender_elemental_maps,
+    start_prerender_elemental_maps
+)
+from .convert_dms import get_elemental_datacube_dimensions, get_dms_header, DmsHeader
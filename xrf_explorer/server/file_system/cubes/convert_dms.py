@@ -1,15 +1,111 @@
+from dataclasses import dataclass
 from logging import Logger, getLogger
+from os import replace
 from os.path import isdir, join
 from pathlib import Path
+from threading import Lock
 
 import numpy as np
 
-from xrf_explorer.server.file_system import data_source_name_from_cube_path
+from xrf_explorer.server.file_system import get_file_signature
 from xrf_explorer.server.file_system.workspace import get_elemental_cube_path
 
 LOG: Logger = getLogger(__name__)
 
 
+@dataclass(frozen=True, slots=True)
+class DmsHeader:
+    """The metadata of a dms file, which consists of an ASCII header, the data block and the element names."""
+    width: int
+    height: int
+    channels: int
+    header_size: int
+    dtype: np.dtype
+    elements: tuple[str, ...] | None
+
+
+# parsed headers of dms files, keyed by path, together with the modification time and size of the file
+DMS_HEADER_CACHE: dict[str, tuple[tuple[int, int], DmsHeader]] = {}
+DMS_HEADER_CACHE_LOCK: Lock = Lock()
+
+
+def read_dms_header(path: str | Path) -> DmsHeader:
+    """
+    Read the header and the element names of a dms file, with a single open of the file.
+    Can raise error if file could not be read.
+
+    :param path: Path to the dms file containing the elemental data cube.
+    :return: The metadata of the dms file.
+    """
+
+    dtype: np.dtype = np.dtype(np.float32)
+
+    with open(path, 'rb') as file:
+        # Read the first line and ignore it (doesn't include important data)
+        file.readline()
+
+        # Read the second line and parse it into the dimensions
+        width, height, channels = [int(dim) for dim in file.readline().decode('ascii').strip().split()]
+
+        # Save the size of the header
+        header_size: int = file.tell()
+
+        # Go to elemental names, after the data block
+        file.seek(header_size + width * height * channels * dtype.itemsize)
+
+        # Read all element names, a file with unreadable names can still be used for its data
+        names: tuple[str, ...] | None
+        try:
+            names = tuple(line.decode('utf-8').strip() for line in file.readlines())
+        except UnicodeDecodeError as e:
+            LOG.warning(f"Could not read the element names of {path}: {e}")
+            names = None
+
+    return DmsHeader(width, height, channels, header_size, dtype, names)
+
+
+def get_dms_header(path: str | Path) -> DmsHeader:
+    """
+    Get the header and the element names of a dms file, as read by `read_dms_header`. The header is cached, and only
+    read again if the file was modified.
+    Can raise error if file could not be read.
+
+    :param path: Path to the dms file containing the elemental data cube.
+    :return: The metadata of the dms file.
+    """
+
+    path = str(path)
+    signature: tuple[int, int] | None = get_file_signature(path)
+    if signature is None:
+        raise FileNotFoundError(f"Could not find dms file {path}")
+
+    with DMS_HEADER_CACHE_LOCK:
+        cached: tuple[tuple[int, int], DmsHeader] | None = DMS_HEADER_CACHE.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+    header: DmsHeader = read_dms_header(path)
+
+    with DMS_HEADER_CACHE_LOCK:
+        DMS_HEADER_CACHE[path] = (signature, header)
+
+    return header
+
+
+def clear_dms_header_cache(path: str | Path | None = None):
+    """
+    Removes the header of a dms file from the cache, or all headers if no path is given.
+
+    :param path: Path to the dms file to remove from the cache.
+    """
+
+    with DMS_HEADER_CACHE_LOCK:
+        if path is None:
+            DMS_HEADER_CACHE.clear()
+        else:
+            DMS_HEADER_CACHE.pop(str(path), None)
+
+
 def get_elemental_datacube_dimensions(data_source: str) -> tuple[int, int, int, int] | None:
     """
     Get the dimensions of the elemental datacube.
@@ -25,20 +121,9 @@ def get_elemental_datacube_dimensions(data_source: str) -> tuple[int, int, int,
         LOG.error(f"Could not retrieve the dimensions of the data cube at {data_source}")
         return None
 
-    with open(cube_path, 'rb') as file:
-        # Read the first line and ignore it (doesn't include important data)
-        file.readline()
-
-        # Read the second line
-        dimensions_list: list[str] = file.readline().decode('ascii').strip().split()
+    header: DmsHeader = get_dms_header(cube_path)
 
-        # Parse the second line into the dimensions
-        dimensions: list[int] = [int(dim) for dim in dimensions_list]
-
-        # Save the size of the header
-        header_size: int = file.tell()
-
-        return (*dimensions, header_size)
+    return header.width, header.height, header.channels, header.header_size
 
 
 def get_elements_from_dms(path: str | Path) -> list[str]:
@@ -50,75 +135,57 @@ def get_elements_from_dms(path: str | Path) -> list[str]:
     :return: List of the names of the elements.
     """
 
-    # data dimensions
-    data_source: str = data_source_name_from_cube_path(path)
-    (width, height, channels, header_size) = get_elemental_datacube_dimensions(data_source)
-
-    with open(path, 'rb') as f:
-        # Calculate total offset 
-        total_offset: int = header_size + width * height * channels * 4
-
-        # Go to elemental names
-        f.seek(total_offset)
+    elements: tuple[str, ...] | None = get_dms_header(path).elements
+    if elements is None:
+        raise ValueError(f"Could not read the element names of {path}")
 
-        # Read all element names
-        names: list[str] = []
-        while line := f.readline():
-            names.append(line.decode('utf-8').strip())
-
-        return names
+    return list(elements)
 
 
 def get_elemental_data_cube_from_dms(path: str | Path) -> np.ndarray:
     """
-    Get the elemental data cube from the dms file.
+    Get the elemental data cube from the dms file. The data cube is memory mapped, so it is not copied into memory.
     Can raise error if file could not be read.
 
     :param path: Path to the dms file containing the elemental data cube.
-    :return: 3-dimensional numpy array containing the elemental data cube. First dimension is channel, and last two for
+    :return: 3-dimensional read-only memory map of the elemental data cube. First dimension is channel, and last two for
         x, y coordinates
     """
 
     # get data dimensions
-    data_source: str = data_source_name_from_cube_path(path)
-    dimensions: tuple[int, int, int, int] | None = get_elemental_datacube_dimensions(data_source)
-    if dimensions is None:
-        LOG.error("Could not get elemental datacube dimensions")
-        return np.empty(0)
-    (w, h, c, header_size) = dimensions
-
-    # list of raw elemental data
-    list_raw_elemental_cube: np.ndarray = np.fromfile(path, offset=header_size, count=w * h * c, dtype=np.float32)
+    header: DmsHeader = get_dms_header(path)
 
-    # reshape the raw elemental data
-    return list_raw_elemental_cube.reshape(c, h, w)
+    # map the raw elemental data, the file is only read when the data is accessed
+    return np.memmap(
+        path, dtype=header.dtype, mode='r', offset=header.header_size,
+        shape=(header.channels, header.height, header.width)
+    )
 
 
 def get_elemental_map_from_dms(element: int, path: str | Path) -> np.ndarray:
     """
-    Get the elemental map of the given element from the dms file.
+    Get the elemental map of the given element from the dms file. The elemental map is memory mapped, so it is not
+    copied into memory.
     Can raise error if file could not be read.
 
     :param element: Index of the element in the elemental data cube.
     :param path: Path to the dms file containing the elemental data cube.
-    :return: 2-dimensional numpy array containing the elemental map. Dimensions are the x, y coordinates.
+    :return: 2-dimensional read-only memory map of the elemental map. Dimensions are the x, y coordinates.
     """
 
     # get data dimensions
-    data_source: str = data_source_name_from_cube_path(path)
-    (w, h, _, header_size) = get_elemental_datacube_dimensions(data_source)
+    header: DmsHeader = get_dms_header(path)
+    if not 0 <= element < header.channels:
+        raise ValueError(f"Element {element} is not in the elemental data cube with {header.channels} elements")
 
     # size of the elemental map in bytes
-    bytes_elemental_map: int = w * h * 4
+    bytes_elemental_map: int = header.width * header.height * header.dtype.itemsize
 
     # total offset to the beginning of the elemental map
-    total_offset: int = header_size + element * bytes_elemental_map
-
-    # list of raw elemental map
-    list_raw_elemental_cube: np.ndarray = np.fromfile(path, offset=total_offset, count=w * h, dtype=np.float32)
+    total_offset: int = header.header_size + element * bytes_elemental_map
 
-    # reshape the raw elemental map
-    return list_raw_elemental_cube.reshape(h, w)
+    # map only the elemental map, such that only its pages are read from the file
+    return np.memmap(path, dtype=header.dtype, mode='r', offset=total_offset, shape=(header.height, header.width))
 
 
 def to_dms(folder_path: str, name_cube: str, cube: np.ndarray, elements: list[str]) -> bool:
@@ -146,13 +213,16 @@ def to_dms(folder_path: str, name_cube: str, cube: np.ndarray, elements: list[st
     # Get the shape of the elemental data cube
     c, h, w = cube.shape
 
-    # Write the elemental data cube to a DMS file
+    # Write the elemental data cube to a DMS file, the file is replaced at once, such that memory maps of a previous
+    # version of the file remain valid
     try:
-        with open(path_cube, 'wb+') as f:
+        with open(f"{path_cube}.tmp", 'wb+') as f:
             f.write(b'2\n')
             f.write("{0} {1} {2}\n".format(w, h, c).encode())
             f.write(cube.tobytes())
             f.write('\n'.join(elements).encode())
+        replace(f"{path_cube}.tmp", path_cube)
+        clear_dms_header_cache(path_cube)
     except OSError as e:
         LOG.error(f"Error while writing elemental map to dms: {e}")
         return False
@@ -1,8 +1,9 @@
-import json
-
+from collections import OrderedDict
+from copy import deepcopy
 from logging import Logger, getLogger
 from os import remove
-from os.path import basename, dirname, splitext
+from os.path import basename, dirname, join, splitext
+from threading import Lock
 
 import numpy as np
 
@@ -17,39 +18,70 @@ from xrf_explorer.server.file_system.cubes.convert_dms import (
     get_elements_from_dms,
     to_dms
 )
-
+from xrf_explorer.server.file_system.cubes.selection import SelectionMask
+
+from xrf_explorer.server.file_system import (
+    get_config,
+    get_file_signature,
+    get_path_to_generated_folder,
+    load_cached_json,
+    store_cached_json
+)
 from xrf_explorer.server.file_system.workspace import (
     get_path_to_workspace,
     get_elemental_cube_path,
-    get_elemental_cube_path_from_name
+    get_elemental_cube_path_from_name,
+    read_workspace,
+    write_workspace
 )
 
 LOG: Logger = getLogger(__name__)
 
+DEFAULT_ELEMENTAL_CACHE_SIZE: int = 1024 ** 3
+
+# parsed elemental data cubes, keyed by path, modification time and size, in least recently used order
+ELEMENTAL_CUBE_CACHE: OrderedDict[tuple[str, int, int], np.ndarray] = OrderedDict()
+ELEMENTAL_CUBE_CACHE_STATISTICS: dict[str, int] = {"hits": 0, "misses": 0}
+ELEMENTAL_CUBE_CACHE_LOCK: Lock = Lock()
+
+ELEMENTAL_STATISTICS_FILE_NAME: str = 'elemental_statistics.json'
+ELEMENTAL_HISTOGRAM_BINS: int = 256
+
+# statistics of the elemental data cubes, keyed by the path of the cube, together with the key they were computed for
+ELEMENTAL_STATISTICS_CACHE: dict[str, tuple[dict[str, int], dict]] = {}
+ELEMENTAL_STATISTICS_LOCK: Lock = Lock()
+
 
-def normalize_ndarray_to_grayscale(array: np.ndarray, upper_bound: int = 255) -> np.ndarray:
+def normalize_ndarray_to_grayscale(
+        array: np.ndarray, upper_bound: int = 255, bounds: tuple[float, float] | None = None
+) -> np.ndarray:
     """
     Map all values in the given array to the interval [0, upper_bound].
 
     :param upper_bound: upper bound of the normalization interval.
     :param array: n-dimensional numpy array.
+    :param bounds: the minimum and maximum of the array, if already known. Computed from the array otherwise.
     :return: a copy of the array with values mapped to the interval [0, upper_bound].
     """
 
     # normalize data
-    (min_val, max_val) = array.min(), array.max()
+    (min_val, max_val) = (array.min(), array.max()) if bounds is None else bounds
     normalized_array: np.ndarray = (array - min_val) / (max_val - min_val)
 
     # obtain image of elemental abundance at every pixel of elemental image
     return np.rint(normalized_array * upper_bound).astype(np.uint8)
 
 
-def normalize_elemental_cube_per_layer(raw_cube: np.ndarray) -> np.ndarray:
+def normalize_elemental_cube_per_layer(
+        raw_cube: np.ndarray, bounds: tuple[list[float], list[float]] | None = None
+) -> np.ndarray:
     """
     Normalize the raw elemental data cube.
 
     :param raw_cube: 3-dimensional numpy array containing the normalized elemental data. First dimension is channel, and
         last two for x, y coordinates.
+    :param bounds: the minimum and maximum of every channel, as stored in the statistics of the cube. Computed from the
+        cube otherwise.
     :return: 3-dimensional numpy array containing the normalized elemental data. First dimension is channel, and last
         two for x, y coordinates.
     """
@@ -62,24 +94,129 @@ def normalize_elemental_cube_per_layer(raw_cube: np.ndarray) -> np.ndarray:
 
     # Normalize each channel separately
     for i in range(number_of_channels):
-        normalized_cube[i] = normalize_ndarray_to_grayscale(raw_cube[i])
+        channel_bounds: tuple[float, float] | None = None if bounds is None else (bounds[0][i], bounds[1][i])
+        normalized_cube[i] = normalize_ndarray_to_grayscale(raw_cube[i], bounds=channel_bounds)
 
     return normalized_cube
 
 
+def get_elemental_cache_size() -> int:
+    """
+    Gets the maximum number of bytes of elemental data cubes that are kept in memory, as set under
+    `elemental-cache-size` in the configuration.
+
+    :return: The cache size in bytes, 0 if caching is disabled
+    """
+
+    config: dict | None = get_config()
+    if not config:
+        return DEFAULT_ELEMENTAL_CACHE_SIZE
+
+    return max(0, int(config.get("elemental-cache-size", DEFAULT_ELEMENTAL_CACHE_SIZE)))
+
+
+def get_cube_memory_size(elemental_cube: np.ndarray) -> int:
+    """
+    Gets the number of bytes an elemental data cube takes up in memory. Memory mapped cubes are only read from their
+    file when accessed, so they do not take up any memory themselves.
+
+    :param elemental_cube: The elemental data cube.
+    :return: The size of the cube in memory in bytes.
+    """
+
+    if isinstance(elemental_cube, np.memmap):
+        return 0
+
+    return elemental_cube.nbytes
+
+
+def get_elemental_cache_statistics() -> dict[str, int]:
+    """
+    Get the statistics of the elemental data cube cache.
+
+    :return: Dictionary with the number of cache hits and misses, the number of cached cubes and their total size in
+        bytes.
+    """
+
+    with ELEMENTAL_CUBE_CACHE_LOCK:
+        return {
+            "hits": ELEMENTAL_CUBE_CACHE_STATISTICS["hits"],
+            "misses": ELEMENTAL_CUBE_CACHE_STATISTICS["misses"],
+            "entries": len(ELEMENTAL_CUBE_CACHE),
+            "bytes": sum(get_cube_memory_size(cube) for cube in ELEMENTAL_CUBE_CACHE.values())
+        }
+
+
+def clear_elemental_cache():
+    """
+    Removes all elemental data cubes and their computed statistics from memory and resets the statistics of the cache.
+    """
+
+    with ELEMENTAL_CUBE_CACHE_LOCK:
+        ELEMENTAL_CUBE_CACHE.clear()
+        ELEMENTAL_CUBE_CACHE_STATISTICS["hits"] = 0
+        ELEMENTAL_CUBE_CACHE_STATISTICS["misses"] = 0
+
+    with ELEMENTAL_STATISTICS_LOCK:
+        ELEMENTAL_STATISTICS_CACHE.clear()
+
+
+def cache_elemental_data_cube(key: tuple[str, int, int], elemental_cube: np.ndarray):
+    """
+    Adds an elemental data cube to the cache, evicting the least recently used cubes until the cache fits its size.
+    Only the cubes that are in memory count towards the size of the cache, see `get_cube_memory_size`. Older versions
+    of the same file are removed from the cache.
+
+    :param key: The path, modification time and size of the file of the cube.
+    :param elemental_cube: The read-only elemental data cube.
+    """
+
+    cache_size: int = get_elemental_cache_size()
+    if cache_size == 0 or get_cube_memory_size(elemental_cube) > cache_size:
+        return
+
+    with ELEMENTAL_CUBE_CACHE_LOCK:
+        for cached_key in [cached_key for cached_key in ELEMENTAL_CUBE_CACHE if cached_key[0] == key[0]]:
+            del ELEMENTAL_CUBE_CACHE[cached_key]
+
+        ELEMENTAL_CUBE_CACHE[key] = elemental_cube
+
+        total: int = sum(get_cube_memory_size(cube) for cube in ELEMENTAL_CUBE_CACHE.values())
+        while total > cache_size:
+            _, evicted = ELEMENTAL_CUBE_CACHE.popitem(last=False)
+            total -= get_cube_memory_size(evicted)
+
+
 def get_elemental_data_cube(data_source: str) -> np.ndarray:
     """
-    Get the elemental data cube at the given path.
+    Get the elemental data cube at the given path. The cube is cached in memory, so repeated calls for an unchanged
+    file return the same read-only array without reading the file again.
 
     :param data_source: the path to the .raw file
-    :return: 3-dimensional numpy array containing the elemental data cube. First dimension is channel, and last two for
-        x, y coordinates.
+    :return: 3-dimensional read-only numpy array containing the elemental data cube. First dimension is channel, and
+        last two for x, y coordinates.
     """
     path_to_elemental_cube: str | None = get_elemental_cube_path(data_source)
     if path_to_elemental_cube is None:
         LOG.error(f"Could not get path to elemental datacube of data source {data_source}")
         return np.empty(0)
 
+    # the cached cube is valid as long as the file is not modified
+    signature: tuple[int, int] | None = get_file_signature(path_to_elemental_cube)
+    key: tuple[str, int, int] | None = None
+    if signature is not None:
+        key = (path_to_elemental_cube, signature[0], signature[1])
+
+        with ELEMENTAL_CUBE_CACHE_LOCK:
+            cached_cube: np.ndarray | None = ELEMENTAL_CUBE_CACHE.get(key)
+            if cached_cube is not None:
+                ELEMENTAL_CUBE_CACHE.move_to_end(key)
+                ELEMENTAL_CUBE_CACHE_STATISTICS["hits"] += 1
+                LOG.info(f"Elemental data cube loaded from cache. Shape: {cached_cube.shape}")
+                return cached_cube
+
+            ELEMENTAL_CUBE_CACHE_STATISTICS["misses"] += 1
+
     LOG.info(f"Reading elemental data cube from {path_to_elemental_cube}")
 
     # Get the elemental data cube
@@ -99,6 +236,11 @@ def get_elemental_data_cube(data_source: str) -> np.ndarray:
 
     LOG.info(f"Elemental data cube loaded. Shape: {elemental_cube.shape}")
 
+    # the cube is shared between all callers, so it may not be modified
+    elemental_cube.setflags(write=False)
+    if key is not None and elemental_cube.size > 0:
+        cache_elemental_data_cube(key, elemental_cube)
+
     return elemental_cube
 
 
@@ -196,6 +338,123 @@ def get_short_element_names(data_source: str) -> list[str]:
     return short_names
 
 
+def normalize_element_averages(averages: np.ndarray, bounds: tuple[float, float], upper_bound: int = 100) -> np.ndarray:
+    """
+    Map the averages of the channels of an elemental data cube to the interval [0, upper_bound], in the same way as
+    `normalize_ndarray_to_grayscale` maps the cube itself. Normalizing the averages instead of the cube avoids copying
+    the whole cube.
+
+    :param averages: the average of every channel of the elemental data cube.
+    :param bounds: the minimum and maximum of the whole elemental data cube.
+    :param upper_bound: upper bound of the normalization interval.
+    :return: the averages mapped to the interval [0, upper_bound].
+    """
+
+    (min_val, max_val) = bounds
+    if max_val == min_val:
+        return np.zeros_like(averages)
+
+    return (averages - min_val) / (max_val - min_val) * upper_bound
+
+
+def compute_elemental_statistics(cube: np.ndarray) -> dict[str, list]:
+    """
+    Computes the statistics of every channel of an elemental data cube. The channels are processed one at a time, such
+    that the cube never has to be fully copied into memory.
+
+    :param cube: the elemental data cube, in format {channel, y, x}
+    :return: dictionary with for every channel the minimum, maximum, mean, standard deviation, number of nonzero values
+        and a histogram of `ELEMENTAL_HISTOGRAM_BINS` bins between the minimum and maximum of the channel
+    """
+
+    statistics: dict[str, list] = {"min": [], "max": [], "mean": [], "std": [], "nonzero": [], "histogram": []}
+
+    for channel in cube:
+        values: np.ndarray = np.asarray(channel, dtype=np.float64)
+        min_val: float = float(values.min())
+        max_val: float = float(values.max())
+
+        statistics["min"].append(min_val)
+        statistics["max"].append(max_val)
+        statistics["mean"].append(float(values.mean()))
+        statistics["std"].append(float(values.std()))
+        statistics["nonzero"].append(int(np.count_nonzero(values)))
+        statistics["histogram"].append(
+            np.histogram(values, bins=ELEMENTAL_HISTOGRAM_BINS, range=(min_val, max_val))[0].tolist()
+        )
+
+    return statistics
+
+
+def get_elemental_statistics(data_source: str) -> dict | None:
+    """
+    Gets the statistics of every channel of the elemental data cube of a data source, as computed by
+    `compute_elemental_statistics`. The statistics are stored in the generated folder of the data source, and only
+    recomputed if the elemental data cube changed since.
+
+    :param data_source: name of the data source to get the statistics of
+    :return: the statistics of the elemental data cube, or None if an error occurred
+    """
+
+    # get the signature of the elemental data cube
+    path_to_cube: str | None = get_elemental_cube_path(data_source)
+    signature: tuple[int, int] | None = None if path_to_cube is None else get_file_signature(path_to_cube)
+    if signature is None:
+        LOG.error(f"Could not find elemental data cube of data source {data_source}")
+        return None
+
+    # the statistics are valid as long as the elemental data cube remains the same
+    key: dict[str, int] = {"mtime": signature[0], "size": signature[1]}
+
+    cached: tuple[dict[str, int], dict] | None = ELEMENTAL_STATISTICS_CACHE.get(path_to_cube)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    # the statistics are only kept in memory if they cannot be stored in the generated folder
+    path_to_generated_folder: str = get_path_to_generated_folder(data_source)
+    path_to_statistics: str | None = None
+    if path_to_generated_folder:
+        path_to_statistics = join(path_to_generated_folder, ELEMENTAL_STATISTICS_FILE_NAME)
+
+    with ELEMENTAL_STATISTICS_LOCK:
+        # use the stored statistics if they are up-to-date
+        statistics: dict | None = None
+        if path_to_statistics is not None:
+            statistics = load_cached_json(path_to_statistics, key)
+
+        if statistics is None:
+            LOG.info(f"Computing elemental statistics of data source {data_source}")
+
+            cube: np.ndarray = get_elemental_data_cube(data_source)
+            if cube.size == 0:
+                return None
+
+            statistics = compute_elemental_statistics(cube)
+            if path_to_statistics is not None:
+                store_cached_json(path_to_statistics, key, statistics)
+            else:
+                statistics["key"] = key
+
+        ELEMENTAL_STATISTICS_CACHE[path_to_cube] = (key, statistics)
+
+    return statistics
+
+
+def get_elemental_bounds(data_source: str) -> tuple[float, float] | None:
+    """
+    Gets the minimum and maximum of the whole elemental data cube of a data source from its statistics.
+
+    :param data_source: name of the data source
+    :return: the minimum and maximum of the elemental data cube, or None if an error occurred
+    """
+
+    statistics: dict | None = get_elemental_statistics(data_source)
+    if statistics is None or not statistics["min"]:
+        return None
+
+    return min(statistics["min"]), max(statistics["max"])
+
+
 def get_element_averages(data_source: str) -> list[dict[str, str | float]]:
     """
     Get the names and averages of the elements present in the painting.
@@ -204,20 +463,18 @@ def get_element_averages(data_source: str) -> list[dict[str, str | float]]:
     :return: List of the names, channels and average composition of the elements.
     """
 
-    # Get the elemental data cube and the names of the elements
-    raw_cube: np.ndarray = get_elemental_data_cube(data_source)
+    # Get the statistics of the elemental data cube and the names of the elements
+    statistics: dict | None = get_elemental_statistics(data_source)
     names: list[str] = get_short_element_names(data_source)
 
     # Check if the data was loaded correctly
-    if raw_cube.size == 0 or names == []:
+    if statistics is None or names == []:
         LOG.error("Couldn't parse elemental image cube or list of names")
         return []
 
-    # Normalize the elemental data cube
-    image_cube: np.ndarray = normalize_ndarray_to_grayscale(raw_cube, 100)
-
-    # Calculate the average composition of the elements
-    averages: np.ndarray = np.mean(image_cube, axis=(1, 2))
+    # The average composition of the elements, normalized as the cube would be normalized to [0, 100]
+    bounds: tuple[float, float] = (min(statistics["min"]), max(statistics["max"]))
+    averages: np.ndarray = normalize_element_averages(np.array(statistics["mean"]), bounds)
 
     # Create a list of dictionaries with the name and average composition of the elements
     composition: list[dict[str, str | float]] = \
@@ -228,27 +485,41 @@ def get_element_averages(data_source: str) -> list[dict[str, str | float]]:
     return composition
 
 
-def get_element_averages_selection(data_source: str, mask: np.ndarray) -> list[dict[str, str | float]]:
+def get_element_averages_selection(
+        data_source: str, mask: np.ndarray | SelectionMask
+) -> list[dict[str, str | float]]:
     """
     Get the names and averages of the elements present in (a subarea of) the painting.
 
     :param data_source: The data source to get the selection averages from.
-    :param mask: A 2D mask of the selected pixels
+    :param mask: A 2D mask of the selected pixels, either over the whole cube or as a `SelectionMask`
     :return: List of the names, channels and average composition of the elements.
     """
     # Get the elemental data cube and the names of the elements
     raw_cube: np.ndarray = get_elemental_data_cube(data_source)
     names: list[str] = get_short_element_names(data_source)
 
-    # Normalize the elemental data cube
-    image_cube: np.ndarray = normalize_ndarray_to_grayscale(raw_cube, 100)
+    # Check if the data was loaded correctly
+    if raw_cube.size == 0 or names == []:
+        LOG.error("Couldn't parse elemental image cube or list of names")
+        return []
+
+    # Crop the cube to the bounding box of the selection, such that only the selected rows and columns are read
+    selection: SelectionMask = mask if isinstance(mask, SelectionMask) else SelectionMask.from_array(mask)
 
-    length: int = image_cube.shape[0]
-    averages: np.ndarray = np.zeros(length)
+    averages: np.ndarray
+    if selection.box is None:
+        averages = np.zeros(raw_cube.shape[0])
+    else:
+        top, bottom, left, right = selection.box
+        cropped_cube: np.ndarray = raw_cube[:, top:bottom, left:right]
 
-    # Calculate the average composition of the elements in selection
-    for index in range(length):
-        averages[index] = np.ma.array(image_cube[index], mask=np.logical_not(mask)).mean()
+        # Calculate the average composition of all elements in the selection at once, in format {channel, pixel}
+        selected: np.ndarray = cropped_cube[:, selection.mask]
+        bounds: tuple[float, float] | None = get_elemental_bounds(data_source)
+        if bounds is None:
+            bounds = (float(raw_cube.min()), float(raw_cube.max()))
+        averages = normalize_element_averages(selected.mean(axis=1, dtype=np.float64), bounds)
 
     # Create a list of dictionaries with the name and average composition of the elements
     composition: list[dict[str, str | float]] = \
@@ -307,18 +578,15 @@ def convert_elemental_cube_to_dms(data_source: str, cube_name: str) -> bool:
         return False
 
     try:
-        with open(workspace_path, "r+") as file:
-            workspace: dict = json.load(file)
-
-            # Find the correct elemental data cube
-            for cube_info in workspace["elementalCubes"]:
-                if cube_info["name"] == cube_name:
-                    cube_info["dataLocation"] = f"{file_name}.dms"
-                    break
-
-            file.seek(0)
-            file.write(json.dumps(workspace))
-            file.truncate()
+        workspace: dict = deepcopy(read_workspace(workspace_path))
+
+        # Find the correct elemental data cube
+        for cube_info in workspace["elementalCubes"]:
+            if cube_info["name"] == cube_name:
+                cube_info["dataLocation"] = f"{file_name}.dms"
+                break
+
+        write_workspace(workspace_path, workspace)
     except Exception as e:
         LOG.error(f"Failed to update workspace: {str(e)}")
         return False
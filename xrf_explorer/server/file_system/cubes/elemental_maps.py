@@ -0,0 +1,192 @@
+from hashlib import sha1
+from io import BytesIO
+from logging import Logger, getLogger
+from os import listdir, makedirs, remove, replace
+from os.path import isfile, join
+from threading import Lock, Thread
+
+import numpy as np
+
+from PIL.Image import Image, fromarray
+
+from xrf_explorer.server.file_system import get_config, get_file_signature, get_path_to_generated_folder
+from xrf_explorer.server.file_system.cubes.elemental import (
+    get_elemental_map,
+    get_elemental_statistics,
+    normalize_ndarray_to_grayscale
+)
+from xrf_explorer.server.file_system.workspace import get_elemental_cube_path
+
+LOG: Logger = getLogger(__name__)
+
+ELEMENTAL_MAPS_FOLDER_NAME: str = 'elemental_maps'
+
+# the maps are either normalized over the bounds of their own channel, or over the bounds of the whole cube
+NORMALIZATION_MODES: tuple[str, ...] = ("channel", "cube")
+DEFAULT_NORMALIZATION_MODE: str = "channel"
+
+# rendering a map writes to a temporary file, make sure it is only written once at a time
+ELEMENTAL_MAPS_LOCK: Lock = Lock()
+
+
+def get_elemental_map_etag(data_source: str, channel: int, mode: str = DEFAULT_NORMALIZATION_MODE) -> str | None:
+    """
+    Gets the entity tag of a rendered elemental map. The tag is derived from the path, modification time and size of
+    the elemental data cube, the channel and the normalization mode, such that it can be computed without reading the
+    cube.
+
+    :param data_source: name of the data source
+    :param channel: the channel of the elemental map
+    :param mode: the normalization mode of the map, one of `NORMALIZATION_MODES`
+    :return: the entity tag of the map, or None if the elemental data cube could not be found
+    """
+
+    path_to_cube: str | None = get_elemental_cube_path(data_source)
+    signature: tuple[int, int] | None = None if path_to_cube is None else get_file_signature(path_to_cube)
+    if signature is None:
+        return None
+
+    return sha1(f"{path_to_cube}:{signature[0]}:{signature[1]}:{channel}:{mode}".encode()).hexdigest()
+
+
+def get_elemental_map_bounds(
+        data_source: str, channel: int, mode: str = DEFAULT_NORMALIZATION_MODE
+) -> tuple[float, float] | None:
+    """
+    Gets the bounds an elemental map is normalized over, from the statistics of the elemental data cube.
+
+    :param data_source: name of the data source
+    :param channel: the channel of the elemental map
+    :param mode: the normalization mode of the map, one of `NORMALIZATION_MODES`
+    :return: the minimum and maximum to normalize the map over, or None if the channel could not be found
+    """
+
+    statistics: dict | None = get_elemental_statistics(data_source)
+    if statistics is None or not 0 <= channel < len(statistics["min"]):
+        return None
+
+    if mode == "cube":
+        return min(statistics["min"]), max(statistics["max"])
+
+    return statistics["min"][channel], statistics["max"][channel]
+
+
+def render_elemental_map(data_source: str, channel: int, mode: str = DEFAULT_NORMALIZATION_MODE) -> bytes | None:
+    """
+    Renders an elemental map as a grayscale PNG image.
+
+    :param data_source: name of the data source
+    :param channel: the channel of the elemental map
+    :param mode: the normalization mode of the map, one of `NORMALIZATION_MODES`
+    :return: the encoded PNG image, or None if the map could not be rendered
+    """
+
+    path_to_cube: str | None = get_elemental_cube_path(data_source)
+    bounds: tuple[float, float] | None = get_elemental_map_bounds(data_source, channel, mode)
+    if path_to_cube is None or bounds is None:
+        LOG.error(f"Could not find elemental map {channel} of data source {data_source}")
+        return None
+
+    # normalize with the stored bounds, such that the map does not have to be scanned again
+    image_array: np.ndarray = get_elemental_map(channel, path_to_cube)
+    image: Image = fromarray(normalize_ndarray_to_grayscale(image_array, bounds=bounds)).convert("L")
+
+    with BytesIO() as image_io:
+        image.save(image_io, "png")
+        return image_io.getvalue()
+
+
+def get_rendered_elemental_map(data_source: str, channel: int, mode: str = DEFAULT_NORMALIZATION_MODE) -> str | None:
+    """
+    Gets the path to the rendered elemental map as rendered by `render_elemental_map`. The maps are stored in the
+    generated folder of the data source under their entity tag, such that they are only rendered once for every
+    version of the elemental data cube.
+
+    :param data_source: name of the data source
+    :param channel: the channel of the elemental map
+    :param mode: the normalization mode of the map, one of `NORMALIZATION_MODES`
+    :return: the path to the PNG image of the map, or None if the map could not be rendered
+    """
+
+    etag: str | None = get_elemental_map_etag(data_source, channel, mode)
+    path_to_generated_folder: str = get_path_to_generated_folder(data_source)
+    if etag is None or not path_to_generated_folder:
+        LOG.error(f"Could not find elemental data cube of data source {data_source}")
+        return None
+
+    path_to_maps: str = join(path_to_generated_folder, ELEMENTAL_MAPS_FOLDER_NAME)
+    path_to_map: str = join(path_to_maps, f"{etag}.png")
+    if isfile(path_to_map):
+        return path_to_map
+
+    with ELEMENTAL_MAPS_LOCK:
+        # the map might have been rendered while waiting for the lock
+        if isfile(path_to_map):
+            return path_to_map
+
+        image: bytes | None = render_elemental_map(data_source, channel, mode)
+        if image is None:
+            return None
+
+        # store the map, the file is replaced at once, such that it is never partially written
+        try:
+            makedirs(path_to_maps, exist_ok=True)
+            with open(f"{path_to_map}.tmp", 'wb') as file:
+                file.write(image)
+            replace(f"{path_to_map}.tmp", path_to_map)
+        except OSError as err:
+            LOG.error(f"Could not store elemental map {channel} of data source {data_source}: {err}")
+            return None
+
+    return path_to_map
+
+
+def prerender_elemental_maps(data_source: str) -> int:
+    """
+    Renders the maps of all channels of the elemental data cube of a data source in every normalization mode, and
+    removes the maps of previous versions of the cube.
+
+    :param data_source: name of the data source
+    :return: the number of maps that are rendered
+    """
+
+    statistics: dict | None = get_elemental_statistics(data_source)
+    if statistics is None:
+        LOG.error(f"Could not pre-render elemental maps of data source {data_source}")
+        return 0
+
+    rendered: set[str] = set()
+    for channel in range(len(statistics["min"])):
+        for mode in NORMALIZATION_MODES:
+            path_to_map: str | None = get_rendered_elemental_map(data_source, channel, mode)
+            if path_to_map is not None:
+                rendered.add(f"{get_elemental_map_etag(data_source, channel, mode)}.png")
+
+    # remove the maps of previous versions of the elemental data cube
+    path_to_maps: str = join(get_path_to_generated_folder(data_source), ELEMENTAL_MAPS_FOLDER_NAME)
+    with ELEMENTAL_MAPS_LOCK:
+        for file_name in listdir(path_to_maps) if rendered else []:
+            if file_name.endswith(".png") and file_name not in rendered:
+                remove(join(path_to_maps, file_name))
+
+    LOG.info(f"Pre-rendered {len(rendered)} elemental maps of data source {data_source}")
+    return len(rendered)
+
+
+def start_prerender_elemental_maps(data_source: str) -> Thread | None:
+    """
+    Starts pre-rendering the elemental maps of a data source in a background thread, as done by
+    `prerender_elemental_maps`. Only enabled if `prerender-elemental-maps` is set in the backend config.
+
+    :param data_source: name of the data source
+    :return: the thread rendering the maps, or None if pre-rendering is disabled
+    """
+
+    config: dict | None = get_config()
+    if config is None or not config.get("prerender-elemental-maps", False):
+        return None
+
+    thread: Thread = Thread(target=prerender_elemental_maps, args=(data_source,),
+                            name=f"prerender-elemental-maps-{data_source}", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,68 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass(frozen=True, slots=True)
+class SelectionMask:
+    """
+    A selection of pixels of a data cube, stored as the mask of the bounding box of the selected pixels, such that
+    small selections on large cubes stay small.
+    """
+    top: int
+    left: int
+    mask: np.ndarray
+    shape: tuple[int, int]
+
+    @classmethod
+    def from_array(cls, mask: np.ndarray) -> "SelectionMask":
+        """
+        Creates a selection from a mask over the whole data cube.
+
+        :param mask: 2-dimensional boolean mask over the data cube in format {y, x}
+        :return: The selection of the pixels selected in the mask
+        """
+        selection: np.ndarray = np.asarray(mask, dtype=bool)
+        shape: tuple[int, int] = (selection.shape[0], selection.shape[1])
+
+        rows: np.ndarray = np.flatnonzero(selection.any(axis=1))
+        if rows.size == 0:
+            return cls(0, 0, np.zeros((0, 0), dtype=bool), shape)
+        columns: np.ndarray = np.flatnonzero(selection.any(axis=0))
+
+        top, bottom = int(rows[0]), int(rows[-1]) + 1
+        left, right = int(columns[0]), int(columns[-1]) + 1
+
+        return cls(top, left, selection[top:bottom, left:right], shape)
+
+    @property
+    def bottom(self) -> int:
+        """The row below the last row of the mask, exclusive."""
+        return self.top + self.mask.shape[0]
+
+    @property
+    def right(self) -> int:
+        """The column after the last column of the mask, exclusive."""
+        return self.left + self.mask.shape[1]
+
+    @property
+    def box(self) -> tuple[int, int, int, int] | None:
+        """The box covered by the mask as (top, bottom, left, right), or None if no pixel is selected."""
+        if self.mask.size == 0:
+            return None
+        return self.top, self.bottom, self.left, self.right
+
+    @property
+    def count(self) -> int:
+        """The number of selected pixels."""
+        return int(np.count_nonzero(self.mask))
+
+    def to_array(self) -> np.ndarray:
+        """
+        Expands the selection to a mask over the whole data cube.
+
+        :return: 2-dimensional boolean mask over the data cube in format {y, x}
+        """
+        mask: np.ndarray = np.zeros(self.shape, dtype=bool)
+        mask[self.top:self.bottom, self.left:self.right] = self.mask
+        return mask
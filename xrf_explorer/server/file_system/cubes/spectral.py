@@ -1,22 +1,41 @@
+from copy import deepcopy
+from dataclasses import dataclass
 from logging import Logger, getLogger
 from math import ceil, floor
-from os import makedirs
-from os.path import join, isfile, isdir
+from os import makedirs, remove, replace
+from os.path import dirname, getsize, join, isfile, isdir
+from threading import Lock
 
 import numpy as np
-import json
 
-from xrf_explorer.server.file_system import get_path_to_generated_folder
+from xrf_explorer.server.file_system import get_config, get_file_signature, get_path_to_generated_folder
 from xrf_explorer.server.file_system.workspace import (
     get_raw_rpl_paths,
     get_workspace_dict,
     get_raw_rpl_names,
     set_binned
 )
-from xrf_explorer.server.file_system.workspace.workspace_handler import get_path_to_workspace
+from xrf_explorer.server.file_system.workspace.workspace_handler import get_path_to_workspace, write_workspace
 
 LOG: Logger = getLogger(__name__)
 
+# Default maximum number of bytes of a spectral cube that is processed at once
+DEFAULT_CHUNK_SIZE: int = 64 * 1024 ** 2
+
+
+def get_chunk_size() -> int:
+    """Gets the maximum number of bytes of a spectral cube that is processed at once when generating mipmaps or
+    binning, as set in the configuration.
+
+    :return: The chunk size in bytes
+    """
+
+    config: dict | None = get_config()
+    if not config:
+        return DEFAULT_CHUNK_SIZE
+
+    return int(config.get("spectral-chunk-size", DEFAULT_CHUNK_SIZE))
+
 
 def parse_rpl(path: str) -> dict:
     """Parse the rpl file of a data source as a dictionary, containing the following info:
@@ -60,6 +79,78 @@ def parse_rpl(path: str) -> dict:
     return parsed_rpl
 
 
+@dataclass(frozen=True, slots=True)
+class RplInfo:
+    """The layout of a raw data file as described by its rpl file."""
+    width: int
+    height: int
+    depth: int
+    offset: int
+    data_length: int
+    data_type: str
+    byte_order: str
+    record_by: str
+    depth_scale_origin: float | None
+
+    @property
+    def dtype(self) -> np.dtype:
+        """The numpy data type of the values in the raw data file."""
+        kinds: dict[str, str] = {"unsigned": "u", "signed": "i", "float": "f"}
+        order: str = ">" if self.byte_order == "big-endian" else "<"
+        return np.dtype(f"{order}{kinds[self.data_type]}{self.data_length}")
+
+
+# parsed rpl files, keyed by path, together with the modification time and size of the file
+RPL_INFO_CACHE: dict[str, tuple[tuple[int, int], RplInfo]] = {}
+RPL_INFO_CACHE_LOCK: Lock = Lock()
+
+
+def get_rpl_info(path: str) -> RplInfo | None:
+    """Get the layout of a raw data file from its rpl file, as parsed by `parse_rpl`. The layout is cached, and only
+    parsed again if the rpl file was modified.
+
+    :param path: path to the rpl file
+    :return: The layout of the raw data file, or None if the rpl file could not be read or is incomplete
+    """
+
+    signature: tuple[int, int] | None = get_file_signature(path)
+    if signature is not None:
+        with RPL_INFO_CACHE_LOCK:
+            cached: tuple[tuple[int, int], RplInfo] | None = RPL_INFO_CACHE.get(path)
+            if cached is not None and cached[0] == signature:
+                return cached[1]
+
+    # the names of the attributes are not case-sensitive
+    parsed_rpl: dict[str, str] = {key.lower(): value for key, value in parse_rpl(path).items()}
+    if not parsed_rpl:
+        return None
+
+    try:
+        info: RplInfo = RplInfo(
+            width=int(parsed_rpl["width"]),
+            height=int(parsed_rpl["height"]),
+            depth=int(parsed_rpl["depth"]),
+            offset=int(parsed_rpl.get("offset", 0)),
+            data_length=int(parsed_rpl.get("data-length", 2)),
+            data_type=parsed_rpl.get("data-type", "unsigned").lower(),
+            byte_order=parsed_rpl.get("byte-order", "little-endian").lower(),
+            record_by=parsed_rpl.get("record-by", "vector").lower(),
+            depth_scale_origin=float(parsed_rpl["depthscaleorigin"]) if "depthscaleorigin" in parsed_rpl else None
+        )
+
+        # check that the data type is known
+        _ = info.dtype
+    except (KeyError, ValueError, TypeError) as err:
+        LOG.error("error while parsing rpl file %s: {%s}", path, err)
+        return None
+
+    if signature is not None:
+        with RPL_INFO_CACHE_LOCK:
+            RPL_INFO_CACHE[path] = (signature, info)
+
+    return info
+
+
 def mipmap_exists(data_source: str, level: int) -> bool:
     """Checks if a specific mipmap level exists for a data source.
 
@@ -71,21 +162,111 @@ def mipmap_exists(data_source: str, level: int) -> bool:
     if level <= 0:
         return True
 
+    mipmap_path: str = get_mipmap_path(data_source, level)
+    if not mipmap_path:
+        return False
+
+    return isfile(mipmap_path)
+
+
+def get_mipmap_path(data_source: str, level: int) -> str:
+    """Gets the path to the raw data file of a specific mipmap level of a data source.
+
+    :param data_source: The data source to get the mipmap path for
+    :param level: The mipmap level, 0 is the original resolution
+    :return: The path to the raw data of the mipmap level. Empty string is returned in case of error.
+    """
+
     raw_name, _ = get_raw_rpl_names(data_source)
 
     # Get the path to the generated folder
     path_to_generated_folder: str = get_path_to_generated_folder(data_source)
     if not path_to_generated_folder:
         LOG.error(f"Could not get path to generated folder for {data_source}")
-        return False
+        return ""
 
-    mipmap_path: str = str(join(path_to_generated_folder, "mipmaps", str(level), raw_name))
+    return str(join(path_to_generated_folder, "mipmaps", str(level), raw_name))
 
-    return isfile(mipmap_path)
+
+def downsample_cube(data: np.ndarray) -> np.ndarray:
+    """Halves the width and height of (a row band of) a data cube by averaging every block of 2x2 pixels. Blocks on
+    an odd bottom or right edge are averaged over the pixels they contain.
+
+    :param data: 3-dimensional array in format {y, x, channel}
+    :return: 3-dimensional array of shape (ceil(height / 2), ceil(width / 2), channel) with the data type of the input
+    """
+
+    height, width, channels = data.shape
+
+    # Repeating the edge pixels keeps the mean of an incomplete block equal to the mean of the pixels it contains
+    if height % 2 or width % 2:
+        data = np.pad(data, ((0, height % 2), (0, width % 2), (0, 0)), mode="edge")
+
+    blocks: np.ndarray = data.reshape(data.shape[0] // 2, 2, data.shape[1] // 2, 2, channels)
+
+    return blocks.mean(axis=(1, 3)).astype(data.dtype)
+
+
+def write_mipmaps(data: np.ndarray, paths: list[str], chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """Computes consecutive mipmap levels of a data cube in a single pass and writes them to the given paths.
+
+    The cube is read in bands of rows, which are reduced to every level and written to disk before the next band is
+    read. A band can end halfway a block of 2x2 pixels at any level, so the last row of such a band is kept and
+    prepended to the next band of that level. Hence, the size of a band does not depend on the number of levels, and
+    the memory usage is bounded by the chunk size. Every file is first written next to its path and only moved into
+    place once complete.
+
+    :param data: 3-dimensional array in format {y, x, channel} to compute the mipmaps of
+    :param paths: The paths to write the mipmaps to, the first path is for the level directly above the data
+    :param chunk_size: The maximum number of bytes of the data that is read at once, at least a single row is read
+    """
+
+    # Create the files for all levels
+    mipmaps: list[np.memmap] = []
+    height, width, channels = data.shape
+    for path in paths:
+        height, width = ceil(height / 2.0), ceil(width / 2.0)
+        mipmaps.append(np.memmap(f"{path}.tmp", shape=(height, width, channels), dtype=data.dtype, mode="w+"))
+
+    row_size: int = max(1, data.shape[1] * channels * data.dtype.itemsize)
+    band_height: int = max(1, chunk_size // row_size)
+
+    # The unpaired row of the previous band of every level, and the next row to write of every level
+    carried: list[np.ndarray | None] = [None] * len(mipmaps)
+    rows: list[int] = [0] * len(mipmaps)
+
+    for band_start in range(0, data.shape[0], band_height):
+        band: np.ndarray = np.asarray(data[band_start:band_start + band_height])
+        last_band: bool = band_start + band_height >= data.shape[0]
+
+        # Every level is computed from the band of the level below it
+        for index, mipmap in enumerate(mipmaps):
+            if carried[index] is not None:
+                band = np.concatenate((carried[index], band))
+                carried[index] = None
+
+            # Keep an unpaired row for the next band, unless it is the bottom row of the level
+            if band.shape[0] % 2 and not last_band:
+                carried[index] = band[-1:]
+                band = band[:-1]
+            if band.shape[0] == 0:
+                break
+
+            band = downsample_cube(band)
+            mipmap[rows[index]:rows[index] + band.shape[0]] = band
+            rows[index] += band.shape[0]
+
+    # Write to disk and release the memory maps before moving the files
+    while mipmaps:
+        mipmaps.pop().flush()
+
+    for path in paths:
+        replace(f"{path}.tmp", path)
 
 
 def mipmap_raw_cube(data_source: str, level: int):
-    """Generates the mipmaps of the raw data in the data source up to the selected level.
+    """Generates the mipmaps of the raw data in the data source up to the selected level. All missing levels are
+    computed in a single pass over the highest existing level below the selected level.
 
     :param data_source: The data source to mipmap the data for
     :param level: The level to mipmap the data to, 0 is original resolution
@@ -93,41 +274,35 @@ def mipmap_raw_cube(data_source: str, level: int):
     if level <= 0:
         return
 
-    if not mipmap_exists(data_source, level - 1):
-        mipmap_raw_cube(data_source, level - 1)
+    # Find the highest level that can be used as source
+    base_level: int = level - 1
+    while base_level > 0 and not mipmap_exists(data_source, base_level):
+        base_level -= 1
 
     raw_name, _ = get_raw_rpl_names(data_source)
 
-    LOG.info("Mipmapping spectral cube %s to level %i", raw_name, level)
+    LOG.info("Mipmapping spectral cube %s from level %i to level %i", raw_name, base_level, level)
 
-    # Get the path to the generated folder
-    path_to_generated_folder: str = get_path_to_generated_folder(data_source)
-    if not path_to_generated_folder:
+    # Get raw data from the source level
+    data: np.ndarray = get_raw_data(data_source, base_level)
+    if data.size == 0:
+        LOG.error(f"Could not load level {base_level} of the spectral cube of {data_source}")
         return
 
-    mipmap_dir: str = join(path_to_generated_folder, "mipmaps", str(level))
-    mipmap_path: str = join(mipmap_dir, raw_name)
-
-    # Create directory for mipmap
-    if not isdir(mipmap_dir):
-        makedirs(mipmap_dir)
+    # Get the paths of all missing levels
+    mipmap_paths: list[str] = []
+    for mipmap_level in range(base_level + 1, level + 1):
+        mipmap_path: str = get_mipmap_path(data_source, mipmap_level)
+        if not mipmap_path:
+            return
 
-    # Get raw data from previous mipmap
-    data: np.ndarray = get_raw_data(data_source, level - 1)
+        # Create directory for mipmap
+        if not isdir(dirname(mipmap_path)):
+            makedirs(dirname(mipmap_path))
 
-    mipmapped: np.memmap = np.memmap(
-        mipmap_path,
-        shape=(ceil(data.shape[0] / 2.0), ceil(data.shape[1] / 2.0), data.shape[2]),
-        dtype=np.uint16,
-        mode="w+"
-    )
-
-    for y in range(mipmapped.shape[0]):
-        for x in range(mipmapped.shape[1]):
-            mipmapped[y, x, :] = np.mean(data[2 * y:2 * y + 2, 2 * x:2 * x + 2, :], axis=(0, 1))
+        mipmap_paths.append(mipmap_path)
 
-    # Write to disk
-    mipmapped.flush()
+    write_mipmaps(data, mipmap_paths, get_chunk_size())
 
     LOG.info("Finished mipmapping spectral cube %s to level %i", raw_name, level)
 
@@ -142,26 +317,30 @@ def get_raw_data(data_source: str, level: int = 0) -> np.memmap | np.ndarray:
     # get paths to files
     path_to_raw, path_to_rpl = get_raw_rpl_paths(data_source)
 
-    # get dimensions from rpl file
-    info = parse_rpl(path_to_rpl)
-    if not info:
+    # get dimensions and layout from rpl file
+    info: RplInfo | None = get_rpl_info(path_to_rpl)
+    if info is None:
         return np.empty(0)
-    width: int = ceil(int(info['width']) / (2 ** level))
-    height: int = ceil(int(info['height']) / (2 ** level))
+    if info.record_by not in ("vector", "dont-care"):
+        LOG.error(f"error while loading raw file: record-by {info.record_by} is not supported")
+        return np.empty(0)
+    width: int = ceil(info.width / (2 ** level))
+    height: int = ceil(info.height / (2 ** level))
+
+    # only the original raw file has a header, mipmaps only contain the data
+    offset: int = info.offset
 
     # get mipmapped cube
     if level > 0:
+        # generate all missing levels up to the requested level at once
         if not mipmap_exists(data_source, level):
             mipmap_raw_cube(data_source, level)
-        raw_name, _ = get_raw_rpl_names(data_source)
-
-        # Get the path to the generated folder
-        path_to_generated_folder: str = get_path_to_generated_folder(data_source)
-        if not path_to_generated_folder:
-            return np.array([])
 
         # Get path to raw file
-        path_to_raw: str = join(path_to_generated_folder, "mipmaps", str(level), raw_name)
+        path_to_raw: str = get_mipmap_path(data_source, level)
+        if not path_to_raw:
+            return np.array([])
+        offset = 0
 
     try:
         params: dict = get_spectra_params(data_source)
@@ -177,8 +356,10 @@ def get_raw_data(data_source: str, level: int = 0) -> np.memmap | np.ndarray:
 
     try:
         # load raw file and parse it as 3d array with correct dimensions
-        datacube: np.memmap = np.memmap(path_to_raw, dtype=np.uint16, mode='r', shape=(height, width, bin_nr))
-    except OSError as err:
+        datacube: np.memmap = np.memmap(
+            path_to_raw, dtype=info.dtype, mode='r', offset=offset, shape=(height, width, bin_nr)
+        )
+    except (OSError, ValueError) as err:
         LOG.error("error while loading raw file: {%s}", err)
         return np.empty(0)
     return datacube
@@ -198,9 +379,47 @@ def get_spectra_params(data_source: str) -> dict[str, int]:
     return workspace_dict["spectralParams"]
 
 
+def bin_channels(data: np.ndarray, low: int, high: int, bin_size: int) -> np.ndarray:
+    """Reduces (a row band of) a data cube to the channels in range [low:high] and averages the channels per bin. A
+    bin at the end of the channels is averaged over the channels it contains.
+
+    :param data: 3-dimensional array in format {y, x, channel}
+    :param low: the lower channel boundary
+    :param high: the higher channel boundary
+    :param bin_size: the number of channels per bin
+    :return: 3-dimensional array in format {y, x, bin} with the data type of the input
+    """
+
+    # if we just need to crop
+    if bin_size == 1:
+        return np.array(data[:, :, low:high])
+
+    height, width, _ = data.shape
+    nr_bins: int = ceil((high - low) / bin_size)
+    binned: np.ndarray = np.zeros((height, width, nr_bins), dtype=data.dtype)
+
+    # all channels covered by the bins
+    channels: np.ndarray = data[:, :, low:low + nr_bins * bin_size]
+    full_bins: int = channels.shape[2] // bin_size
+
+    # average the complete bins at once
+    if full_bins > 0:
+        complete: np.ndarray = channels[:, :, :full_bins * bin_size].reshape(height, width, full_bins, bin_size)
+        binned[:, :, :full_bins] = np.mean(complete, axis=3)
+
+    # average the remaining channels
+    if full_bins < nr_bins and channels.shape[2] > full_bins * bin_size:
+        binned[:, :, full_bins] = np.mean(channels[:, :, full_bins * bin_size:], axis=2)
+
+    return binned
+
+
 def bin_data(data_source: str, low: int, high: int, bin_size: int):
     """Reduces the raw data of a data source to channels in range [low:high] and averages channels per bin.
 
+    The raw data is processed in bands of rows, bounded by the configured chunk size, and written to a temporary file
+    that replaces the raw data once all bands are binned. Hence, the raw data is never fully loaded into memory.
+
     :param data_source: the name of the data source containing the raw data
     :param low: the lower channel boundary
     :param high: the higher channel boundary
@@ -212,53 +431,71 @@ def bin_data(data_source: str, low: int, high: int, bin_size: int):
     path_to_raw, path_to_rpl = get_raw_rpl_paths(data_source)
 
     # get dimensions from rpl file
-    info = parse_rpl(path_to_rpl)
-    if info == {}:
+    info: RplInfo | None = get_rpl_info(path_to_rpl)
+    if info is None:
         LOG.error(f"error while binning data: rpl is empty for {data_source}")
         return
     # get dimensions of original data
-    width: int = int(info['width'])
-    height: int = int(info['height'])
-    channels: int = int(info['depth'])
+    width: int = info.width
+    height: int = info.height
+    channels: int = info.depth
 
     # if default settings, don't do anything
     if low == 0 and high == 4096 and bin_size == 1:
         set_binned(data_source, True)
         return
 
+    dtype: np.dtype = info.dtype
     try:
-        # load raw file and parse it as 3d array with correct dimensions
-        datacube: np.ndarray = np.fromfile(path_to_raw, dtype=np.uint16)
+        # check that the raw file has the dimensions of the rpl file
+        size: int = (getsize(path_to_raw) - info.offset) // dtype.itemsize
     except OSError as err:
         LOG.error(f"error while loading raw file for binning: {err}")
         raise
-    try:
-        datacube: np.ndarray = np.reshape(datacube, (height, width, channels))
-    except ValueError as err:
-        LOG.error(f"error while reshaping raw data: {err}")
+    if size != height * width * channels:
+        LOG.error(f"error while reshaping raw data: cannot reshape array of size {size} into shape "
+                  f"({height},{width},{channels})")
         return
-    # if we just need to crop
-    if bin_size == 1:
-        new_cube: np.ndarray = datacube[:, :, low:high]
-    else:
-        # compute number of bins
-        nr_bins: int = ceil((high - low) / bin_size)
-        # initialize  array
-        new_cube: np.ndarray = np.zeros(
-            shape=(height, width, nr_bins), dtype=np.uint16)
-
-        for i in range(nr_bins):
-            # convert bin number to start channel in original data (i.e. in range [0, 4096])
-            start_channel = low + i * bin_size
-            bin_average = np.mean(
-                datacube[:, :, start_channel:start_channel + bin_size], axis=2)
-            new_cube[:, :, i] = bin_average
-
-    # overwrite file
+
+    # load raw file as 3d array with correct dimensions
+    datacube: np.memmap = np.memmap(
+        path_to_raw, dtype=dtype, mode='r', offset=info.offset, shape=(height, width, channels)
+    )
+
+    # number of rows that are binned at once
+    band_height: int = max(1, get_chunk_size() // (width * channels * dtype.itemsize))
+
+    # write the binned data to a temporary file next to the raw file
+    path_to_binned: str = f"{path_to_raw}.tmp"
     try:
-        new_cube.flatten().tofile(path_to_raw)
+        new_cube: np.memmap | None = None
+        for band_start in range(0, height, band_height):
+            band: np.ndarray = bin_channels(datacube[band_start:band_start + band_height], low, high, bin_size)
+
+            # the number of bins is only known after binning the first band
+            if new_cube is None:
+                new_cube = np.memmap(
+                    path_to_binned, dtype=dtype, mode='w+', offset=info.offset, shape=(height, width, band.shape[2])
+                )
+            new_cube[band_start:band_start + band.shape[0]] = band
+
+        new_cube.flush()
+        del new_cube, datacube
+
+        # keep the header of the raw file, such that the rpl file still describes the binned file
+        if info.offset > 0:
+            with open(path_to_raw, 'rb') as raw_file, open(path_to_binned, 'r+b') as binned_file:
+                binned_file.write(raw_file.read(info.offset))
+
+        # overwrite file
+        replace(path_to_binned, path_to_raw)
     except Exception as e:
         LOG.error("Failed to write binned data: {%s}", e)
+        if isfile(path_to_binned):
+            remove(path_to_binned)
+        return
+
+    # only mark the data as binned once the binned file replaced the raw file
     set_binned(data_source, True)
 
 
@@ -269,17 +506,17 @@ def update_bin_params(data_source: str):
     """
     _, path_to_rpl = get_raw_rpl_paths(data_source)
 
-    # get dimensions from rpl file
-    info = parse_rpl(path_to_rpl)
+    # get the energy of the first channel from rpl file
+    info: RplInfo | None = get_rpl_info(path_to_rpl)
 
-    try:
-        offset: int = int(info['depthscaleorigin'])
-    except:
-        offset: int = 0
+    offset: int = 0
+    if info is not None and info.depth_scale_origin is not None:
+        offset = int(info.depth_scale_origin)
     
     workspace_dict: dict | None = get_workspace_dict(data_source)
 
     if workspace_dict is not None:
+        workspace_dict = deepcopy(workspace_dict)
         low: float = workspace_dict["spectralParams"]["low"]
         high: float = workspace_dict["spectralParams"]["high"]
         bin_size: float = workspace_dict["spectralParams"]["binSize"]
@@ -291,5 +528,4 @@ def update_bin_params(data_source: str):
     
     workspace_path = get_path_to_workspace(data_source)
 
-    with open(workspace_path, 'w') as f:
-        json.dump(workspace_dict, f)
+    write_workspace(workspace_path, workspace_dict)
@@ -1,7 +1,14 @@
+import json
+
+from collections.abc import Callable
 from logging import Logger, getLogger
-from os import makedirs
-from os.path import abspath, join, isdir
+from os import makedirs, remove, replace, stat
+from os.path import abspath, dirname, join, isdir, isfile, splitext
 from pathlib import Path
+from threading import get_ident
+from typing import Any
+
+import numpy as np
 
 from yaml import safe_load, YAMLError
 
@@ -77,3 +84,152 @@ def data_source_name_from_cube_path(path_to_cube: str) -> str:
     """
 
     return Path(path_to_cube).parent.name
+
+
+def get_file_signature(path: str) -> tuple[int, int] | None:
+    """Gets the signature of a file, which changes whenever the file is modified. It can be used to check whether
+    data derived from the file is still up-to-date.
+
+    :param path: The path to the file
+    :return: Tuple containing the modification time of the file in nanoseconds and its size in bytes. None is returned
+        if the file does not exist.
+    """
+
+    if not isfile(path):
+        return None
+
+    try:
+        file_stat = stat(path)
+    except OSError as err:
+        LOG.error(f"Could not get the signature of {path}: {err}")
+        return None
+
+    return file_stat.st_mtime_ns, file_stat.st_size
+
+
+def get_cached_array_key_path(path: str) -> str:
+    """Gets the path to the file containing the key of an array stored by `store_cached_array`.
+
+    :param path: The path to the .npy file of the array
+    :return: The path to the .json file next to the array, with the same name
+    """
+
+    return f"{splitext(path)[0]}.json"
+
+
+def load_cached_array(path: str, key: dict, mmap_mode: str | None = None) -> np.ndarray | None:
+    """Loads an array stored by `store_cached_array`, if it was stored for the given key.
+
+    :param path: The path to the .npy file of the array
+    :param key: The key identifying the version of the data the array should be computed from
+    :param mmap_mode: The mode to memory map the array with, as in `numpy.load`, or None to load it into memory
+    :return: The stored array, or None if no array is stored for the key
+    """
+
+    path_to_key: str = get_cached_array_key_path(path)
+    if not isfile(path) or not isfile(path_to_key):
+        return None
+
+    try:
+        with open(path_to_key, 'r') as file:
+            stored_key: dict = json.load(file)
+        if stored_key != key:
+            return None
+        return np.load(path, mmap_mode=mmap_mode)
+    except (OSError, ValueError) as err:
+        LOG.warning(f"Could not read stored array {path}: {err}")
+        return None
+
+
+def store_cached_array(path: str, key: dict, data: np.ndarray | Callable[[str], Any]) -> bool:
+    """Stores an array as a .npy file together with its key, such that it can be loaded by `load_cached_array` as
+    long as the key remains the same. The files are written next to their paths and replaced at once, such that they
+    are never partially written. The old key is removed first, such that it never refers to another array.
+
+    :param path: The path to the .npy file of the array
+    :param key: The key identifying the version of the data the array is computed from
+    :param data: The array, or a function writing the .npy file of the array to the path it is given
+    :return: True if the array was stored
+    """
+
+    path_to_key: str = get_cached_array_key_path(path)
+
+    # the temporary files are unique to the thread, such that concurrent writers never write to the same file
+    path_to_tmp: str = f"{path}.{get_ident()}.tmp"
+    path_to_key_tmp: str = f"{path_to_key}.{get_ident()}.tmp"
+
+    try:
+        makedirs(dirname(path) or ".", exist_ok=True)
+        if isfile(path_to_key):
+            remove(path_to_key)
+
+        if isinstance(data, np.ndarray):
+            with open(path_to_tmp, 'wb') as file:
+                np.save(file, data)
+        else:
+            data(path_to_tmp)
+        replace(path_to_tmp, path)
+
+        with open(path_to_key_tmp, 'w') as file:
+            json.dump(key, file)
+        replace(path_to_key_tmp, path_to_key)
+    except OSError as err:
+        LOG.error(f"Could not store array {path}: {err}")
+        for path_to_file in (path_to_tmp, path_to_key_tmp):
+            if isfile(path_to_file):
+                remove(path_to_file)
+        return False
+
+    return True
+
+
+def load_cached_json(path: str, key: dict) -> dict | None:
+    """Loads a dictionary stored by `store_cached_json`, if it was stored for the given key.
+
+    :param path: The path to the .json file
+    :param key: The key identifying the version of the data the dictionary should be computed from
+    :return: The stored dictionary including its key under "key", or None if no dictionary is stored for the key
+    """
+
+    if not isfile(path):
+        return None
+
+    try:
+        with open(path, 'r') as file:
+            data: dict = json.load(file)
+    except (OSError, ValueError) as err:
+        LOG.warning(f"Could not read stored file {path}: {err}")
+        return None
+
+    if not isinstance(data, dict) or data.get("key") != key:
+        return None
+
+    return data
+
+
+def store_cached_json(path: str, key: dict, data: dict) -> bool:
+    """Stores a dictionary as a .json file together with its key, such that it can be loaded by `load_cached_json`
+    as long as the key remains the same. The key is added to the dictionary under "key". The file is written next to
+    its path and replaced at once, such that it is never partially written.
+
+    :param path: The path to the .json file
+    :param key: The key identifying the version of the data the dictionary is computed from
+    :param data: The dictionary to store
+    :return: True if the dictionary was stored
+    """
+
+    data["key"] = key
+    path_to_tmp: str = f"{path}.{get_ident()}.tmp"
+
+    try:
+        makedirs(dirname(path) or ".", exist_ok=True)
+        with open(path_to_tmp, 'w') as file:
+            json.dump(data, file)
+        replace(path_to_tmp, path)
+    except OSError as err:
+        LOG.error(f"Could not store file {path}: {err}")
+        if isfile(path_to_tmp):
+            remove(path_to_tmp)
+        return False
+
+    return True
@@ -19,4 +19,10 @@ from .file_access import (
     set_binned,
     get_raw_rpl_names
 )
-from .workspace_handler import get_path_to_workspace, update_workspace
+from .workspace_handler import (
+    get_path_to_workspace,
+    update_workspace,
+    read_workspace,
+    write_workspace,
+    clear_workspace_cache
+)
@@ -1,5 +1,6 @@
 import logging
 
+from functools import lru_cache
 from os.path import join, abspath
 from pathlib import Path
 
@@ -7,7 +8,7 @@ import PIL
 
 from PIL.Image import Image
 
-from xrf_explorer.server.file_system import get_config
+from xrf_explorer.server.file_system import get_config, get_file_signature
 from xrf_explorer.server.file_system.workspace.file_access import get_workspace_dict
 
 LOG: logging.Logger = logging.getLogger(__name__)
@@ -16,6 +17,9 @@ LOG: logging.Logger = logging.getLogger(__name__)
 # are above the limit
 PIL.Image.MAX_IMAGE_PIXELS = None
 
+# the number of image sizes that are remembered, every version of an image takes an entry
+IMAGE_SIZE_CACHE_SIZE: int = 256
+
 
 def get_contextual_image_data(data_source: str, name: str) -> dict | None:
     """
@@ -125,19 +129,41 @@ def get_contextual_image(image_path: str) -> Image | None:
     return None
 
 
-def get_contextual_image_size(image_path: str) -> tuple[int, int] | None:
+@lru_cache(maxsize=IMAGE_SIZE_CACHE_SIZE)
+def read_contextual_image_size(image_path: str, mtime: int, size: int) -> tuple[int, int] | None:
     """
-    Get the size of an image.
+    Reads the size of an image from its header, without decoding the pixels. The modification time and size of the
+    file are only used to identify the version of the image in the cache.
 
     :param image_path: The path to the image file
+    :param mtime: The modification time of the image file in nanoseconds
+    :param size: The size of the image file in bytes
     :return: The dimensions of the image
     """
 
-    image: Image = get_contextual_image(image_path)
+    image: Image | None = get_contextual_image(image_path)
     if not image:
         return None
 
-    return image.size
+    # opening an image only reads its header, the pixels are decoded on first access
+    with image:
+        return image.size
+
+
+def get_contextual_image_size(image_path: str) -> tuple[int, int] | None:
+    """
+    Get the size of an image. The size is read from the header of the image and cached until the image changes.
+
+    :param image_path: The path to the image file
+    :return: The dimensions of the image
+    """
+
+    signature: tuple[int, int] | None = get_file_signature(image_path)
+    if signature is None:
+        LOG.error("Image file %s not found", image_path)
+        return None
+
+    return read_contextual_image_size(image_path, *signature)
 
 
 def get_base_image_name(data_source: str) -> str | None:
@@ -1,13 +1,17 @@
 # Module responsible for giving the different paths corresponding to the files of a data source
 
-import json
 import logging
 
+from copy import deepcopy
 from os.path import isfile, join, exists, abspath
 from pathlib import Path
 
 from xrf_explorer.server.file_system import get_config
-from xrf_explorer.server.file_system.workspace.workspace_handler import get_path_to_workspace
+from xrf_explorer.server.file_system.workspace.workspace_handler import (
+    get_path_to_workspace,
+    read_workspace,
+    write_workspace
+)
 
 LOG: logging.Logger = logging.getLogger(__name__)
 
@@ -174,6 +178,7 @@ def set_binned(data_source: str, binned: bool):
     workspace_dict: dict | None = get_workspace_dict(data_source)
     if workspace_dict is None:
         raise FileNotFoundError
+    workspace_dict = deepcopy(workspace_dict)
     if binned:
         workspace_dict["spectralParams"]["binned"] = True
     else:
@@ -181,12 +186,12 @@ def set_binned(data_source: str, binned: bool):
 
     workspace_path = get_path_to_workspace(data_source)
 
-    with open(workspace_path, 'w') as f:
-        json.dump(workspace_dict, f)
+    write_workspace(workspace_path, workspace_dict)
 
 
 def get_workspace_dict(data_source_folder_name: str) -> dict | None:
-    """Returns the workspace of the specified data source in dictionary format.
+    """Returns the workspace of the specified data source in dictionary format. The workspace is cached until
+    workspace.json is modified, so the returned dictionary is shared and should be copied before modifying it.
 
     :param data_source_folder_name: Name of the data source folder
     :return: Dictionary format of the workspace.json
@@ -201,9 +206,7 @@ def get_workspace_dict(data_source_folder_name: str) -> dict | None:
         backend_config["uploads-folder"], data_source_folder_name, "workspace.json"
     )
     try:
-        with open(workspace_json_dir, "r") as workspace:
-            workspace_json = json.loads(workspace.read())
-            return workspace_json
+        return read_workspace(workspace_json_dir)
     except Exception:
         LOG.error(f"Error while reading workspace json of data source with folder name {data_source_folder_name}")
         return None
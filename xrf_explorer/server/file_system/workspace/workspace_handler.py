@@ -1,12 +1,19 @@
 import logging
 
-from json import dump
+from copy import deepcopy
+from json import dump, load
+from os import replace
 from os.path import isfile, isdir, join
+from threading import Lock
 
-from xrf_explorer.server.file_system import get_config
+from xrf_explorer.server.file_system import get_config, get_file_signature
 
 LOG: logging.Logger = logging.getLogger(__name__)
 
+# parsed workspaces, keyed by path, together with the modification time and size of the file
+WORKSPACE_CACHE: dict[str, tuple[tuple[int, int], dict]] = {}
+WORKSPACE_CACHE_LOCK: Lock = Lock()
+
 
 def get_path_to_workspace(datasource: str) -> str:
     """Get the path to the workspace.json file for a given datasource.
@@ -35,6 +42,77 @@ def get_path_to_workspace(datasource: str) -> str:
     return path_to_workspace
 
 
+def read_workspace(path: str) -> dict:
+    """Read a workspace.json file. The parsed workspace is cached, and only read again if the file was modified.
+    The returned dictionary is shared between all callers, so it should be copied before modifying it.
+    Can raise error if the file could not be read.
+
+    :param path: The path to the workspace.json file
+    :return: The workspace in dictionary format
+    """
+
+    signature: tuple[int, int] | None = get_file_signature(path)
+    if signature is None:
+        raise FileNotFoundError(f"Could not find workspace {path}")
+
+    with WORKSPACE_CACHE_LOCK:
+        cached: tuple[tuple[int, int], dict] | None = WORKSPACE_CACHE.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+    with open(path, 'r') as file:
+        workspace: dict = load(file)
+
+    with WORKSPACE_CACHE_LOCK:
+        WORKSPACE_CACHE[path] = (signature, workspace)
+
+    return workspace
+
+
+def write_workspace(path: str, workspace: dict):
+    """Write a workspace to a workspace.json file and update the cached workspace of the file. The file is replaced at
+    once, such that it is never read partially written.
+    Can raise error if the file could not be written.
+
+    :param path: The path to the workspace.json file
+    :param workspace: The workspace to write
+    """
+
+    if not path:
+        raise FileNotFoundError("No path to the workspace given")
+
+    # keep a copy, such that the caller can still modify its workspace
+    written: dict = deepcopy(workspace)
+
+    with WORKSPACE_CACHE_LOCK:
+        try:
+            with open(f"{path}.tmp", 'w') as file:
+                dump(written, file)
+            replace(f"{path}.tmp", path)
+        except OSError:
+            WORKSPACE_CACHE.pop(path, None)
+            raise
+
+        signature: tuple[int, int] | None = get_file_signature(path)
+        if signature is None:
+            WORKSPACE_CACHE.pop(path, None)
+        else:
+            WORKSPACE_CACHE[path] = (signature, written)
+
+
+def clear_workspace_cache(path: str | None = None):
+    """Removes the workspace of a workspace.json file from the cache, or all workspaces if no path is given.
+
+    :param path: The path to the workspace.json file to remove from the cache
+    """
+
+    with WORKSPACE_CACHE_LOCK:
+        if path is None:
+            WORKSPACE_CACHE.clear()
+        else:
+            WORKSPACE_CACHE.pop(path, None)
+
+
 def update_workspace(datasource: str, new_workspace: any) -> bool:
     """Update the workspace.json file for a given datasource.
 
@@ -62,8 +140,7 @@ def update_workspace(datasource: str, new_workspace: any) -> bool:
     # Try to update workspace
     try:
         # update the workspace present or create a new one
-        with open(path_to_workspace, "w") as json_file:
-            dump(new_workspace, json_file)
+        write_workspace(path_to_workspace, new_workspace)
 
     except OSError as e:
         LOG.error(f"Failed to write data to workspace: {str(e)}")
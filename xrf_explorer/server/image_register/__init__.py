@@ -3,5 +3,7 @@ from .register_image import (
     load_points_dict,
     compute_fitting_dimensions_by_aspect,
     register_image_to_image,
-    get_image_registered_to_data_cube
+    get_image_registered_to_data_cube,
+    get_registered_image_key,
+    register_image_to_data_cube
 )
@@ -1,7 +1,8 @@
 import csv
 import logging
 
-from os.path import exists, dirname
+from hashlib import sha1
+from os.path import exists, dirname, join
 
 import numpy as np
 
@@ -12,10 +13,17 @@ from cv2 import (
     warpPerspective,
     getPerspectiveTransform,
     INTER_AREA,
+    INTER_LINEAR,
     resize,
 )
 from cv2.typing import MatLike
 
+from xrf_explorer.server.file_system import (
+    get_file_signature,
+    get_path_to_generated_folder,
+    load_cached_array,
+    store_cached_array
+)
 from xrf_explorer.server.file_system.cubes import get_elemental_datacube_dimensions
 from xrf_explorer.server.file_system.workspace import (
     get_elemental_cube_recipe_path,
@@ -28,6 +36,8 @@ from xrf_explorer.server.file_system.workspace import (
 
 LOG: logging.Logger = logging.getLogger(__name__)
 
+REGISTERED_IMAGES_FOLDER_NAME: str = 'registered_images'
+
 
 def load_image_to_register(path_image_to_register: str) -> MatLike | None:
     """
@@ -297,6 +307,183 @@ def inverse_register_image(
     return resize(image_without_padding, (new_width, new_height), interpolation=INTER_AREA)
 
 
+def get_scaling_transform(scale_x: float, scale_y: float) -> np.ndarray:
+    """
+    Gets the transformation matrix of scaling an image, mapping the centers of the pixels in the same way as `resize`.
+
+    :param scale_x: The factor the width of the image is scaled by
+    :param scale_y: The factor the height of the image is scaled by
+    :return: The 3x3 transformation matrix of the scaling
+    """
+
+    return np.array([
+        [scale_x, 0, (scale_x - 1) / 2],
+        [0, scale_y, (scale_y - 1) / 2],
+        [0, 0, 1]
+    ], dtype=np.float64)
+
+
+def get_register_transform(
+        image_width: int, image_height: int,
+        new_width: int, new_height: int,
+        points_source: np.ndarray, points_destination: np.ndarray
+) -> np.ndarray:
+    """
+    Gets the transformation matrix of `register_image`, composing the resize, the padding and the perspective
+    transformation.
+
+    :param image_width: The width of the image to be registered
+    :param image_height: The height of the image to be registered
+    :param new_width: The new width of the image
+    :param new_height: The new height of the image
+    :param points_source: The source points
+    :param points_destination: The destination points
+    :return: The 3x3 transformation matrix from the image to the registered image
+    """
+
+    resized_height, resized_width = compute_fitting_dimensions_by_aspect(
+        image_height, image_width, new_height, new_width
+    )
+
+    # the padding is added to the bottom and right, so it does not move the image
+    scaling: np.ndarray = get_scaling_transform(resized_width / image_width, resized_height / image_height)
+    perspective: np.ndarray = getPerspectiveTransform(points_source, points_destination)
+
+    return perspective @ scaling
+
+
+def get_inverse_register_transform(
+        image_width: int, image_height: int,
+        new_width: int, new_height: int,
+        points_source: np.ndarray, points_destination: np.ndarray
+) -> tuple[np.ndarray, tuple[int, int]]:
+    """
+    Gets the transformation matrix of `inverse_register_image`, composing the inverse perspective transformation, the
+    removal of the padding and the resize.
+
+    :param image_width: The width of the image to be inverse registered
+    :param image_height: The height of the image to be inverse registered
+    :param new_width: The new width of the image
+    :param new_height: The new height of the image
+    :param points_source: The source points
+    :param points_destination: The destination points
+    :return: The 3x3 transformation matrix from the image to the inverse registered image, and the width and height of
+        the area of the image that is kept after removing the padding
+    """
+
+    perspective: np.ndarray = getPerspectiveTransform(points_destination, points_source)
+
+    # the padding is removed from the bottom or right, as in inverse_register_image
+    kept_width: int = image_width
+    kept_height: int = image_height
+    if image_width / image_height > new_width / new_height:
+        kept_width = int(new_width * image_height / new_height)
+    else:
+        kept_height = int(new_height * image_width / new_width)
+
+    scaling: np.ndarray = get_scaling_transform(new_width / kept_width, new_height / kept_height)
+
+    return scaling @ perspective, (kept_width, kept_height)
+
+
+def warp_image_area(image: MatLike, transform: np.ndarray, new_width: int, new_height: int) -> MatLike:
+    """
+    Applies a perspective transformation on an image in a single warp. If the transformation shrinks the image, the
+    image is first resized with area interpolation to about the resolution of the result, such that the warp does not
+    skip pixels.
+
+    :param image: The image to be transformed
+    :param transform: The 3x3 transformation matrix from the image to the result
+    :param new_width: The width of the result
+    :param new_height: The height of the result
+    :return: The transformed image
+    """
+
+    image_height, image_width = image.shape[:2]
+
+    # estimate the scale of the transformation from the area the result covers in the image
+    corners: np.ndarray = np.array([
+        [-0.5, -0.5, 1], [new_width - 0.5, -0.5, 1], [new_width - 0.5, new_height - 0.5, 1], [-0.5, new_height - 0.5, 1]
+    ], dtype=np.float64)
+    corners_image: np.ndarray = corners @ np.linalg.inv(transform).T
+    corners_image = corners_image[:, :2] / corners_image[:, 2:]
+    x, y = corners_image[:, 0], corners_image[:, 1]
+    area: float = abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))) / 2
+    scale: float = np.sqrt(new_width * new_height / area) if area > 0 else 1
+
+    if scale < 1:
+        prefiltered_width: int = max(1, round(image_width * scale))
+        prefiltered_height: int = max(1, round(image_height * scale))
+        image = resize(image, (prefiltered_width, prefiltered_height), interpolation=INTER_AREA)
+        transform = transform @ np.linalg.inv(
+            get_scaling_transform(prefiltered_width / image_width, prefiltered_height / image_height)
+        )
+
+    return warpPerspective(image, transform, (new_width, new_height), flags=INTER_LINEAR)
+
+
+def get_area_mask(transform: np.ndarray, width: int, height: int, area_width: int, area_height: int) -> np.ndarray:
+    """
+    Gets the pixels of an image of which the center is mapped inside an area by the inverse of a transformation.
+
+    :param transform: The 3x3 transformation matrix from the area to the image
+    :param width: The width of the image
+    :param height: The height of the image
+    :param area_width: The width of the area, starting at the left
+    :param area_height: The height of the area, starting at the top
+    :return: Boolean mask of shape (height, width), true for the pixels inside the area
+    """
+
+    grid_y, grid_x = np.mgrid[:height, :width]
+    points: np.ndarray = np.stack([grid_x, grid_y, np.ones_like(grid_x)], axis=-1) @ np.linalg.inv(transform).T
+    x: np.ndarray = points[..., 0] / points[..., 2]
+    y: np.ndarray = points[..., 1] / points[..., 2]
+
+    return (x >= -0.5) & (x <= area_width - 0.5) & (y >= -0.5) & (y <= area_height - 0.5)
+
+
+def register_image_to_cube(
+        image: MatLike,
+        base_width: int, base_height: int,
+        base_points_source: np.ndarray, base_points_destination: np.ndarray,
+        cube_width: int, cube_height: int,
+        cube_points_source: np.ndarray, cube_points_destination: np.ndarray
+) -> MatLike:
+    """
+    Registers an image to the base image and inverse registers the result to the data cube, as done by
+    `register_image` followed by `inverse_register_image`. Both transformations are composed into a single warp
+    straight to the dimensions of the data cube, such that the image is never warped at the resolution of the base
+    image.
+
+    :param image: The image to be registered
+    :param base_width: The width of the base image
+    :param base_height: The height of the base image
+    :param base_points_source: The source points of the registration to the base image
+    :param base_points_destination: The destination points of the registration to the base image
+    :param cube_width: The width of the data cube
+    :param cube_height: The height of the data cube
+    :param cube_points_source: The source points of the registration of the data cube
+    :param cube_points_destination: The destination points of the registration of the data cube
+    :return: The registered image
+    """
+
+    image_height, image_width = image.shape[:2]
+
+    transform_base: np.ndarray = get_register_transform(
+        image_width, image_height, base_width, base_height, base_points_source, base_points_destination
+    )
+    transform_cube, (kept_width, kept_height) = get_inverse_register_transform(
+        base_width, base_height, cube_width, cube_height, cube_points_source, cube_points_destination
+    )
+
+    registered_image: MatLike = warp_image_area(image, transform_cube @ transform_base, cube_width, cube_height)
+
+    # the intermediate image at the resolution of the base image would have cut off everything outside its bounds
+    registered_image[~get_area_mask(transform_cube, cube_width, cube_height, kept_width, kept_height)] = 0
+
+    return registered_image
+
+
 def register_image_to_image(
         path_image_reference: str,
         path_image_register: str,
@@ -347,7 +534,80 @@ def register_image_to_image(
     return imwrite(path_result_registered_image, registered_image)
 
 
+def get_registered_image_key(data_source: str, image_name: str) -> dict | None:
+    """
+    Gets the key identifying the version of an image registered to the data cube. The key contains the signatures of
+    the image, the recipe of the elemental data cube and the dimensions of the data cube. If the image is not the base
+    image, it also contains the signatures of the recipe to the base image and of the base image itself.
+
+    :param data_source: The name of the data source
+    :param image_name: The name of the registered image
+    :return: The key of the registered image, or None if any of the files could not be found
+    """
+
+    dimensions: tuple[int, int, int, int] | None = get_elemental_datacube_dimensions(data_source)
+    if dimensions is None:
+        return None
+
+    is_image_base_image: bool | None = is_base_image(data_source, image_name)
+    if is_image_base_image is None:
+        return None
+
+    # the files the registered image is computed from
+    paths: list[str | None] = [
+        get_contextual_image_path(data_source, image_name),
+        get_elemental_cube_recipe_path(data_source)
+    ]
+    if not is_image_base_image:
+        paths += [get_contextual_image_recipe_path(data_source, image_name), get_path_to_base_image(data_source)]
+
+    files: list[list] = []
+    for path in paths:
+        signature: tuple[int, int] | None = None if path is None else get_file_signature(path)
+        if signature is None:
+            return None
+        files.append([path, signature[0], signature[1]])
+
+    return {"files": files, "width": dimensions[0], "height": dimensions[1]}
+
+
 def get_image_registered_to_data_cube(data_source: str, image_name: str) -> MatLike | None:
+    """
+    Gets an image registered to align with the dimensions of the data cube, as computed by
+    `register_image_to_data_cube`. The registered image is stored in the generated folder of the data source, and only
+    recomputed if the image, any of the recipes or the dimensions of the data cube changed since.
+
+    :param data_source: The name of the data source
+    :param image_name: The name of the image to be registered
+    :return: The registered image in BGR format or None in case of an error
+    """
+
+    key: dict | None = get_registered_image_key(data_source, image_name)
+    path_to_generated_folder: str = get_path_to_generated_folder(data_source) if key is not None else ""
+    if not path_to_generated_folder:
+        return register_image_to_data_cube(data_source, image_name)
+
+    # the names of images are chosen by the user, so they are hashed to get a valid file name
+    path_to_images: str = join(path_to_generated_folder, REGISTERED_IMAGES_FOLDER_NAME)
+    file_name: str = sha1(image_name.encode()).hexdigest()
+    path_to_image: str = join(path_to_images, f"{file_name}.npy")
+
+    # use the stored image if it is up-to-date
+    stored_image: np.ndarray | None = load_cached_array(path_to_image, key)
+    if stored_image is not None:
+        LOG.info(f"Loaded image {image_name} registered to elemental cube")
+        return stored_image
+
+    registered_image: MatLike | None = register_image_to_data_cube(data_source, image_name)
+    if registered_image is None:
+        return None
+
+    store_cached_array(path_to_image, key, registered_image)
+
+    return registered_image
+
+
+def register_image_to_data_cube(data_source: str, image_name: str) -> MatLike | None:
     """
     Registers an image to align with the dimensions of the data cube.
 
@@ -379,15 +639,23 @@ def get_image_registered_to_data_cube(data_source: str, image_name: str) -> MatL
     if is_image_base_image is None:
         return None
 
-    # If not base image, register image to base image first
+    # Get elemental data cube recipe
+    cube_recipe_path: str | None = get_elemental_cube_recipe_path(data_source)
+    if cube_recipe_path is None:
+        return None
+
+    # Load the control points of the elemental data cube
+    points_source, points_destination = load_points(cube_recipe_path)
+
+    # If not base image, register image to base image and to the elemental cube at once
     if not is_image_base_image:
         # Get recipe to base image
         base_recipe_path: str | None = get_contextual_image_recipe_path(data_source, image_name)
         if base_recipe_path is None:
             return None
 
-        # Load the control points and apply the perspective transformation
-        points_source, points_destination = load_points(base_recipe_path)
+        # Load the control points of the base image
+        base_points_source, base_points_destination = load_points(base_recipe_path)
 
         # Get path to base image
         path_to_base_image: str | None = get_path_to_base_image(data_source)
@@ -401,21 +669,14 @@ def get_image_registered_to_data_cube(data_source: str, image_name: str) -> MatL
 
         base_image_width, base_image_height = base_image_size
 
-        # Register the image to the base image
-        LOG.info("Registering image to base image")
+        LOG.info("Registering image to elemental cube through base image")
 
-        image_register = register_image(
-            image_register, base_image_width, base_image_height, points_source, points_destination
+        return register_image_to_cube(
+            image_register,
+            base_image_width, base_image_height, base_points_source, base_points_destination,
+            cube_w, cube_h, points_source, points_destination
         )
 
-    # Get elemental data cube recipe
-    cube_recipe_path: str | None = get_elemental_cube_recipe_path(data_source)
-    if cube_recipe_path is None:
-        return None
-
-    # Load the control points and apply the perspective transformation
-    points_source, points_destination = load_points(cube_recipe_path)
-
     # Inverse register the image 
     LOG.info("Registering image to elemental cube")
 
@@ -0,0 +1,10 @@
+"""This module handles everything related to the tile pyramids of images."""
+
+from .tiles import (
+    generate_pyramid,
+    get_pyramid,
+    get_tile,
+    get_contextual_image_pyramid,
+    get_contextual_image_tile
+)
+from .elemental import get_elemental_map_pyramid, get_elemental_map_tile
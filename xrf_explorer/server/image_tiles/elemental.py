@@ -0,0 +1,89 @@
+import logging
+
+from os.path import join
+
+import numpy as np
+
+from xrf_explorer.server.file_system import get_file_signature, get_path_to_generated_folder
+from xrf_explorer.server.file_system.cubes import (
+    DEFAULT_NORMALIZATION_MODE,
+    get_elemental_map,
+    get_elemental_map_bounds,
+    normalize_ndarray_to_grayscale
+)
+from xrf_explorer.server.file_system.workspace import get_elemental_cube_path
+from xrf_explorer.server.image_tiles.tiles import PYRAMIDS_FOLDER_NAME, get_pyramid, get_tile
+
+LOG: logging.Logger = logging.getLogger(__name__)
+
+
+def get_elemental_map_pyramid_path(data_source: str, channel: int) -> str | None:
+    """
+    Gets the folder of the pyramid of an elemental map in the generated folder of the data source.
+
+    :param data_source: the data source of the elemental data cube
+    :param channel: the channel of the elemental map
+    :return: the folder of the pyramid, or None if the generated folder could not be found
+    """
+
+    path_to_generated_folder: str = get_path_to_generated_folder(data_source)
+    if not path_to_generated_folder:
+        return None
+
+    return join(path_to_generated_folder, PYRAMIDS_FOLDER_NAME, f"elemental_{channel}")
+
+
+def get_elemental_map_pyramid(data_source: str, channel: int) -> dict | None:
+    """
+    Gets the info of the pyramid of an elemental map, as generated by `generate_pyramid`. The levels of the pyramid
+    contain the average of the unnormalized elemental data, such that tiles can be rendered with any normalization.
+    The pyramid is generated the first time it is requested, and regenerated if the elemental data cube changed since.
+
+    :param data_source: the data source of the elemental data cube
+    :param channel: the channel of the elemental map
+    :return: the info of the pyramid, or None if the elemental map could not be found
+    """
+
+    path_to_cube: str | None = get_elemental_cube_path(data_source)
+    signature: tuple[int, int] | None = None if path_to_cube is None else get_file_signature(path_to_cube)
+    path_to_pyramid: str | None = get_elemental_map_pyramid_path(data_source, channel)
+    if signature is None or path_to_pyramid is None:
+        LOG.error(f"Could not find elemental data cube of data source {data_source}")
+        return None
+
+    # the pyramid is valid as long as the elemental data cube remains the same
+    key: dict = {"path": path_to_cube, "mtime": signature[0], "size": signature[1], "channel": channel}
+
+    return get_pyramid(path_to_pyramid, key, lambda: get_elemental_map(channel, path_to_cube))
+
+
+def get_elemental_map_tile(
+        data_source: str, channel: int, level: int, x: int, y: int, mode: str = DEFAULT_NORMALIZATION_MODE
+) -> str | None:
+    """
+    Gets the path to a tile of the pyramid of an elemental map, as returned by `get_tile`. The tiles are normalized to
+    grayscale over the bounds of the normalization mode.
+
+    :param data_source: the data source of the elemental data cube
+    :param channel: the channel of the elemental map
+    :param level: the level of the tile, 0 is a single pixel
+    :param x: the column of the tile
+    :param y: the row of the tile
+    :param mode: the normalization mode of the tile, one of `NORMALIZATION_MODES`
+    :return: the path to the tile, or None if the elemental map could not be found or the tile is outside the pyramid
+    """
+
+    bounds: tuple[float, float] | None = get_elemental_map_bounds(data_source, channel, mode)
+    if bounds is None:
+        LOG.error(f"Could not find elemental map {channel} of data source {data_source}")
+        return None
+
+    info: dict | None = get_elemental_map_pyramid(data_source, channel)
+    path_to_pyramid: str | None = get_elemental_map_pyramid_path(data_source, channel)
+    if info is None or path_to_pyramid is None:
+        return None
+
+    def render(tile: np.ndarray) -> np.ndarray:
+        return normalize_ndarray_to_grayscale(tile, bounds=bounds)
+
+    return get_tile(path_to_pyramid, info, level, x, y, render, mode)
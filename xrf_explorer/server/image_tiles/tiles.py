@@ -0,0 +1,300 @@
+import json
+import logging
+
+from collections.abc import Callable
+from hashlib import sha1
+from math import ceil, log2
+from os import makedirs, replace
+from os.path import isdir, isfile, join
+from shutil import rmtree
+from threading import Lock, get_ident
+
+import numpy as np
+
+from PIL.Image import Image, fromarray
+
+from xrf_explorer.server.file_system import get_file_signature, get_path_to_generated_folder, load_cached_json
+from xrf_explorer.server.file_system.cubes import get_chunk_size
+from xrf_explorer.server.file_system.cubes.spectral import write_mipmaps
+from xrf_explorer.server.file_system.workspace import get_contextual_image, get_contextual_image_path
+
+LOG: logging.Logger = logging.getLogger(__name__)
+
+PYRAMIDS_FOLDER_NAME: str = 'pyramids'
+TILES_FOLDER_NAME: str = 'tiles'
+PYRAMID_INFO_FILE_NAME: str = 'info.json'
+TILE_SIZE: int = 256
+
+# the maximum number of levels that is computed in a single pass over a level, such that only a few levels are
+# open as memory maps at once
+MAX_LEVELS_PER_PASS: int = 4
+
+# generating a pyramid takes a while, make sure every pyramid is only generated once at a time
+PYRAMID_LOCKS: dict[str, Lock] = {}
+PYRAMID_LOCKS_LOCK: Lock = Lock()
+
+
+def get_pyramid_level_path(path_to_pyramid: str, level: int) -> str:
+    """
+    Gets the path to the raw file of a level of a pyramid.
+
+    :param path_to_pyramid: the folder of the pyramid
+    :param level: the level of the pyramid, 0 is a single pixel
+    :return: the path to the raw file of the level
+    """
+
+    return join(path_to_pyramid, f"level_{level}.raw")
+
+
+def get_pyramid_level_shape(info: dict, level: int) -> tuple[int, int, int]:
+    """
+    Gets the shape of a level of a pyramid. Every level halves the width and height of the level above it, rounded up.
+
+    :param info: the info of the pyramid, as returned by `generate_pyramid`
+    :param level: the level of the pyramid, 0 is a single pixel
+    :return: the shape of the level in format {y, x, channel}
+    """
+
+    factor: int = 2 ** (info["maxLevel"] - level)
+    return ceil(info["height"] / factor), ceil(info["width"] / factor), info["channels"]
+
+
+def get_pyramid_level(path_to_pyramid: str, info: dict, level: int) -> np.memmap:
+    """
+    Gets a level of a pyramid as a read-only memory map.
+
+    :param path_to_pyramid: the folder of the pyramid
+    :param info: the info of the pyramid, as returned by `generate_pyramid`
+    :param level: the level of the pyramid, 0 is a single pixel
+    :return: the level in format {y, x, channel}
+    """
+
+    # pyramids of images are always stored with 8 bits per channel
+    return np.memmap(get_pyramid_level_path(path_to_pyramid, level), mode="r",
+                     dtype=np.dtype(info.get("dtype", "uint8")), shape=get_pyramid_level_shape(info, level))
+
+
+def generate_pyramid(data: Image | np.ndarray, path_to_pyramid: str, key: dict) -> dict:
+    """
+    Generates a multi-resolution pyramid of an image or an array in a DeepZoom-like layout. The highest level is the
+    data at its original resolution, and every level below averages blocks of 2x2 pixels of the level above it, down to
+    a single pixel at level 0. Every level is stored as a raw file, from which tiles of `TILE_SIZE` pixels are cut by
+    `get_tile`.
+
+    :param data: the image, or the array in format {y, x} or {y, x, channel}, to generate the pyramid of
+    :param path_to_pyramid: the folder to store the pyramid in, any existing pyramid in the folder is removed
+    :param key: the key identifying the version of the data the pyramid is generated from
+    :return: the info of the pyramid, containing the key, size, number of channels, data type, tile size and highest
+        level
+    """
+
+    # images are stored with 8 bits per channel
+    if isinstance(data, Image) and data.mode not in ("L", "LA", "RGB", "RGBA"):
+        data = data.convert("RGBA" if "A" in data.getbands() else "RGB")
+
+    width, height = data.size if isinstance(data, Image) else (data.shape[1], data.shape[0])
+    channels: int = len(data.getbands()) if isinstance(data, Image) else (data.shape[2] if data.ndim == 3 else 1)
+    info: dict = {
+        "key": key,
+        "width": width,
+        "height": height,
+        "channels": channels,
+        "dtype": "uint8" if isinstance(data, Image) else data.dtype.str,
+        "tileSize": TILE_SIZE,
+        "maxLevel": ceil(log2(max(width, height, 1)))
+    }
+
+    # the pyramid is generated next to its folder and only moved into place once complete
+    path_to_tmp: str = f"{path_to_pyramid}.tmp"
+    if isdir(path_to_tmp):
+        rmtree(path_to_tmp)
+    makedirs(path_to_tmp)
+
+    # write the original resolution in bands of rows, such that the data is not copied at once
+    level: int = info["maxLevel"]
+    level_data: np.memmap = np.memmap(get_pyramid_level_path(path_to_tmp, level), mode="w+",
+                                      dtype=np.dtype(info["dtype"]), shape=get_pyramid_level_shape(info, level))
+    band_height: int = max(1, get_chunk_size() // max(1, width * channels * level_data.itemsize))
+    for band_start in range(0, height, band_height):
+        band_end: int = min(height, band_start + band_height)
+        band: np.ndarray = np.asarray(
+            data.crop((0, band_start, width, band_end)) if isinstance(data, Image) else data[band_start:band_end]
+        )
+        level_data[band_start:band_end] = band.reshape(band_end - band_start, width, channels)
+    level_data.flush()
+
+    # compute the lower levels in passes of a few levels at once
+    while level > 0:
+        levels: list[int] = list(range(level - 1, max(-1, level - 1 - MAX_LEVELS_PER_PASS), -1))
+        write_mipmaps(level_data, [get_pyramid_level_path(path_to_tmp, lower) for lower in levels], get_chunk_size())
+
+        level = levels[-1]
+        level_data = get_pyramid_level(path_to_tmp, info, level)
+    del level_data
+
+    with open(join(path_to_tmp, PYRAMID_INFO_FILE_NAME), 'w') as file:
+        json.dump(info, file)
+
+    if isdir(path_to_pyramid):
+        rmtree(path_to_pyramid)
+    replace(path_to_tmp, path_to_pyramid)
+
+    return info
+
+
+def get_pyramid_lock(path_to_pyramid: str) -> Lock:
+    """
+    Gets the lock that makes sure a pyramid is only generated once at a time.
+
+    :param path_to_pyramid: the folder of the pyramid
+    :return: the lock of the pyramid
+    """
+
+    with PYRAMID_LOCKS_LOCK:
+        return PYRAMID_LOCKS.setdefault(path_to_pyramid, Lock())
+
+
+def get_pyramid(path_to_pyramid: str, key: dict, load_data: Callable[[], Image | np.ndarray | None]) -> dict | None:
+    """
+    Gets the info of the pyramid stored in a folder, as generated by `generate_pyramid`. The pyramid is only
+    regenerated if it was generated for another key.
+
+    :param path_to_pyramid: the folder of the pyramid
+    :param key: the key identifying the current version of the data
+    :param load_data: function loading the image or array, only called if the pyramid has to be generated
+    :return: the info of the pyramid, or None if it could not be generated
+    """
+
+    path_to_info: str = join(path_to_pyramid, PYRAMID_INFO_FILE_NAME)
+
+    # use the stored pyramid if it is up-to-date
+    info: dict | None = load_cached_json(path_to_info, key)
+    if info is not None:
+        return info
+
+    with get_pyramid_lock(path_to_pyramid):
+        # the pyramid might have been generated while waiting for the lock
+        info = load_cached_json(path_to_info, key)
+        if info is not None:
+            return info
+
+        data: Image | np.ndarray | None = load_data()
+        if data is None or (isinstance(data, np.ndarray) and data.size == 0):
+            return None
+
+        LOG.info(f"Generating pyramid at {path_to_pyramid}")
+
+        try:
+            return generate_pyramid(data, path_to_pyramid, key)
+        except OSError as err:
+            LOG.error(f"Could not generate pyramid at {path_to_pyramid}: {err}")
+            return None
+
+
+def get_tile(
+        path_to_pyramid: str, info: dict, level: int, x: int, y: int,
+        render: Callable[[np.ndarray], np.ndarray] | None = None, variant: str = ""
+) -> str | None:
+    """
+    Gets the path to a tile of a pyramid as a PNG image. The tiles are encoded the first time they are requested, and
+    stored next to the levels of the pyramid.
+
+    :param path_to_pyramid: the folder of the pyramid
+    :param info: the info of the pyramid, as returned by `get_pyramid`
+    :param level: the level of the tile, 0 is a single pixel
+    :param x: the column of the tile
+    :param y: the row of the tile
+    :param render: function converting the data of the tile in format {y, x, channel} to an 8-bit image, only needed
+        if the pyramid does not store 8-bit data
+    :param variant: name distinguishing tiles rendered with different functions
+    :return: the path to the tile, or None if the tile is outside the pyramid
+    """
+
+    if not 0 <= level <= info["maxLevel"]:
+        return None
+
+    height, width, channels = get_pyramid_level_shape(info, level)
+    tile_size: int = info["tileSize"]
+    if not (0 <= x < ceil(width / tile_size) and 0 <= y < ceil(height / tile_size)):
+        return None
+
+    file_name: str = f"{x}_{y}_{variant}.png" if variant else f"{x}_{y}.png"
+    path_to_tile: str = join(path_to_pyramid, TILES_FOLDER_NAME, str(level), file_name)
+    if isfile(path_to_tile):
+        return path_to_tile
+
+    # cut the tile from the level
+    data: np.memmap = get_pyramid_level(path_to_pyramid, info, level)
+    tile: np.ndarray = np.array(data[y * tile_size:(y + 1) * tile_size, x * tile_size:(x + 1) * tile_size])
+    del data
+
+    if render is not None:
+        tile = render(tile)
+
+    # store the tile, the file is replaced at once, such that it is never partially written
+    makedirs(join(path_to_pyramid, TILES_FOLDER_NAME, str(level)), exist_ok=True)
+    path_to_tmp: str = f"{path_to_tile}.{get_ident()}.tmp"
+    fromarray(tile[:, :, 0] if tile.ndim == 3 and tile.shape[2] == 1 else tile).save(path_to_tmp, "png")
+    replace(path_to_tmp, path_to_tile)
+
+    return path_to_tile
+
+
+def get_contextual_image_pyramid_path(data_source: str, name: str) -> str | None:
+    """
+    Gets the folder of the pyramid of a contextual image in the generated folder of the data source.
+
+    :param data_source: the data source of the image
+    :param name: the name of the image in `workspace.json`
+    :return: the folder of the pyramid, or None if the generated folder could not be found
+    """
+
+    path_to_generated_folder: str = get_path_to_generated_folder(data_source)
+    if not path_to_generated_folder:
+        return None
+
+    # the names of images are chosen by the user, so they are hashed to get a valid folder name
+    return join(path_to_generated_folder, PYRAMIDS_FOLDER_NAME, sha1(name.encode()).hexdigest())
+
+
+def get_contextual_image_pyramid(data_source: str, name: str) -> dict | None:
+    """
+    Gets the info of the pyramid of a contextual image, as generated by `generate_pyramid`. The pyramid is generated
+    the first time it is requested, and regenerated if the image changed since.
+
+    :param data_source: the data source of the image
+    :param name: the name of the image in `workspace.json`
+    :return: the info of the pyramid, or None if the image could not be found
+    """
+
+    path_to_image: str | None = get_contextual_image_path(data_source, name)
+    signature: tuple[int, int] | None = None if path_to_image is None else get_file_signature(path_to_image)
+    path_to_pyramid: str | None = get_contextual_image_pyramid_path(data_source, name)
+    if signature is None or path_to_pyramid is None:
+        LOG.error(f"Could not find contextual image {name} of data source {data_source}")
+        return None
+
+    # the pyramid is valid as long as the image remains the same
+    key: dict = {"path": path_to_image, "mtime": signature[0], "size": signature[1]}
+
+    return get_pyramid(path_to_pyramid, key, lambda: get_contextual_image(path_to_image))
+
+
+def get_contextual_image_tile(data_source: str, name: str, level: int, x: int, y: int) -> str | None:
+    """
+    Gets the path to a tile of the pyramid of a contextual image, as returned by `get_tile`.
+
+    :param data_source: the data source of the image
+    :param name: the name of the image in `workspace.json`
+    :param level: the level of the tile, 0 is a single pixel
+    :param x: the column of the tile
+    :param y: the row of the tile
+    :return: the path to the tile, or None if the image could not be found or the tile is outside the pyramid
+    """
+
+    info: dict | None = get_contextual_image_pyramid(data_source, name)
+    path_to_pyramid: str | None = get_contextual_image_pyramid_path(data_source, name)
+    if info is None or path_to_pyramid is None:
+        return None
+
+    return get_tile(path_to_pyramid, info, level, x, y)
@@ -1,8 +1,20 @@
 from .image_to_cube_selection import (
     get_selection,
+    get_selection_mask,
+    get_selection_box,
+    get_selection_coordinates,
     get_scaled_cube_coordinates,
     perspective_transform_coord,
     deregister_coord,
+    deregister_coords,
+    SelectionMask,
     SelectionType,
     CubeType
 )
+from .selection_cache import (
+    get_selection_key,
+    get_cached_selection_result,
+    get_cached_selection_mask,
+    get_selection_cache_statistics,
+    clear_selection_cache
+)
@@ -1,21 +1,33 @@
 import logging
 
 from enum import Enum
+from functools import lru_cache
 
 import numpy as np
 
-from cv2 import fillPoly, imread, perspectiveTransform, getPerspectiveTransform, convexHull
+from cv2 import fillPoly, perspectiveTransform, getPerspectiveTransform, convexHull
 
-from xrf_explorer.server.file_system.cubes import parse_rpl, get_elemental_datacube_dimensions
+from xrf_explorer.server.file_system import get_file_signature
+from xrf_explorer.server.file_system.cubes import (
+    get_rpl_info,
+    get_elemental_datacube_dimensions,
+    RplInfo,
+    SelectionMask
+)
 from xrf_explorer.server.file_system.workspace.file_access import get_elemental_cube_recipe_path, get_spectral_cube_recipe_path
 from xrf_explorer.server.image_register import load_points, compute_fitting_dimensions_by_aspect
 from xrf_explorer.server.file_system.workspace import (
     get_base_image_path,
+    get_contextual_image_size,
     get_raw_rpl_paths,
 )
 
 LOG: logging.Logger = logging.getLogger(__name__)
 
+# the number of recipes of which the deregistration transformation is remembered, every version of a recipe takes an
+# entry
+DEREGISTER_TRANSFORM_CACHE_SIZE: int = 64
+
 
 class SelectionType(str, Enum):
     """
@@ -57,43 +69,77 @@ def perspective_transform_coord(coord: tuple[int, int], transform_matrix: np.nda
     return float(perspective_transformed_point[0][0][0]), float(perspective_transformed_point[0][0][1])
 
 
-def deregister_coord(
-        coord: tuple[int, int],
+@lru_cache(maxsize=DEREGISTER_TRANSFORM_CACHE_SIZE)
+def load_deregister_transform(cube_recipe_path: str, mtime: int, size: int) -> np.ndarray:
+    """
+    Loads the perspective transformation from the base image to the cube from a cube recipe. The modification time and
+    size of the recipe are only used to identify the version of the recipe in the cache.
+
+    :param cube_recipe_path: The path to the cube recipe.
+    :param mtime: The modification time of the recipe in nanoseconds.
+    :param size: The size of the recipe in bytes.
+    :return: The read-only transformation matrix from the base image to the cube, before scaling.
+    """
+    src_points: np.ndarray
+    base_points: np.ndarray
+    src_points, base_points = load_points(cube_recipe_path)
+
+    transform_matrix: np.ndarray = getPerspectiveTransform(base_points, src_points)
+
+    # the matrix is shared between callers, so make sure it is not modified
+    transform_matrix.setflags(write=False)
+    return transform_matrix
+
+
+def get_deregister_transform(cube_recipe_path: str) -> np.ndarray:
+    """
+    Gets the perspective transformation from the base image to the cube from a cube recipe, as loaded by
+    `load_deregister_transform`. The transformation is cached until the recipe changes.
+
+    :param cube_recipe_path: The path to the cube recipe.
+    :raises FileNotFoundError: If the cube recipe does not exist.
+    :return: The read-only transformation matrix from the base image to the cube, before scaling.
+    """
+    signature: tuple[int, int] | None = get_file_signature(cube_recipe_path)
+    if signature is None:
+        raise FileNotFoundError(f"Cube recipe not found at {cube_recipe_path}")
+
+    return load_deregister_transform(cube_recipe_path, *signature)
+
+
+def deregister_coords(
+        coords: list[tuple[int, int]],
         cube_recipe_path: str,
         base_img_height: int,
         base_img_width: int,
         cube_height: int,
         cube_width: int,
-) -> tuple[int, int]:
+) -> list[tuple[int, int]]:
     """
-    Translates an (x, y) coordinate to its (x', y') counterpart in the cube coordinate system.
-    The function assumes that the cube recipe maps cube coordinates to the base image coordinates.
+    Translates a list of (x, y) coordinates to their (x', y') counterparts in the cube coordinate system, as done by
+    `deregister_coord`. All coordinates are transformed at once.
 
-    :param coord: The (x, y) coordinate to be translated.
+    :param coords: The (x, y) coordinates to be translated.
     :param cube_recipe_path: The path to the cube recipe.
     :param base_img_height: The height of the base image in pixels.
     :param base_img_width: The width of the base image in pixels.
     :param cube_height: The height of the cube.
     :param cube_width: The width of the cube.
-    :return: A (x', y') tuple representing the translated coordinate to the cube's coordinates.
+    :return: A list of (x', y') tuples representing the translated coordinates, in the same order as they were input.
     """
+    if len(coords) == 0:
+        return []
+
     # Note: Reversing padding is not needed, since the images are padded
     #       on their right and bottom sides. Since (0, 0) is in the top
     #       left corner of the image, padding does not affect the coordinate
     #       system.
 
     # First step: Reverse perspective transformation
-    src_points: np.ndarray
-    base_points: np.ndarray
-    src_points, base_points = load_points(cube_recipe_path)
-
-    transform_matrix: np.ndarray = getPerspectiveTransform(
-        base_points, src_points)
+    transform_matrix: np.ndarray = get_deregister_transform(cube_recipe_path)
 
-    x_perspective_reversed: float
-    y_perspective_reversed: float
-    x_perspective_reversed, y_perspective_reversed = perspective_transform_coord(
-        coord, transform_matrix)
+    coords_correct_format: np.ndarray = np.array(coords, dtype="float32").reshape(-1, 1, 2)
+    coords_perspective_reversed: np.ndarray = perspectiveTransform(coords_correct_format, transform_matrix)
 
     cube_height_scaled_before_pad: int
     cube_width_scaled_before_pad: int
@@ -102,16 +148,39 @@ def deregister_coord(
     )
 
     # Second step: Reverse scaling
-    x_reversed_scaling: float
-    y_reversed_scaling: float
+    ratios: np.ndarray = np.array([
+        cube_width / cube_width_scaled_before_pad,
+        cube_height / cube_height_scaled_before_pad
+    ])
+
+    coords_reversed_scaling: np.ndarray = np.rint(coords_perspective_reversed[:, 0].astype(np.float64) * ratios)
+
+    return [(int(x), int(y)) for x, y in coords_reversed_scaling]
 
-    ratio_x = cube_width / cube_width_scaled_before_pad
-    ratio_y = cube_height / cube_height_scaled_before_pad
 
-    x_reversed_scaling = x_perspective_reversed * ratio_x
-    y_reversed_scaling = y_perspective_reversed * ratio_y
+def deregister_coord(
+        coord: tuple[int, int],
+        cube_recipe_path: str,
+        base_img_height: int,
+        base_img_width: int,
+        cube_height: int,
+        cube_width: int,
+) -> tuple[int, int]:
+    """
+    Translates an (x, y) coordinate to its (x', y') counterpart in the cube coordinate system.
+    The function assumes that the cube recipe maps cube coordinates to the base image coordinates.
 
-    return round(x_reversed_scaling), round(y_reversed_scaling)
+    :param coord: The (x, y) coordinate to be translated.
+    :param cube_recipe_path: The path to the cube recipe.
+    :param base_img_height: The height of the base image in pixels.
+    :param base_img_width: The width of the base image in pixels.
+    :param cube_height: The height of the cube.
+    :param cube_width: The width of the cube.
+    :return: A (x', y') tuple representing the translated coordinate to the cube's coordinates.
+    """
+    return deregister_coords(
+        [coord], cube_recipe_path, base_img_height, base_img_width, cube_height, cube_width
+    )[0]
 
 
 def get_scaled_cube_coordinates(
@@ -132,39 +201,29 @@ def get_scaled_cube_coordinates(
     :param cube_height: The height of the cube.
     :return: A list of all the scaled coordinates, in the same order as they were input.
     """
-    ratio_cube_img_width: float = cube_width / base_img_width
-    ratio_cube_img_height: float = cube_height / base_img_height
-
-    scaled_coords: list[tuple[int, int]] = []
+    ratios: np.ndarray = np.array([cube_width / base_img_width, cube_height / base_img_height])
 
-    for coord in coords:
-        scaled_coord: tuple[int, int] = (
-            round(coord[0] * ratio_cube_img_width),
-            round(coord[1] * ratio_cube_img_height)
-        )
-        scaled_coords.append(scaled_coord)
+    # np.rint rounds halves to even, like round
+    scaled_coords: np.ndarray = np.rint(np.array(coords, dtype=np.float64).reshape(-1, 2) * ratios)
 
-    return scaled_coords
+    return [(int(x), int(y)) for x, y in scaled_coords]
 
 
-def compute_selection_mask(
+def compute_selection(
         selection_type: SelectionType,
         selection: list[tuple[int, int]],
         cube_width: int,
-        cube_height: int):
+        cube_height: int) -> SelectionMask:
     """
-    Compute the selection mask of a given selection.
-    
+    Compute the selection of a given selection, only filling the mask of the bounding box of the selection.
+
     :param selection_type: The type of selection the mask being computed is for.
     :param selection: List of points that define the selection.
     :param cube_width: Width of the elemental datacube.
     :param cube_height: Height of the elemental datacube.
-    :return: 2D mask of the datacube, where mask[y, x]==True means the point at (x, y) is in the selection,
-    False means it is not.
+    :return: The selection, containing the mask of the bounding box of the selected pixels within the datacube.
     """
-    mask: np.ndarray = np.zeros((cube_height, cube_width), dtype=np.uint8)
-
-    np_selection: np.ndarray = np.array(selection)
+    np_selection: np.ndarray = np.array(selection, dtype=np.int32)
 
     # If the selection is Rectangle selection, the polygon cannot self intersect,
     # so find the convex hull of the selection
@@ -182,34 +241,66 @@ def compute_selection_mask(
 
         np_selection = convexHull(np.array([p1, p2, p3, p4]))
 
+    # Only the bounding box of the selection within the cube has to be filled
+    points: np.ndarray = np_selection.reshape(-1, 2)
+    top: int = max(0, int(points[:, 1].min()))
+    bottom: int = min(cube_height, int(points[:, 1].max()) + 1)
+    left: int = max(0, int(points[:, 0].min()))
+    right: int = min(cube_width, int(points[:, 0].max()) + 1)
+
+    if top >= bottom or left >= right:
+        return SelectionMask(0, 0, np.zeros((0, 0), dtype=bool), (cube_height, cube_width))
+
+    mask: np.ndarray = np.zeros((bottom - top, right - left), dtype=np.uint8)
+
     # Write 1's in the polygon area
     # Takes into account the weird shapes that can occur if the points are
     # in different order
-    fillPoly(mask, [np_selection], (1,))
+    fillPoly(mask, [np_selection], (1,), offset=(-left, -top))
 
-    return mask.astype(bool)
+    # Crop the mask to the selected pixels, as the polygon does not have to fill its bounding box
+    cropped: SelectionMask = SelectionMask.from_array(mask.astype(bool))
+    return SelectionMask(top + cropped.top, left + cropped.left, cropped.mask, (cube_height, cube_width))
 
 
-def get_selection(
+def compute_selection_mask(
+        selection_type: SelectionType,
+        selection: list[tuple[int, int]],
+        cube_width: int,
+        cube_height: int) -> np.ndarray:
+    """
+    Compute the selection mask of a given selection.
+    
+    :param selection_type: The type of selection the mask being computed is for.
+    :param selection: List of points that define the selection.
+    :param cube_width: Width of the elemental datacube.
+    :param cube_height: Height of the elemental datacube.
+    :return: 2D mask of the datacube, where mask[y, x]==True means the point at (x, y) is in the selection,
+    False means it is not.
+    """
+    return compute_selection(selection_type, selection, cube_width, cube_height).to_array()
+
+
+def get_selection_coordinates(
         data_source_folder: str,
         selection_coords: list[tuple[int, int]],
         selection_type: SelectionType,
         cube_type: CubeType
-) -> np.ndarray | None:
+) -> tuple[list[tuple[int, int]], int, int] | None:
     """
-    Extracts and returns a 2D representation of a data cube region, based on the selection coordinates on the base
-    image. If the specified data source contains a recipe for the data cube, the selection made on the base image is
-    "deregistered" so that the returned data from the function correctly represents the selected pixels on the image. If
-    the data cube does not have a recipe, the selection made on the base image is simply scaled to match the data cube's
-    dimensions.
+    Translates the coordinates of a selection on the base image to the coordinate system of a data cube. If the
+    specified data source contains a recipe for the data cube, the selection made on the base image is "deregistered".
+    If the data cube does not have a recipe, the selection made on the base image is simply scaled to match the data
+    cube's dimensions.
 
     :param data_source_folder: The data source folder name.
-    :param selection_coords: The coordinates tuples (x, y), in order, of the selection. In case of a rectangle 
-    :param selection_type: The type of selection being performed. selection, the list must contain the two opposite
-    corners of the selection rectangle. In case of polygon selection, the list must contain the points in the order in
-    which they form the selection area.
+    :param selection_coords: The coordinates tuples (x, y), in order, of the selection. In case of a rectangle
+        selection, the list must contain the two opposite corners of the selection rectangle. In case of polygon
+        selection, the list must contain the points in the order in which they form the selection area.
+    :param selection_type: The type of selection being performed.
     :param cube_type: The type of the cube the selection is made on.
-    :return: A boolean mask over the data cube indicating which pixels are part of the selection.
+    :return: A tuple containing the coordinates of the selection in the data cube, the width of the cube and the
+        height of the cube. None if an error occurred.
     """
     if selection_type == SelectionType.Rectangle and len(selection_coords) != 2:
         LOG.error(f"Expected 2 points for rectangle selection but got {len(selection_coords)}")
@@ -225,13 +316,20 @@ def get_selection(
         LOG.error(f"Data source directory {data_source_folder} does not exist.")
         return None
 
+    # Only the header of the base image is read to get its dimensions
+    base_img_size: tuple[int, int] | None = get_contextual_image_size(base_img_dir)
+
+    if base_img_size is None:
+        LOG.error(f"Could not retrieve dimensions of the base image in data source folder {data_source_folder}.")
+        return None
+
     img_h: int
     img_w: int
     cube_h: int
     cube_w: int
     cube_recipe_path: str | None
 
-    img_h, img_w, _ = imread(base_img_dir).shape
+    img_w, img_h = base_img_size
 
     match cube_type:
         case CubeType.Elemental:
@@ -251,10 +349,13 @@ def get_selection(
             path_to_rpl = get_raw_rpl_paths(data_source_folder)[1]
 
             # Get info about the spectral cube from the rpl
-            info = parse_rpl(path_to_rpl)
+            info: RplInfo | None = get_rpl_info(path_to_rpl)
+            if info is None:
+                LOG.error(f"Could not retrieve dimension of spectral cube in data source {data_source_folder}.")
+                return None
 
             # Get the spectral cube dimensions
-            cube_w, cube_h = int(info["width"]), int(info["height"])
+            cube_w, cube_h = info.width, info.height
 
             # Load the recipe path for the spectral cube
             cube_recipe_path: str | None = get_spectral_cube_recipe_path(data_source_folder)
@@ -268,22 +369,108 @@ def get_selection(
             selection_coords, img_w, img_h, cube_w, cube_h
         )
 
-        mask: np.ndarray = compute_selection_mask(selection_type, selection_coords_scaled, cube_w, cube_h)
-
-        # Note: Using selection with a boolean mask for a simple rectangular selection is not
-        #       the best choice for performance, but the mask simplifies things, since it can be
-        #       used for all kinds of selections to be implemented in the future.
-        #       Also, the performance decrease should be less than tenth of a second in most cases.
-        return mask
+        return selection_coords_scaled, cube_w, cube_h
     else:
         # If the data cube has a recipe, deregister the selection coordinates, so they correctly represent
         # the selected area on the data cube
-        args = (cube_recipe_path, img_h, img_w, cube_h, cube_w)
-        selection_coords_deregistered: list[tuple[int, int]] = []
-        for coord in selection_coords:
-            coord_deregistered: tuple[int, int] = deregister_coord(coord, *args)
-            selection_coords_deregistered.append(coord_deregistered)
+        selection_coords_deregistered: list[tuple[int, int]] = deregister_coords(
+            selection_coords, cube_recipe_path, img_h, img_w, cube_h, cube_w
+        )
+
+        return selection_coords_deregistered, cube_w, cube_h
+
+
+def get_selection_mask(
+        data_source_folder: str,
+        selection_coords: list[tuple[int, int]],
+        selection_type: SelectionType,
+        cube_type: CubeType
+) -> SelectionMask | None:
+    """
+    Computes the selected pixels of a data cube, based on the selection coordinates on the base image. The coordinates
+    are translated to the data cube with `get_selection_coordinates`. Only the mask of the bounding box of the
+    selection is stored, such that small selections on large cubes stay small.
+
+    :param data_source_folder: The data source folder name.
+    :param selection_coords: The coordinates tuples (x, y), in order, of the selection. In case of a rectangle
+        selection, the list must contain the two opposite corners of the selection rectangle. In case of polygon
+        selection, the list must contain the points in the order in which they form the selection area.
+    :param selection_type: The type of selection being performed.
+    :param cube_type: The type of the cube the selection is made on.
+    :return: The selection over the data cube indicating which pixels are part of the selection.
+    """
+    selection: tuple[list[tuple[int, int]], int, int] | None = get_selection_coordinates(
+        data_source_folder, selection_coords, selection_type, cube_type
+    )
+    if selection is None:
+        return None
+
+    cube_coords, cube_w, cube_h = selection
 
-        mask: np.ndarray = compute_selection_mask(selection_type, selection_coords_deregistered, cube_w, cube_h)
+    # Note: Rectangle selections can use `get_selection_box` instead, which does not need a mask.
+    return compute_selection(selection_type, cube_coords, cube_w, cube_h)
+
+
+def get_selection(
+        data_source_folder: str,
+        selection_coords: list[tuple[int, int]],
+        selection_type: SelectionType,
+        cube_type: CubeType
+) -> np.ndarray | None:
+    """
+    Extracts and returns a 2D representation of a data cube region, based on the selection coordinates on the base
+    image. The selection is computed with `get_selection_mask`.
+
+    :param data_source_folder: The data source folder name.
+    :param selection_coords: The coordinates tuples (x, y), in order, of the selection. In case of a rectangle
+        selection, the list must contain the two opposite corners of the selection rectangle. In case of polygon
+        selection, the list must contain the points in the order in which they form the selection area.
+    :param selection_type: The type of selection being performed.
+    :param cube_type: The type of the cube the selection is made on.
+    :return: A boolean mask over the data cube indicating which pixels are part of the selection.
+    """
+    selection: SelectionMask | None = get_selection_mask(
+        data_source_folder, selection_coords, selection_type, cube_type
+    )
+    if selection is None:
+        return None
+
+    return selection.to_array()
+
+
+def get_selection_box(
+        data_source_folder: str,
+        selection_coords: list[tuple[int, int]],
+        selection_type: SelectionType,
+        cube_type: CubeType
+) -> tuple[int, int, int, int] | None:
+    """
+    Computes the axis-aligned box in the data cube that is covered by a rectangle selection on the base image. The
+    box contains exactly the pixels of the mask computed by `get_selection`.
+
+    :param data_source_folder: The data source folder name.
+    :param selection_coords: The two opposite corners (x, y) of the selection rectangle.
+    :param selection_type: The type of selection being performed, should be a rectangle selection.
+    :param cube_type: The type of the cube the selection is made on.
+    :return: The box as (top, bottom, left, right), where bottom and right are exclusive. None if the selection is not
+        a rectangle, the box is empty or an error occurred.
+    """
+    if selection_type != SelectionType.Rectangle:
+        return None
+
+    selection: tuple[list[tuple[int, int]], int, int] | None = get_selection_coordinates(
+        data_source_folder, selection_coords, selection_type, cube_type
+    )
+    if selection is None:
+        return None
+
+    # The rectangle is filled between its corners, including its border, and clipped to the cube
+    (x1, y1), (x2, y2) = selection[0]
+    cube_w, cube_h = selection[1], selection[2]
+    top, bottom = max(0, min(y1, y2)), min(cube_h, max(y1, y2) + 1)
+    left, right = max(0, min(x1, x2)), min(cube_w, max(x1, x2) + 1)
+
+    if top >= bottom or left >= right:
+        return None
 
-        return mask
+    return top, bottom, left, right
@@ -0,0 +1,199 @@
+import logging
+
+from collections import OrderedDict
+from collections.abc import Callable
+from threading import Event, Lock
+from typing import Any
+
+from xrf_explorer.server.file_system import get_config, get_file_signature
+from xrf_explorer.server.file_system.cubes import SelectionMask
+from xrf_explorer.server.file_system.workspace import (
+    get_base_image_path,
+    get_elemental_cube_path,
+    get_elemental_cube_recipe_path,
+    get_path_to_workspace,
+    get_raw_rpl_paths
+)
+from xrf_explorer.server.file_system.workspace.file_access import get_spectral_cube_recipe_path
+from xrf_explorer.server.image_to_cube_selection.image_to_cube_selection import (
+    CubeType,
+    SelectionType,
+    get_selection_mask
+)
+
+LOG: logging.Logger = logging.getLogger(__name__)
+
+DEFAULT_SELECTION_CACHE_SIZE: int = 64
+
+# the selections that were recently computed, keyed by their geometry and the files they are computed from, in least
+# recently used order. Every entry maps the name of a result, such as the mask, to its value.
+SELECTION_CACHE: OrderedDict[tuple, dict[str, Any]] = OrderedDict()
+SELECTION_CACHE_STATISTICS: dict[str, int] = {"hits": 0, "misses": 0}
+SELECTION_CACHE_LOCK: Lock = Lock()
+
+# the results that are being computed, such that concurrent requests for the same result wait for the first one
+SELECTION_CACHE_PENDING: dict[tuple[tuple, str], Event] = {}
+
+
+def get_selection_cache_size() -> int:
+    """
+    Gets the maximum number of selections of which the results are kept in memory, as set under
+    `selection-cache-size` in the configuration.
+
+    :return: The number of selections, 0 if caching is disabled
+    """
+
+    config: dict | None = get_config()
+    if not config:
+        return DEFAULT_SELECTION_CACHE_SIZE
+
+    return max(0, int(config.get("selection-cache-size", DEFAULT_SELECTION_CACHE_SIZE)))
+
+
+def get_selection_cache_statistics() -> dict[str, int]:
+    """
+    Get the statistics of the selection cache.
+
+    :return: Dictionary with the number of cache hits and misses, and the number of cached selections.
+    """
+
+    with SELECTION_CACHE_LOCK:
+        return {
+            "hits": SELECTION_CACHE_STATISTICS["hits"],
+            "misses": SELECTION_CACHE_STATISTICS["misses"],
+            "entries": len(SELECTION_CACHE)
+        }
+
+
+def clear_selection_cache():
+    """
+    Removes all selections from the cache and resets its statistics.
+    """
+
+    with SELECTION_CACHE_LOCK:
+        SELECTION_CACHE.clear()
+        SELECTION_CACHE_STATISTICS["hits"] = 0
+        SELECTION_CACHE_STATISTICS["misses"] = 0
+
+
+def get_selection_key(
+        data_source: str,
+        selection_coords: list[tuple[int, int]],
+        selection_type: SelectionType,
+        cube_type: CubeType
+) -> tuple:
+    """
+    Gets the key of a selection in the cache. The key contains the geometry of the selection and the signatures of the
+    files the results of the selection are computed from, such that the results are recomputed when any of them
+    changes.
+
+    :param data_source: The data source folder name.
+    :param selection_coords: The coordinates tuples (x, y), in order, of the selection on the base image.
+    :param selection_type: The type of selection being performed.
+    :param cube_type: The type of the cube the selection is made on.
+    :return: The key of the selection.
+    """
+
+    # the workspace contains the locations of the cubes and recipes, and the binning of the raw data, while the recipe
+    # of the cube determines how the selection is deregistered to the cube
+    paths: list[str | None] = [get_path_to_workspace(data_source), get_base_image_path(data_source)]
+    if cube_type == CubeType.Raw:
+        paths += list(get_raw_rpl_paths(data_source))
+        paths.append(get_spectral_cube_recipe_path(data_source))
+    else:
+        paths.append(get_elemental_cube_path(data_source))
+        paths.append(get_elemental_cube_recipe_path(data_source))
+
+    signatures: tuple = tuple(None if not path else (path, get_file_signature(path)) for path in paths)
+
+    return data_source, cube_type.value, selection_type.value, tuple(map(tuple, selection_coords)), signatures
+
+
+def get_cached_selection_result(key: tuple, name: str, compute: Callable[[], Any]) -> Any:
+    """
+    Gets a result of a selection from the cache, or computes and caches it. Concurrent requests for the same result
+    are coalesced, only the first one computes the result while the others wait for it. Results that are None are not
+    cached. The cached results are shared between all callers, so they may not be modified.
+
+    :param key: The key of the selection, as returned by `get_selection_key`.
+    :param name: The name of the result of the selection.
+    :param compute: Function computing the result.
+    :return: The result of the selection.
+    """
+
+    if get_selection_cache_size() == 0:
+        return compute()
+
+    while True:
+        with SELECTION_CACHE_LOCK:
+            entry: dict[str, Any] | None = SELECTION_CACHE.get(key)
+            if entry is not None and name in entry:
+                SELECTION_CACHE.move_to_end(key)
+                SELECTION_CACHE_STATISTICS["hits"] += 1
+                return entry[name]
+
+            pending: Event | None = SELECTION_CACHE_PENDING.get((key, name))
+            if pending is None:
+                SELECTION_CACHE_STATISTICS["misses"] += 1
+                pending = Event()
+                SELECTION_CACHE_PENDING[(key, name)] = pending
+                break
+
+        # another request is computing the result, use its result once it is done
+        pending.wait()
+
+        # if it failed, compute the result in this request instead
+        with SELECTION_CACHE_LOCK:
+            entry = SELECTION_CACHE.get(key)
+            if entry is None or name not in entry:
+                SELECTION_CACHE_STATISTICS["misses"] += 1
+                return compute()
+
+    try:
+        result: Any = compute()
+
+        if result is not None:
+            with SELECTION_CACHE_LOCK:
+                SELECTION_CACHE.setdefault(key, {})[name] = result
+                SELECTION_CACHE.move_to_end(key)
+
+                while len(SELECTION_CACHE) > get_selection_cache_size():
+                    SELECTION_CACHE.popitem(last=False)
+
+        return result
+    finally:
+        with SELECTION_CACHE_LOCK:
+            del SELECTION_CACHE_PENDING[(key, name)]
+        pending.set()
+
+
+def get_cached_selection_mask(
+        data_source: str,
+        selection_coords: list[tuple[int, int]],
+        selection_type: SelectionType,
+        cube_type: CubeType,
+        key: tuple | None = None
+) -> SelectionMask | None:
+    """
+    Gets the selection of a data cube as computed by `get_selection_mask`, from the cache if it was computed before.
+
+    :param data_source: The data source folder name.
+    :param selection_coords: The coordinates tuples (x, y), in order, of the selection on the base image.
+    :param selection_type: The type of selection being performed.
+    :param cube_type: The type of the cube the selection is made on.
+    :param key: The key of the selection, as returned by `get_selection_key`, computed if not given.
+    :return: The selection over the data cube, or None if an error occurred.
+    """
+
+    if key is None:
+        key = get_selection_key(data_source, selection_coords, selection_type, cube_type)
+
+    def compute_mask() -> SelectionMask | None:
+        selection: SelectionMask | None = get_selection_mask(data_source, selection_coords, selection_type, cube_type)
+
+        # the mask is shared between all callers, so it may not be modified
+        if selection is not None:
+            selection.mask.setflags(write=False)
+        return selection
+
+    return get_cached_selection_result(key, "mask", compute_mask)
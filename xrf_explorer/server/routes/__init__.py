@@ -7,12 +7,20 @@ from .elemental_cube import (
     data_cube_recipe,
     list_element_names,
     elemental_map,
+    elemental_map_tiles,
+    elemental_map_tile,
     convert_elemental_cube,
     list_element_averages,
     list_element_averages_selection
 )
 from .general import api
-from .images import contextual_image, contextual_image_size, contextual_image_recipe
+from .images import (
+    contextual_image,
+    contextual_image_tiles,
+    contextual_image_tile,
+    contextual_image_size,
+    contextual_image_recipe
+)
 from .project import (
     list_accessible_data_sources,
     datasource_files,
@@ -22,4 +30,11 @@ from .project import (
     delete_data_source,
     upload_chunk
 )
-from .spectral_cube import bin_raw_data, get_offset, get_average_data, get_element_spectra, get_selection_spectra
+from .spectral_cube import (
+    bin_raw_data,
+    get_offset,
+    get_average_data,
+    get_element_spectra,
+    get_element_spectra_batch,
+    get_selection_spectra
+)
@@ -1,12 +1,9 @@
 import json
 
-from io import BytesIO
 from logging import Logger, getLogger
+from os.path import abspath
 
-import numpy as np
-
-from PIL.Image import Image, fromarray
-from flask import request, send_file
+from flask import make_response, request, send_file
 
 from xrf_explorer import app
 
@@ -16,19 +13,29 @@ from xrf_explorer.server.file_system.cubes import (
     get_element_averages_selection,
     get_element_names,
     get_elemental_datacube_dimensions,
-    get_elemental_map,
-    normalize_ndarray_to_grayscale
+    NORMALIZATION_MODES,
+    DEFAULT_NORMALIZATION_MODE,
+    get_elemental_map_etag,
+    get_rendered_elemental_map,
+    start_prerender_elemental_maps
 )
 
 from xrf_explorer.server.file_system.workspace import (
     get_workspace_dict,
-    get_elemental_cube_recipe_path,
-    get_elemental_cube_path
+    get_elemental_cube_recipe_path
 )
 
 from xrf_explorer.server.image_register import load_points_dict
-from xrf_explorer.server.image_to_cube_selection import CubeType
-from xrf_explorer.server.routes.helper import encode_selection
+from xrf_explorer.server.image_tiles import get_elemental_map_pyramid, get_elemental_map_tile
+from xrf_explorer.server.image_to_cube_selection import (
+    CubeType,
+    SelectionMask,
+    SelectionType,
+    get_cached_selection_mask,
+    get_cached_selection_result,
+    get_selection_key
+)
+from xrf_explorer.server.routes.helper import parse_selection
 
 LOG: Logger = getLogger(__name__)
 
@@ -96,23 +103,91 @@ def elemental_map(data_source: str, channel: int):
     :return: the elemental map
     """
 
+    # The maps can be normalized over their own channel or over the whole cube
+    mode: str = request.args.get("normalization", DEFAULT_NORMALIZATION_MODE)
+    if mode not in NORMALIZATION_MODES:
+        return f"Unknown normalization mode {mode}", 400
+
     # As the XRF Explorer only supports a single data cube, we do not have to do any wizardry to stitch maps together
-    path: str | None = get_elemental_cube_path(data_source)
-    if path is None:
+    etag: str | None = get_elemental_map_etag(data_source, channel, mode)
+    if etag is None:
         return f"Could not find elemental data cube in source {data_source}", 404
 
-    # Get the elemental map
-    image_array: np.ndarray = get_elemental_map(channel, path)
-    image_normalized: np.ndarray = normalize_ndarray_to_grayscale(image_array)
-    image: Image = fromarray(image_normalized).convert("L")
+    # The client already has the current version of the map
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "public, max-age=604800, immutable"
+        return response
 
-    # Save the image to an io buffer
-    image_io = BytesIO()
-    image.save(image_io, "png")
-    image_io.seek(0)
+    # Get the rendered elemental map
+    path: str | None = get_rendered_elemental_map(data_source, channel, mode)
+    if path is None:
+        return f"Could not render elemental map {channel} in source {data_source}", 404
 
     # Serve the image and ensure that the converted images are cached by the client
-    response = send_file(image_io, mimetype='image/png')
+    response = send_file(abspath(path), mimetype='image/png', etag=etag, conditional=False)
+    response.headers["Cache-Control"] = "public, max-age=604800, immutable"
+    return response
+
+
+@app.route("/api/<data_source>/data/elements/map/<int:channel>/tiles")
+def elemental_map_tiles(data_source: str, channel: int):
+    """
+    Get the layout of the tile pyramid of an elemental map. The highest level contains the map at its original
+    resolution, every level below halves the width and height, down to a single pixel at level 0.
+
+    :param data_source: data source to get the map from
+    :param channel: the channel to get the map from
+    :return: the size of the map, the size of the tiles and the highest level of the pyramid
+    """
+
+    info: dict | None = get_elemental_map_pyramid(data_source, channel)
+    if info is None:
+        return f"Could not find elemental map {channel} in source {data_source}", 404
+
+    return {
+        "width": info["width"],
+        "height": info["height"],
+        "tileSize": info["tileSize"],
+        "maxLevel": info["maxLevel"]
+    }
+
+
+@app.route("/api/<data_source>/data/elements/map/<int:channel>/tiles/<int:level>/<int:x>/<int:y>")
+def elemental_map_tile(data_source: str, channel: int, level: int, x: int, y: int):
+    """
+    Get a tile of the tile pyramid of an elemental map.
+
+    :param data_source: data source to get the map from
+    :param channel: the channel to get the map from
+    :param level: the level of the pyramid, 0 is a single pixel
+    :param x: the column of the tile
+    :param y: the row of the tile
+    :return: the tile of the elemental map
+    """
+
+    # The maps can be normalized over their own channel or over the whole cube
+    mode: str = request.args.get("normalization", DEFAULT_NORMALIZATION_MODE)
+    if mode not in NORMALIZATION_MODES:
+        return f"Unknown normalization mode {mode}", 400
+
+    map_etag: str | None = get_elemental_map_etag(data_source, channel, mode)
+    if map_etag is None:
+        return f"Could not find elemental data cube in source {data_source}", 404
+    etag: str = f"{map_etag}-{level}-{x}-{y}"
+
+    # The client already has the current version of the tile
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+        response.set_etag(etag)
+        return response
+
+    path: str | None = get_elemental_map_tile(data_source, channel, level, x, y, mode)
+    if path is None:
+        return f"Tile {level}/{x}/{y} of elemental map {channel} not found in source {data_source}", 404
+
+    response = send_file(abspath(path), mimetype='image/png', etag=etag, conditional=False)
     response.headers["Cache-Control"] = "public, max-age=604800, immutable"
     return response
 
@@ -139,6 +214,9 @@ def convert_elemental_cube(data_source: str):
         if not success:
             return "Error converting elemental data cube to .dms format", 500
 
+    # Render the maps of the converted cube in the background, such that they can be served at once
+    start_prerender_elemental_maps(data_source)
+
     return "Converted elemental data cube to .dms format", 200
 
 
@@ -170,13 +248,28 @@ def list_element_averages_selection(data_source: str):
             average: element abundance
         }
     """
-    mask: np.ndarray | tuple[str, int] = encode_selection(request.get_json(), data_source, CubeType.Elemental)
+    selection: SelectionType | str
+    points: list[tuple[int, int]] | int
+    selection, points = parse_selection(request.get_json())
+    if isinstance(points, int):
+        return selection, points
+
+    # repeated requests for the same selection are answered from the selection cache
+    key: tuple = get_selection_key(data_source, points, selection, CubeType.Elemental)
+
+    def compute_composition() -> list[dict[str, str | float]] | None:
+        mask: SelectionMask | None = get_cached_selection_mask(data_source, points, selection, CubeType.Elemental, key)
+        if mask is None:
+            return None
 
-    if isinstance(mask, tuple):
-        return mask[0], mask[1]
+        return get_element_averages_selection(data_source, mask)
 
     # get averages
-    composition: list[dict[str, str | float]] = get_element_averages_selection(data_source, mask)
+    composition: list[dict[str, str | float]] | None = get_cached_selection_result(
+        key, "element-averages", compute_composition
+    )
+    if composition is None:
+        return "Error occurred while computing the selection", 400
 
     try:
         return json.dumps(composition)
@@ -1,8 +1,6 @@
 from logging import Logger, getLogger
 
-import numpy as np
-
-from xrf_explorer.server.image_to_cube_selection import SelectionType, get_selection, CubeType
+from xrf_explorer.server.image_to_cube_selection import SelectionType
 
 LOG: Logger = getLogger(__name__)
 
@@ -50,24 +48,3 @@ def parse_selection(selection_data: dict[str: str]) -> tuple[SelectionType, list
         return "Error parsing points", 400
 
     return selection_type_parsed, points_parsed
-
-
-def encode_selection(selection_data: any, data_source: str, cube_type: CubeType) -> np.ndarray | tuple[str, int]:
-    """
-    Creates a bitmask of the given cube from a selection in JSON format.
-
-    :param selection_data: the selection data in JSON format as extracted from a request
-    :param data_source: the name of the data source containing the cube
-    :param cube_type: the type of the cube on which to apply the selection
-    :return: bitmask of the cube encoding the selection or None if an error occurred
-    """
-    # parse JSON payload
-    selection: SelectionType | str
-    points: list[tuple[int, int]] | int
-    selection, points = parse_selection(selection_data)
-
-    if isinstance(points, int):
-        return selection, points
-
-    # get selection
-    return get_selection(data_source, points, selection, cube_type)
@@ -1,5 +1,6 @@
 from io import BytesIO
 from logging import Logger, getLogger
+from os.path import abspath
 
 from PIL.Image import Image
 from flask import send_file
@@ -14,6 +15,7 @@ from xrf_explorer.server.file_system.workspace import (
 )
 
 from xrf_explorer.server.image_register import load_points_dict
+from xrf_explorer.server.image_tiles import get_contextual_image_pyramid, get_contextual_image_tile
 
 LOG: Logger = getLogger(__name__)
 
@@ -52,6 +54,52 @@ def contextual_image(data_source: str, name: str):
     return response
 
 
+@app.route("/api/<data_source>/image/<name>/tiles")
+def contextual_image_tiles(data_source: str, name: str):
+    """
+    Get the layout of the tile pyramid of a contextual image. The highest level contains the image at its original
+    resolution, every level below halves the width and height, down to a single pixel at level 0.
+
+    :param data_source: data source to get the image from
+    :param name: the name of the image in `workspace.json`
+    :return: the size of the image, the size of the tiles and the highest level of the pyramid
+    """
+
+    info: dict | None = get_contextual_image_pyramid(data_source, name)
+    if info is None:
+        return f"Image {name} not found in source {data_source}", 404
+
+    return {
+        "width": info["width"],
+        "height": info["height"],
+        "tileSize": info["tileSize"],
+        "maxLevel": info["maxLevel"]
+    }
+
+
+@app.route("/api/<data_source>/image/<name>/tiles/<int:level>/<int:x>/<int:y>")
+def contextual_image_tile(data_source: str, name: str, level: int, x: int, y: int):
+    """
+    Get a tile of the tile pyramid of a contextual image.
+
+    :param data_source: data source to get the image from
+    :param name: the name of the image in `workspace.json`
+    :param level: the level of the pyramid, 0 is a single pixel
+    :param x: the column of the tile
+    :param y: the row of the tile
+    :return: the tile converted to png
+    """
+
+    path: str | None = get_contextual_image_tile(data_source, name, level, x, y)
+    if path is None:
+        return f"Tile {level}/{x}/{y} of image {name} not found in source {data_source}", 404
+
+    # Ensure that the tiles are cached by the client
+    response = send_file(abspath(path), mimetype='image/png')
+    response.headers["Cache-Control"] = "public, max-age=604800, immutable"
+    return response
+
+
 @app.route("/api/<data_source>/image/<name>/size")
 def contextual_image_size(data_source: str, name: str):
     """
@@ -2,8 +2,6 @@ import json
 
 from logging import Logger, getLogger
 
-import numpy as np
-
 from flask import request
 
 from xrf_explorer import app
@@ -12,14 +10,29 @@ from xrf_explorer.server.file_system.cubes import (
     get_spectra_params,
     update_bin_params,
     bin_data,
-    parse_rpl,
-    get_raw_data
+    get_rpl_info,
+    RplInfo
 )
 
 from xrf_explorer.server.file_system.workspace import get_raw_rpl_paths
-from xrf_explorer.server.image_to_cube_selection import CubeType
-from xrf_explorer.server.routes.helper import encode_selection
-from xrf_explorer.server.spectra import get_average_global, get_theoretical_data, get_average_selection
+from xrf_explorer.server.image_to_cube_selection import (
+    CubeType,
+    SelectionMask,
+    SelectionType,
+    get_cached_selection_mask,
+    get_cached_selection_result,
+    get_selection_box,
+    get_selection_key
+)
+from xrf_explorer.server.routes.helper import parse_selection
+from xrf_explorer.server.spectra import (
+    get_global_spectrum_statistics,
+    get_theoretical_data,
+    get_theoretical_data_batch,
+    get_average_selection,
+    get_average_rectangle,
+    get_integral_image
+)
 
 LOG: Logger = getLogger(__name__)
 
@@ -49,6 +62,12 @@ def bin_raw_data(data_source: str):
 
             bin_data(data_source, low, high, bin_size)
             LOG.info("binned")
+
+            # precompute the global average spectrum of the binned data
+            get_global_spectrum_statistics(data_source)
+
+            # precompute the integral image index of the binned data, if enabled
+            get_integral_image(data_source)
             return "Binned data", 200
 
         except FileNotFoundError as err:
@@ -67,12 +86,12 @@ def get_offset(data_source: str):
     """
     _, path_to_rpl = get_raw_rpl_paths(data_source)
 
-    # get dimensions from rpl file
-    info = parse_rpl(path_to_rpl)
-    if 'depthscaleorigin' not in info:
+    # get the energy of the first channel from rpl file
+    info: RplInfo | None = get_rpl_info(path_to_rpl)
+    if info is None or info.depth_scale_origin is None:
         return json.dumps(0)
 
-    return json.dumps(float(info['depthscaleorigin']))
+    return json.dumps(info.depth_scale_origin)
 
 
 @app.route('/api/<data_source>/get_average_data', methods=['GET'])
@@ -82,13 +101,11 @@ def get_average_data(data_source: str):
 
     :return: json list of tuples containing the bin number and the average intensity for this bin
     """
-    datacube: np.ndarray = get_raw_data(data_source)
-    if len(datacube) == 0:
+    statistics: dict | None = get_global_spectrum_statistics(data_source)
+    if statistics is None:
         return "Error occurred while getting raw data", 404
 
-    average_values: list = get_average_global(datacube)
-
-    return json.dumps(average_values)
+    return json.dumps(statistics["mean"])
 
 
 @app.route('/api/<data_source>/get_element_spectrum/<element>/<excitation>', methods=['GET'])
@@ -119,20 +136,80 @@ def get_element_spectra(data_source: str, element: str, excitation: float):
     return json.dumps(theoretical_data)
 
 
+@app.route('/api/<data_source>/get_element_spectra', methods=['POST'])
+def get_element_spectra_batch(data_source: str):
+    """
+    Compute the theoretical spectra in channel range [low, high] for multiple elements at once, as computed by
+    `get_element_spectra`. The request body should contain the elements and the excitation energy in the form
+    `{"elements": ["Si K", "Fe K"], "excitation": 20}`.
+
+    :param data_source: the name of the data source, used for getting the spectrum boundaries and bin size
+    :return: JSON object containing for every element the theoretical spectrum and the peaks
+    """
+    body: dict | None = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return "Request body should be a JSON object", 400
+
+    elements: list | None = body.get("elements")
+    if not isinstance(elements, list) or not all(isinstance(element, str) for element in elements):
+        return "Elements should be a list of element names", 400
+
+    try:
+        excitation: float = float(body.get("excitation"))
+    except (TypeError, ValueError):
+        return "Excitation energy should be a number", 400
+
+    try:
+        params: dict[str, int] = get_spectra_params(data_source)
+    except FileNotFoundError:
+        return "error while loading workspace to retrieve spectra params", 404
+
+    theoretical_data: dict[str, list] = get_theoretical_data_batch(
+        elements, excitation, params["low"], params["high"], params["binSize"]
+    )
+
+    return json.dumps(theoretical_data)
+
+
 @app.route('/api/<data_source>/get_selection_spectrum', methods=['POST'])
 def get_selection_spectra(data_source: str):
     """
-    Get the average spectrum of the selected pixels of a rectangle selection.
+    Get the average spectrum of the selected pixels of a rectangle selection. If the request body contains `"exact":
+    true`, the average is computed over the original resolution of the raw data instead of a mipmap level.
 
     :param data_source: the name of the data source
     :return: JSON array where the index is the channel number and the value is the average intensity of that channel
     """
-    mask: np.ndarray | tuple[str, int] = encode_selection(request.get_json(), data_source, CubeType.Raw)
-    if isinstance(mask, tuple):
-        return mask[0], mask[1]
+    selection_data: dict = request.get_json()
+    exact: bool = bool(selection_data.get("exact", False))
+
+    # rectangles map to an axis-aligned box in the cube, which can be averaged without a mask
+    selection: SelectionType | str
+    points: list[tuple[int, int]] | int
+    selection, points = parse_selection(selection_data)
+    if isinstance(points, int):
+        return selection, points
+
+    # repeated requests for the same selection are answered from the selection cache
+    key: tuple = get_selection_key(data_source, points, selection, CubeType.Raw)
+
+    def compute_spectrum() -> list[float] | None:
+        box: tuple[int, int, int, int] | None = get_selection_box(data_source, points, selection, CubeType.Raw)
+        if box is not None:
+            return get_average_rectangle(data_source, box, exact)
+
+        mask: SelectionMask | None = get_cached_selection_mask(data_source, points, selection, CubeType.Raw, key)
+        if mask is None:
+            return None
+
+        return get_average_selection(data_source, mask, exact)
+
+    result: list[float] | None = get_cached_selection_result(
+        key, "spectrum-exact" if exact else "spectrum", compute_spectrum
+    )
+    if result is None:
+        return "Error occurred while computing the selection", 400
 
-    # get average
-    result: list[float] = get_average_selection(data_source, mask)
     try:
         return json.dumps(result)
     except Exception as e:
@@ -1,2 +1,13 @@
 """This module handles everything related to the spectral chart."""
-from .spectra import get_average_global, get_raw_data, get_average_selection, get_theoretical_data
+from .spectra import (
+    get_average_global,
+    get_global_spectrum_statistics,
+    get_raw_data,
+    get_average_selection,
+    get_theoretical_data,
+    get_theoretical_data_batch,
+    get_element_lines,
+    get_element_line_table,
+    prewarm_element_line_tables
+)
+from .integral_image import get_average_rectangle, get_integral_image
@@ -0,0 +1,233 @@
+import logging
+
+from math import ceil, log
+from os.path import join
+from threading import Lock
+
+import numpy as np
+
+from xrf_explorer.server.file_system import (
+    get_config,
+    get_file_signature,
+    get_path_to_generated_folder,
+    load_cached_array,
+    store_cached_array
+)
+from xrf_explorer.server.file_system.cubes import get_raw_data, get_chunk_size, get_spectra_params, SelectionMask
+from xrf_explorer.server.file_system.workspace import get_raw_rpl_paths
+from xrf_explorer.server.spectra.spectra import get_average_selection
+
+LOG: logging.Logger = logging.getLogger(__name__)
+
+INTEGRAL_IMAGE_FILE_NAME: str = 'integral_image.npy'
+
+# building an index takes a while, make sure the index of a data source is only built once at a time
+INTEGRAL_IMAGE_LOCKS: dict[str, Lock] = {}
+INTEGRAL_IMAGE_LOCKS_LOCK: Lock = Lock()
+
+
+def get_integral_image_level() -> int | None:
+    """
+    Gets the mipmap level of the spectral cube over which the integral image index is built, as configured under
+    `integral-image-level` in the backend config. The index is disabled if the level is missing or negative, as in the
+    default config, since building it for a large cube takes a while and only speeds up rectangle selections.
+
+    :return: the configured mipmap level, or None if the index is disabled
+    """
+
+    config: dict | None = get_config()
+    if config is None:
+        return None
+
+    level: int | None = config.get("integral-image-level")
+    if level is None or int(level) < 0:
+        return None
+
+    return int(level)
+
+
+def compute_integral_image(data: np.ndarray, path: str, chunk_size: int) -> np.memmap:
+    """
+    Computes the integral image (summed-area table) of the raw data and stores it as a .npy file. The integral image
+    has an extra row and column of zeros in front, such that integral[y, x] is the sum of the spectra of all pixels
+    in data[:y, :x]. The data is read in bands of rows, such that it never has to be fully loaded into memory.
+
+    :param data: datacube containing the raw data
+    :param path: the path of the .npy file to write the integral image to
+    :param chunk_size: maximum number of bytes of the data that is processed at once
+    :return: the integral image of shape (height + 1, width + 1, channels)
+    """
+
+    height, width, channels = data.shape
+    integral: np.memmap = np.lib.format.open_memmap(
+        path, mode="w+", dtype=np.float64, shape=(height + 1, width + 1, channels)
+    )
+    integral[0] = 0
+    integral[:, 0] = 0
+
+    # the sums are computed in float64, so bands are sized on the itemsize of the sums
+    band_height: int = max(1, chunk_size // max(1, width * channels * np.dtype(np.float64).itemsize))
+    previous_row: np.ndarray = np.zeros((width, channels), dtype=np.float64)
+    for band_start in range(0, height, band_height):
+        band: np.ndarray = np.asarray(data[band_start:band_start + band_height], dtype=np.float64)
+
+        # sum over the columns first, then over the rows continuing from the last row of the previous band
+        sums: np.ndarray = np.cumsum(np.cumsum(band, axis=1), axis=0)
+        sums += previous_row
+
+        integral[band_start + 1:band_start + 1 + band.shape[0], 1:] = sums
+        previous_row = sums[-1]
+
+    integral.flush()
+    return integral
+
+
+def get_integral_image_lock(data_source: str) -> Lock:
+    """
+    Gets the lock that makes sure the integral image of a data source is only built once at a time.
+
+    :param data_source: name of the data source
+    :return: the lock of the integral image of the data source
+    """
+
+    with INTEGRAL_IMAGE_LOCKS_LOCK:
+        return INTEGRAL_IMAGE_LOCKS.setdefault(data_source, Lock())
+
+
+def get_integral_image(data_source: str, wait: bool = True) -> np.ndarray | None:
+    """
+    Gets the integral image of the raw data of a data source at the configured mipmap level, as computed by
+    `compute_integral_image`. The integral image is stored in the generated folder of the data source, and only
+    recomputed if the raw data, the spectral parameters or the configured level changed since.
+
+    :param data_source: name of the data source to get the integral image of
+    :param wait: whether to wait for the integral image if it is being built by another request, otherwise None is
+        returned while it is built
+    :return: memory map of the integral image, or None if the index is disabled, being built or an error occurred
+    """
+
+    level: int | None = get_integral_image_level()
+    if level is None:
+        return None
+
+    # get the signature of the raw data
+    path_to_raw, _ = get_raw_rpl_paths(data_source)
+    signature: tuple[int, int] | None = get_file_signature(path_to_raw)
+    if signature is None:
+        LOG.error(f"Could not find raw data of data source {data_source}")
+        return None
+
+    try:
+        params: dict[str, int] = get_spectra_params(data_source)
+    except FileNotFoundError:
+        LOG.error(f"Could not get spectral parameters of data source {data_source}")
+        return None
+
+    # the index is valid as long as the raw data, binning parameters and level remain the same
+    key: dict[str, int] = {
+        "mtime": signature[0],
+        "size": signature[1],
+        "low": params["low"],
+        "high": params["high"],
+        "binSize": params["binSize"],
+        "level": level
+    }
+
+    path_to_generated_folder: str = get_path_to_generated_folder(data_source)
+    if not path_to_generated_folder:
+        return None
+    path_to_index: str = join(path_to_generated_folder, INTEGRAL_IMAGE_FILE_NAME)
+
+    # use the stored index if it is up-to-date
+    integral: np.ndarray | None = load_cached_array(path_to_index, key, mmap_mode='r')
+    if integral is not None:
+        return integral
+
+    lock: Lock = get_integral_image_lock(data_source)
+    if not lock.acquire(blocking=wait):
+        LOG.info(f"Integral image of data source {data_source} is being built")
+        return None
+
+    try:
+        # the index might have been built while waiting for the lock
+        integral = load_cached_array(path_to_index, key, mmap_mode='r')
+        if integral is not None:
+            return integral
+
+        LOG.info(f"Computing integral image of data source {data_source} at mip level {level}")
+
+        data: np.ndarray = get_raw_data(data_source, level=level)
+        if data.size == 0:
+            return None
+
+        def write_index(path: str):
+            compute_integral_image(data, path, get_chunk_size())
+
+        if not store_cached_array(path_to_index, key, write_index):
+            return None
+
+        return np.load(path_to_index, mmap_mode='r')
+    finally:
+        lock.release()
+
+
+def get_average_rectangle(data_source: str, box: tuple[int, int, int, int], exact: bool = False) -> list[float]:
+    """
+    Computes the average of the raw data for each bin on an axis-aligned rectangle of pixels. If the integral image
+    index is enabled and its level is at most the mipmap level `get_average_selection` would use, the summed spectrum
+    of the rectangle is computed from four lookups in the index. Otherwise, the average is computed by
+    `get_average_selection`.
+
+    :param data_source: name of the data source to get the rectangle average from
+    :param box: the rectangle as (top, bottom, left, right) in the raw data, where bottom and right are exclusive
+    :param exact: Whether to compute the average over the selected pixels of the original resolution
+    :return: list where the index is the channel number and the value is the average intensity of that channel within
+        the rectangle
+    """
+
+    top, bottom, left, right = box
+    num_points: int = max(0, bottom - top) * max(0, right - left)
+
+    config: dict | None = get_config()
+    level: int | None = get_integral_image_level()
+    if config is not None and level is not None and num_points > 0:
+        # the mipmap level that would be used for the selection, as in get_average_selection
+        max_points: int = int(config["max-spectrum-points"])
+        selection_level: int = 0 if exact else max(0, ceil(log(num_points / max_points, 4)))
+
+        # do not wait for an index that is being built, the selection is averaged over the raw data instead
+        integral: np.ndarray | None = (
+            get_integral_image(data_source, wait=False) if level <= selection_level else None
+        )
+        if integral is not None:
+            # the blocks of the mipmap level covered by the rectangle
+            factor: int = 2 ** level
+            block_top: int = top // factor
+            block_bottom: int = min(ceil(bottom / factor), integral.shape[0] - 1)
+            block_left: int = left // factor
+            block_right: int = min(ceil(right / factor), integral.shape[1] - 1)
+
+            if block_top < block_bottom and block_left < block_right:
+                LOG.info("Getting rectangle from integral image at mip level %i", level)
+                total: np.ndarray = (integral[block_bottom, block_right] - integral[block_top, block_right]
+                                     - integral[block_bottom, block_left] + integral[block_top, block_left])
+                average: np.ndarray = total / ((block_bottom - block_top) * (block_right - block_left))
+
+                LOG.info("Calculated the average spectrum for the selection.")
+                return average.tolist()
+
+    # fall back to a mask over the raw data
+    data: np.ndarray = get_raw_data(data_source)
+    if data.size == 0:
+        LOG.error(f"Could not load the raw data of data source {data_source}")
+        return []
+
+    # the rectangle clipped to the raw data, only the mask of the rectangle itself is needed
+    height, width = data.shape[:2]
+    top, bottom = min(max(0, top), height), min(max(0, bottom), height)
+    left, right = min(max(0, left), width), min(max(0, right), width)
+    mask: SelectionMask = SelectionMask(
+        top, left, np.ones((max(0, bottom - top), max(0, right - left)), dtype=bool), (height, width)
+    )
+
+    return get_average_selection(data_source, mask, exact)
@@ -1,15 +1,37 @@
 import logging
 
-from math import ceil, floor, log
+from functools import lru_cache
+from math import ceil, log
+from os.path import join
+from threading import Lock
 
 import numpy as np
 import xraydb
 
-from xrf_explorer.server.file_system import get_config
-from xrf_explorer.server.file_system.cubes import get_raw_data
+from xrf_explorer.server.file_system import (
+    get_config,
+    get_file_signature,
+    get_path_to_generated_folder,
+    load_cached_json,
+    store_cached_json
+)
+from xrf_explorer.server.file_system.cubes import (
+    get_raw_data,
+    get_chunk_size,
+    get_spectra_params,
+    get_element_names,
+    SelectionMask
+)
+from xrf_explorer.server.file_system.sources import get_data_sources_names
+from xrf_explorer.server.file_system.workspace import get_raw_rpl_paths
 
 LOG: logging.Logger = logging.getLogger(__name__)
 
+GLOBAL_SPECTRUM_FILE_NAME: str = 'global_spectrum.json'
+
+# Maximum number of (element, excitation energy) pairs of which the emission lines are kept in memory
+ELEMENT_LINES_CACHE_SIZE: int = 512
+
 
 def get_average_global(data: np.ndarray) -> list[float]:
     """
@@ -24,12 +46,158 @@ def get_average_global(data: np.ndarray) -> list[float]:
     return mean.tolist()
 
 
-def get_average_selection(data_source: str, mask: np.ndarray) -> list[float]:
+def compute_spectrum_statistics(data: np.ndarray, chunk_size: int) -> dict[str, int | list[float]]:
+    """
+    Computes the sum, mean, minimum and maximum of every bin over all pixels of the raw data. The data is read in bands
+    of rows, such that it never has to be fully loaded into memory.
+
+    :param data: datacube containing the raw data
+    :param chunk_size: maximum number of bytes of the data that is read at once
+    :return: dictionary with the number of pixels under "count", and lists where the index is the channel number under
+        "sum", "mean", "min" and "max"
+    """
+
+    height, width, channels = data.shape
+    total: np.ndarray = np.zeros(channels, dtype=np.float64)
+    minimum: np.ndarray = np.full(channels, np.inf)
+    maximum: np.ndarray = np.full(channels, -np.inf)
+
+    band_height: int = max(1, chunk_size // max(1, width * channels * data.itemsize))
+    for band_start in range(0, height, band_height):
+        band: np.ndarray = np.asarray(data[band_start:band_start + band_height]).reshape(-1, channels)
+        total += np.sum(band, axis=0, dtype=np.float64)
+        minimum = np.minimum(minimum, np.min(band, axis=0))
+        maximum = np.maximum(maximum, np.max(band, axis=0))
+
+    count: int = height * width
+
+    return {
+        "count": count,
+        "sum": total.tolist(),
+        "mean": (total / count).tolist(),
+        "min": minimum.tolist(),
+        "max": maximum.tolist()
+    }
+
+
+def get_global_spectrum_statistics(data_source: str) -> dict[str, int | list[float]] | None:
+    """
+    Gets the statistics of every bin over the whole painting, as computed by `compute_spectrum_statistics`. The
+    statistics are stored in the generated folder of the data source, and only recomputed if the raw data or the
+    spectral parameters changed since.
+
+    :param data_source: name of the data source to get the statistics of
+    :return: the statistics of the raw data, or None if an error occurred
+    """
+
+    # get the signature of the raw data
+    path_to_raw, _ = get_raw_rpl_paths(data_source)
+    signature: tuple[int, int] | None = get_file_signature(path_to_raw)
+    if signature is None:
+        LOG.error(f"Could not find raw data of data source {data_source}")
+        return None
+
+    try:
+        params: dict[str, int] = get_spectra_params(data_source)
+    except FileNotFoundError:
+        LOG.error(f"Could not get spectral parameters of data source {data_source}")
+        return None
+
+    # the statistics are valid as long as the raw data and binning parameters remain the same
+    key: dict[str, int] = {
+        "mtime": signature[0],
+        "size": signature[1],
+        "low": params["low"],
+        "high": params["high"],
+        "binSize": params["binSize"]
+    }
+
+    path_to_generated_folder: str = get_path_to_generated_folder(data_source)
+    if not path_to_generated_folder:
+        return None
+    path_to_statistics: str = join(path_to_generated_folder, GLOBAL_SPECTRUM_FILE_NAME)
+
+    # use the stored statistics if they are up-to-date
+    statistics: dict | None = load_cached_json(path_to_statistics, key)
+    if statistics is not None:
+        return statistics
+
+    LOG.info(f"Computing global spectrum statistics of data source {data_source}")
+
+    data: np.ndarray = get_raw_data(data_source)
+    if data.size == 0:
+        return None
+
+    statistics = compute_spectrum_statistics(data, get_chunk_size())
+    store_cached_json(path_to_statistics, key, statistics)
+
+    return statistics
+
+
+def downscale_mask(mask: np.ndarray, level: int) -> np.ndarray:
+    """
+    Downscales a mask to a mipmap level, a pixel of the downscaled mask is selected if any of the pixels in its block
+    of the original mask is selected.
+
+    :param mask: 2-dimensional boolean mask
+    :param level: the mipmap level to downscale the mask to
+    :return: the downscaled mask of shape (ceil(height / 2^level), ceil(width / 2^level))
+    """
+
+    if level <= 0:
+        return mask.astype(bool)
+
+    factor: int = 2 ** level
+    height, width = mask.shape
+
+    # pad the mask with unselected pixels to a multiple of the block size
+    padded: np.ndarray = np.zeros((ceil(height / factor) * factor, ceil(width / factor) * factor), dtype=bool)
+    padded[:height, :width] = mask
+
+    blocks: np.ndarray = padded.reshape(padded.shape[0] // factor, factor, padded.shape[1] // factor, factor)
+
+    return np.any(blocks, axis=(1, 3))
+
+
+def sum_selected_spectra(data: np.ndarray, mask: np.ndarray, top: int, left: int, chunk_size: int) -> np.ndarray:
     """
-    Computes the average of the raw data for each bin on the selected pixels.
+    Sums the spectra of the selected pixels of (a part of) the raw data. Only the part of the data covered by the mask
+    is read, in bands of rows, and bands without selected pixels are skipped.
+
+    :param data: datacube containing the raw data
+    :param mask: 2-dimensional boolean mask of the selected pixels in data[top:top + height, left:left + width]
+    :param top: the row of the data at which the mask starts
+    :param left: the column of the data at which the mask starts
+    :param chunk_size: maximum number of bytes of the data that is read at once
+    :return: array where the index is the channel number and the value is the total intensity of that channel
+    """
+
+    height, width = mask.shape
+    channels: int = data.shape[2]
+    total: np.ndarray = np.zeros(channels, dtype=np.float64)
+
+    band_height: int = max(1, chunk_size // max(1, width * channels * data.itemsize))
+    for band_start in range(0, height, band_height):
+        band_mask: np.ndarray = mask[band_start:band_start + band_height]
+        if not np.any(band_mask):
+            continue
+
+        band_top: int = top + band_start
+        band: np.ndarray = data[band_top:band_top + band_mask.shape[0], left:left + width]
+        total += np.sum(band[band_mask], axis=0, dtype=np.float64)
+
+    return total
+
+
+def get_average_selection(data_source: str, mask: np.ndarray | SelectionMask, exact: bool = False) -> list[float]:
+    """
+    Computes the average of the raw data for each bin on the selected pixels. Unless the exact average is requested,
+    a mipmap level of the raw data is used such that the number of selected pixels is at most the configured maximum.
+    Only the rows and columns of the raw data covered by the bounding box of the selection are read.
 
     :param data_source: name of the data source to get the selection average from
-    :param mask: The mask describing the selected pixels
+    :param mask: The mask describing the selected pixels, either over the whole raw data or as a `SelectionMask`
+    :param exact: Whether to compute the average over the selected pixels of the original resolution
     :return: list where the index is the channel number and the value is the average intensity of that channel within
         the selection
     """
@@ -41,42 +209,36 @@ def get_average_selection(data_source: str, mask: np.ndarray) -> list[float]:
 
     max_points: int = int(config["max-spectrum-points"])
 
-    num_points: int = np.count_nonzero(mask)
+    selection: SelectionMask = mask if isinstance(mask, SelectionMask) else SelectionMask.from_array(mask)
+
+    num_points: int = selection.count
     level: int = 0
-    if num_points > 0:
+    if num_points > 0 and not exact:
         level = max(0, ceil(log(num_points / max_points, 4)))
 
     LOG.info("Getting selection at mip level %i", level)
 
-    data: np.ndarray = get_raw_data(data_source, level=level)
-    length: int = data.shape[2]
-    total: np.ndarray = np.zeros(length)
-
-    scaled_mask: np.ndarray = np.empty((ceil(mask.shape[0] / 2 ** level), ceil(mask.shape[1] / 2 ** level)))
-    scaled_mask.fill(False)
-
-    indices: np.ndarray = np.argwhere(mask)
-
-    # function to vectorize to set the map
-    def set_mask(index: np.ndarray):
-        nonlocal scaled_mask
-        scaled_mask[floor(index[0] / 2 ** level), floor(index[1] / 2 ** level)] = True
-
-    if indices.size > 0:
-        np.vectorize(set_mask, signature="(2)->()")(indices)
-
-    indices: np.ndarray = np.argwhere(scaled_mask)
+    bounding_box: tuple[int, int, int, int] | None = selection.box
+    if bounding_box is None:
+        LOG.info("Calculated the average spectrum for the selection.")
+        return []
 
-    # Function to vectorize to calculate the average data
-    def add_row(index: np.ndarray):
-        nonlocal total
-        total += data[index[0], index[1], :]
+    # extend the mask of the bounding box to the blocks of the mipmap level
+    factor: int = 2 ** level
+    top, _, left, _ = bounding_box
+    aligned_top, aligned_left = top - top % factor, left - left % factor
+    aligned_mask: np.ndarray = np.pad(selection.mask, ((top - aligned_top, 0), (left - aligned_left, 0)))
+    scaled_mask: np.ndarray = downscale_mask(aligned_mask, level)
 
-    average: np.ndarray = np.zeros(indices.shape[0])
+    data: np.ndarray = get_raw_data(data_source, level=level)
+    if data.size == 0:
+        LOG.error(f"Could not load the raw data of data source {data_source}")
+        return []
 
-    if indices.size > 0:
-        np.vectorize(add_row, signature="(2)->()")(indices)
-        average: np.ndarray = total / indices.shape[0]
+    total: np.ndarray = sum_selected_spectra(
+        data, scaled_mask, aligned_top // factor, aligned_left // factor, get_chunk_size()
+    )
+    average: np.ndarray = total / np.count_nonzero(scaled_mask)
 
     LOG.info("Calculated the average spectrum for the selection.")
     return average.tolist()
@@ -95,10 +257,7 @@ def get_theoretical_data(element: str, excitation_energy_kev: float, low: int, h
     :return: list with first element being a list of dictionaries representing the spectra points, second being a
         list of dictionaries representing the peaks
     """
-    # remove last character to get periodic table symbol
-    element = element[:len(element) - 1].strip()
-    if element == 'yAl':
-        element = 'Al'
+    element = get_element_symbol(element)
 
     try:
         # get spectrum and peaks
@@ -112,37 +271,61 @@ def get_theoretical_data(element: str, excitation_energy_kev: float, low: int, h
     # get_element_spectrum returns normalized data, rescale to [0, 255]
     y_spectrum: np.ndarray = data[1] * 255
 
-    response: list = []
+    response: list = [rebin_spectrum(y_spectrum, low, high, bin_size).tolist()]
 
-    spectrum: list = []
-    bin_nr = ceil((high - low) / bin_size)
+    # get_element_spectrum returns data in domain [0, 40], rescale to [0, 4096]
+    x_peaks: np.ndarray = data[2] * 4096 / abs(data[0].max() - data[0].min())
 
-    # for each bin
-    for i in range(bin_nr):
-        # compute starting channel
-        start_channel = low + i * bin_size
+    # take only the peaks within the domain [low, high]
+    in_domain: np.ndarray = (low <= x_peaks) & (x_peaks < high)
+    response.append(((x_peaks[in_domain] - low) / bin_size).tolist())
+    return response
 
-        # y_spectra has 10000 points instead of 4096, so scale index and bin size to slice it
-        start_index = floor(start_channel * len(y_spectrum) / 4096)
-        new_bin_size = round(bin_size / (4096 / len(y_spectrum)))
-        mean = np.mean(y_spectrum[start_index:start_index + new_bin_size])
-        spectrum.append(mean)
 
-    response.append(spectrum)
+def get_theoretical_data_batch(
+        elements: list[str], excitation_energy_kev: float, low: int, high: int, bin_size: int
+) -> dict[str, list]:
+    """
+    Get the theoretical spectra and peaks of multiple elements, as computed by `get_theoretical_data`.
+    Precondition: 0 <= low < high < 4096, 0 < bin_size <= 4096, 0 <=excitation_energy_kev <= 40
 
-    # get_element_spectrum returns data in domain [0, 40], rescale to [0, 4096]
-    x_peaks = data[2] * 4096 / abs(data[0].max() - data[0].min())
+    :param elements: names of the elements
+    :param excitation_energy_kev: excitation energy
+    :param low: lower channel boundary
+    :param high: higher channel boundary
+    :param bin_size: size of each bin
+    :return: dictionary with for every element the theoretical spectrum and peaks, an empty list if the spectrum of the
+        element could not be computed
+    """
 
-    # get_element_spectrum returns normalized data, rescale to [0, 255]
-    _ = data[3] * 255
-
-    peaks = []
-    for i in range(len(x_peaks)):
-        # take only the peaks within the domain [low, high]
-        if low <= x_peaks[i] < high:
-            peaks.append((x_peaks[i] - low) / bin_size)
-    response.append(peaks)
-    return response
+    return {element: get_theoretical_data(element, excitation_energy_kev, low, high, bin_size) for element in elements}
+
+
+def rebin_spectrum(y_spectrum: np.ndarray, low: int, high: int, bin_size: int) -> np.ndarray:
+    """
+    Averages a spectrum over the domain [0, 4096] into the bins of the channels in range [low, high].
+
+    :param y_spectrum: y values of the spectrum, evenly spaced over the domain [0, 4096]
+    :param low: lower channel boundary
+    :param high: higher channel boundary
+    :param bin_size: size of each bin
+    :return: array where the index is the bin number and the value is the average of the spectrum in that bin
+    """
+
+    length: int = len(y_spectrum)
+    bin_nr: int = ceil((high - low) / bin_size)
+
+    # compute the starting channel of every bin
+    start_channels: np.ndarray = low + np.arange(bin_nr) * bin_size
+
+    # y_spectrum has more points than channels, so scale the indices and bin size to slice it
+    start_indices: np.ndarray = np.minimum(np.floor(start_channels * length / 4096).astype(int), length)
+    end_indices: np.ndarray = np.minimum(start_indices + round(bin_size / (4096 / length)), length)
+
+    # the sum of every bin from the cumulative sum of the spectrum
+    cumulative: np.ndarray = np.concatenate(([0], np.cumsum(y_spectrum)))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (cumulative[end_indices] - cumulative[start_indices]) / (end_indices - start_indices)
 
 
 # functions to compute theoretical elemental spectrum
@@ -150,49 +333,152 @@ def get_theoretical_data(element: str, excitation_energy_kev: float, low: int, h
 # Author: Frank Ligterink
 
 
-class ElementLines:
-    """Computes fluorescence emission line energies and intensities for `element`.
+# the emission lines of an element, independent of the excitation energy
+ELEMENT_LINE_TABLE_DTYPE: np.dtype = np.dtype([
+    ("energy", np.float64),
+    ("intensity", np.float64),
+    ("edge_energy", np.float64),
+    ("name", "U8"),
+    ("label", "U16")
+])
+
+# the line tables of all elements loaded so far, in format {element: table}
+ELEMENT_LINE_TABLES: dict[str, np.ndarray] = {}
+ELEMENT_LINE_TABLES_LOCK: Lock = Lock()
+
+
+def load_element_line_table(element: str) -> np.ndarray:
+    """Loads all fluorescence emission lines of an element from the xraydb database, together with the properties of
+    the edges they originate from.
+
+    :param element: symbol of the element
+    :return: structured array of type `ELEMENT_LINE_TABLE_DTYPE` with a row for every emission line
     """
 
-    def __init__(self, element, excitation_energy_kev):
-        excitation_energy = 1000 * excitation_energy_kev
+    rows: list[tuple[float, float, float, str, str]] = []
+    for name, line in xraydb.xray_lines(element).items():
+        energy, intensity, initial_level, final_level = line
 
-        lines = xraydb.xray_lines(element, excitation_energy=excitation_energy)
+        # get corresponding edge properties, lines of unknown edges are never excited
+        edge = xraydb.xray_edge(element, initial_level)  # IUPAC notation!  e.g. 'L1', not 'La'
+        if edge is None:
+            continue
+        edge_energy, fluo_yield, jump_ratio = edge
+        jump_coeff = (jump_ratio - 1) / jump_ratio  # see Volker
 
-        peak_names = []
-        peak_labels = []
-        peak_energies = []
-        peak_intensities = []
+        # multiplying edge jump coefficient, intensity and fluorescence yield...
+        rows.append((energy, jump_coeff * intensity * fluo_yield, edge_energy, name,
+                     f'{element}_{initial_level}{final_level}'))
 
-        for name, line in lines.items():
-            peak_names.append(name)
+    return np.array(rows, dtype=ELEMENT_LINE_TABLE_DTYPE)
 
-            # intensities (a.k.a. transition probabilities) sum up to unity within each level
-            energy, intensity, initial_level, final_level = line
-            peak_energies.append(energy)
-            label = f'{element}_{initial_level}{final_level}'
-            peak_labels.append(label)
 
-            # get corresponding edge properties
-            edge = initial_level  # IUPAC notation!  e.g. 'L1', not 'La'
-            _, fluo_yield, jump_ratio = xraydb.xray_edge(
-                element, edge)
-            jump_coeff = (jump_ratio - 1) / jump_ratio  # see Volker
-            # print(f'{name}: {energy}; jump_coeff: {jump_coeff:.03f}; fluo_yield: {fluo_yield}')
+def get_element_line_table(element: str) -> np.ndarray:
+    """Gets the emission line table of an element as loaded by `load_element_line_table`. The table is kept in memory,
+    such that the xraydb database is only queried once per element.
 
-            # multiplying edge jump coefficient, intensity and fluorescence yield...
-            peak_intensity = jump_coeff * intensity * fluo_yield
-            peak_intensities.append(peak_intensity)
+    :param element: symbol of the element
+    :return: read-only structured array of type `ELEMENT_LINE_TABLE_DTYPE` with a row for every emission line
+    """
+
+    table: np.ndarray | None = ELEMENT_LINE_TABLES.get(element)
+    if table is not None:
+        return table
+
+    # the xraydb database is not safe to query from multiple threads at once
+    with ELEMENT_LINE_TABLES_LOCK:
+        table = ELEMENT_LINE_TABLES.get(element)
+        if table is None:
+            table = load_element_line_table(element)
+            table.setflags(write=False)
+            ELEMENT_LINE_TABLES[element] = table
+
+    return table
+
+
+def get_element_symbol(element: str) -> str:
+    """Gets the periodic table symbol of an element name in an elemental data cube, such as "Fe K" or "yAlK".
+
+    :param element: name of the element in the elemental data cube
+    :return: the periodic table symbol of the element
+    """
+
+    # remove last character to get periodic table symbol
+    symbol: str = element[:len(element) - 1].strip()
+    if symbol == 'yAl':
+        symbol = 'Al'
+
+    return symbol
+
+
+def prewarm_element_line_tables() -> int:
+    """Loads the emission line tables of the elements of all data sources, such that theoretical spectra of these
+    elements never have to query the xraydb database. Only enabled if `prewarm-element-lines` is set in the backend
+    config.
+
+    :return: the number of elements of which the line table was loaded
+    """
+
+    config: dict | None = get_config()
+    if config is None or not config.get("prewarm-element-lines", False):
+        return 0
+
+    symbols: set[str] = set()
+    for data_source in get_data_sources_names():
+        symbols.update(get_element_symbol(element) for element in get_element_names(data_source))
+
+    loaded: int = 0
+    for symbol in sorted(symbols):
+        try:
+            get_element_line_table(symbol)
+            loaded += 1
+        except ValueError:
+            # names such as "Continuum" or "chisq" are not elements
+            LOG.debug(f"No emission lines for {symbol}")
+
+    LOG.info(f"Loaded the emission lines of {loaded} elements")
+    return loaded
+
+
+class ElementLines:
+    """Computes fluorescence emission line energies and intensities for `element`.
+    """
+
+    def __init__(self, element, excitation_energy_kev):
+        excitation_energy = 1000 * excitation_energy_kev
+
+        # only the lines of edges below the excitation energy are excited
+        table = get_element_line_table(element)
+        lines = table[table["edge_energy"] < excitation_energy]
 
         # determine sorting according to peak_intensities...
-        self.peak_intensities = np.array(peak_intensities)
+        self.peak_intensities = np.array(lines["intensity"])
         indices = np.argsort(self.peak_intensities)[::-1]
 
         # sort
         self.peak_intensities = self.peak_intensities[indices]
-        self.peak_energies = np.array(peak_energies)[indices] / 1000
-        self.peak_names = np.array(peak_names)[indices]
-        self.peak_labels = np.array(peak_labels)[indices]
+        self.peak_energies = lines["energy"][indices] / 1000
+        self.peak_names = lines["name"][indices]
+        self.peak_labels = lines["label"][indices]
+
+
+@lru_cache(maxsize=ELEMENT_LINES_CACHE_SIZE)
+def get_element_lines(element: str, excitation_energy_kev: float) -> ElementLines:
+    """Get the fluorescence emission lines of an element. The lines are cached, such that they are only selected and
+    sorted once per element and excitation energy.
+
+    :param element: symbol of the element
+    :param excitation_energy_kev: excitation energy
+    :return: the emission lines of the element, the arrays of which are read-only
+    """
+
+    lines: ElementLines = ElementLines(element, excitation_energy_kev)
+
+    # the lines are shared between all callers
+    for array in (lines.peak_intensities, lines.peak_energies, lines.peak_names, lines.peak_labels):
+        array.setflags(write=False)
+
+    return lines
 
 
 def get_element_spectrum(
@@ -209,7 +495,7 @@ def get_element_spectrum(
     :return: x values of the spectrum, y values of the spectrum, peak energies, peak intensities
     """
 
-    el = ElementLines(element, excitation_energy_kev)
+    el = get_element_lines(element, float(excitation_energy_kev))
 
     pe = el.peak_energies
     pi = el.peak_intensities
@@ -240,10 +526,8 @@ def gaussian_convolve(
     if x_kevs is None:
         x_kevs = np.linspace(0, 40, 10000)
 
-    y_spectrum = np.zeros_like(x_kevs)
-
-    for peak_energy, peak_intensity in zip(peak_energies, peak_intensities):
-        y_spectrum += peak_intensity * \
-                      np.exp(-(1 / std) * (x_kevs - peak_energy) ** 2)
+    # the gaussian of every peak at every x value at once, in format {x, peak}
+    gaussians: np.ndarray = np.exp(-(1 / std) * (x_kevs[:, np.newaxis] - peak_energies[np.newaxis, :]) ** 2)
+    y_spectrum: np.ndarray = gaussians @ peak_intensities
 
     return x_kevs, y_spectrum